@@ -0,0 +1,27 @@
+"""generation run budget exhaustion
+
+Revision ID: a9d3e5c7b2f4
+Revises: f2b6d9a4e1c8
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "a9d3e5c7b2f4"
+down_revision: Union[str, None] = "f2b6d9a4e1c8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "generation_run", sa.Column("budget_exhausted", sa.String(length=16), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("generation_run", "budget_exhausted")
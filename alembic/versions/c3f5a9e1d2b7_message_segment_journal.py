@@ -0,0 +1,38 @@
+"""message_segment partial-content journal
+
+Revision ID: c3f5a9e1d2b7
+Revises: b7e8d2a4c1f9
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "c3f5a9e1d2b7"
+down_revision: Union[str, None] = "b7e8d2a4c1f9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "message_segment",
+        sa.Column("id", sa.String(length=36), nullable=False),
+        sa.Column("message_id", sa.String(length=36), nullable=False),
+        sa.Column("seq", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=10), nullable=False),
+        sa.Column("text", sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(["message_id"], ["message.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_message_segment_id"), "message_segment", ["id"], unique=True)
+    op.create_index(op.f("ix_message_segment_message_id"), "message_segment", ["message_id"])
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_message_segment_message_id"), table_name="message_segment")
+    op.drop_index(op.f("ix_message_segment_id"), table_name="message_segment")
+    op.drop_table("message_segment")
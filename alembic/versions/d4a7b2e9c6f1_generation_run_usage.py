@@ -0,0 +1,47 @@
+"""generation_run usage and timings
+
+Revision ID: d4a7b2e9c6f1
+Revises: c3f5a9e1d2b7
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "d4a7b2e9c6f1"
+down_revision: Union[str, None] = "c3f5a9e1d2b7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_COLUMNS = (
+    ("model", sa.String(length=120)),
+    ("prompt_tokens", sa.Integer()),
+    ("completion_tokens", sa.Integer()),
+    ("cached_tokens", sa.Integer()),
+    ("prefill_tokens", sa.Integer()),
+    ("prompt_ms", sa.Float()),
+    ("predicted_ms", sa.Float()),
+    ("ttft_ms", sa.Float()),
+    ("duration_ms", sa.Float()),
+)
+
+
+def upgrade() -> None:
+    for name, type_ in _COLUMNS:
+        op.add_column("generation_run", sa.Column(name, type_, nullable=True))
+    op.create_index(op.f("ix_generation_run_model"), "generation_run", ["model"])
+    op.create_index(
+        op.f("ix_generation_run_creation_date"), "generation_run", ["creation_date"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_generation_run_creation_date"), table_name="generation_run")
+    op.drop_index(op.f("ix_generation_run_model"), table_name="generation_run")
+    # Batch mode: SQLite can only drop columns by rebuilding the table.
+    with op.batch_alter_table("generation_run") as batch:
+        for name, _ in reversed(_COLUMNS):
+            batch.drop_column(name)
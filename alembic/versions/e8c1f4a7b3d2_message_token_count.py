@@ -0,0 +1,25 @@
+"""message token_count
+
+Revision ID: e8c1f4a7b3d2
+Revises: d4a7b2e9c6f1
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "e8c1f4a7b3d2"
+down_revision: Union[str, None] = "d4a7b2e9c6f1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("message", sa.Column("token_count", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("message", "token_count")
@@ -0,0 +1,33 @@
+"""thread rolling summary
+
+Revision ID: f2b6d9a4e1c8
+Revises: e8c1f4a7b3d2
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "f2b6d9a4e1c8"
+down_revision: Union[str, None] = "e8c1f4a7b3d2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("thread", sa.Column("summary", sa.Text(), nullable=True))
+    op.add_column("thread", sa.Column("summary_through", sa.Integer(), nullable=True))
+    op.add_column("thread", sa.Column("summary_tokens", sa.Integer(), nullable=True))
+    op.add_column(
+        "thread", sa.Column("summary_time", sa.TIMESTAMP(timezone=True), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("thread", "summary_time")
+    op.drop_column("thread", "summary_tokens")
+    op.drop_column("thread", "summary_through")
+    op.drop_column("thread", "summary")
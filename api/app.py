@@ -10,9 +10,10 @@ import db
 from crud.vector import get_vector_repository
 from pipelines import embed, inference
 from routes import views
+from services import broker as services_broker
 from services import generation as services_generation
 from shared.pyutils.logs import setup_logging
-from utils import env
+from utils import env, metrics
 
 # Set up logging
 
@@ -78,8 +79,17 @@ async def handle_exception(request, exc):
     return JSONResponse({"error": str(exc)}, status_code=500)
 
 
+# Event loop lag sampling for /api/metrics
+
+app.add_event_handler("startup", metrics.start_loop_lag_monitor)
+app.add_event_handler("shutdown", metrics.stop_loop_lag_monitor)
+
 # DB engine startup side effect
 
+# Shutdown handlers run in registration order: write out whatever partial
+# content running generations still hold before the engine is disposed.
+app.add_event_handler("shutdown", services_generation.close_partial_flusher)
+app.add_event_handler("shutdown", services_broker.close_broker_link)
 app.add_event_handler("shutdown", db.get_session_manager().close)
 
 
@@ -93,11 +103,17 @@ async def _ensure_vector_schema():
 app.add_event_handler("startup", _ensure_vector_schema)
 
 
+# Multi-worker deployments: join (or host) the generation broker first, so
+# the sweep below can spare runs other workers have already claimed.
+
+app.add_event_handler("startup", services_broker.start_broker_link)
+
+
 # Crash recovery: journal rows left "running" by a previous process are dead.
 
 
 async def _sweep_interrupted_generations():
-    await services_generation.sweep_interrupted_runs()
+    await services_broker.sweep_interrupted_generations()
 
 
 app.add_event_handler("startup", _sweep_interrupted_generations)
@@ -108,3 +124,8 @@ app.add_event_handler(
     "startup", inference.get_inference_pipeline(inference.Tier.SMALL).wait_for_startup
 )
 app.add_event_handler("startup", embed.get_embedding_pipeline().wait_for_startup)
+
+# Each pipeline holds one pooled keep-alive client; release the sockets on exit.
+
+app.add_event_handler("shutdown", inference.close_inference_pipelines)
+app.add_event_handler("shutdown", embed.close_embedding_pipeline)
@@ -18,6 +18,8 @@ from .file import (
 from .generation import (
     create_generation_run,
     finish_generation_run,
+    get_generation_usage,
+    get_last_generation_run_start,
     get_running_generation_runs,
     get_running_run_for_thread,
     get_running_run_thread_ids,
@@ -53,6 +55,7 @@ from .user import (
     get_local_conn_by_id,
     get_local_conn_by_user_id,
     get_user_by_id,
+    get_user_privilege_level,
 )
 
 __all__ = [
@@ -69,6 +72,8 @@ __all__ = [
     "finish_generation_run",
     "get_all_user_threads",
     "get_file_for_user",
+    "get_generation_usage",
+    "get_last_generation_run_start",
     "get_last_message_in_thread",
     "get_last_message_order_in_thread",
     "get_local_conn_by_email",
@@ -89,6 +94,7 @@ __all__ = [
     "get_refresh_token",
     "get_refresh_token_by_hash",
     "get_user_by_id",
+    "get_user_privilege_level",
     "link_file_to_project",
     "link_file_to_thread",
     "list_user_files",
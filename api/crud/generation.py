@@ -1,26 +1,95 @@
-from sqlalchemy import select
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Literal
+
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from models import GenerationRunRow
 from utils import timing
 
+UsageBucket = Literal["hour", "day"]
+
+_SQLITE_BUCKET_FORMATS = {"hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00"}
+
 
 async def create_generation_run(
-    session: AsyncSession, thread_id: str, user_id: str
+    session: AsyncSession, thread_id: str, user_id: str, model: str | None = None
 ) -> GenerationRunRow:
-    row = GenerationRunRow(thread_id=thread_id, user_id=user_id, status="running")
+    row = GenerationRunRow(thread_id=thread_id, user_id=user_id, status="running", model=model)
     session.add(row)
     return row
 
 
 async def finish_generation_run(
-    session: AsyncSession, run: GenerationRunRow, status: str
+    session: AsyncSession,
+    run: GenerationRunRow,
+    status: str,
+    usage: Mapping[str, int | float | str | None] | None = None,
 ) -> None:
+    """`usage` maps usage/timing (and budget) column names to their values."""
     run.status = status
     run.update_time = timing.get_utc_now()
+    for column, value in (usage or {}).items():
+        setattr(run, column, value)
     session.add(run)
 
 
+async def get_generation_usage(
+    session: AsyncSession,
+    since: datetime,
+    until: datetime,
+    bucket: UsageBucket,
+    user_id: str | None = None,
+    model: str | None = None,
+):
+    """Usage sums per (time bucket, user, model) for runs created in [since, until).
+
+    The bucket column is a datetime on PostgreSQL and an ISO string on SQLite.
+    """
+    if session.bind.dialect.name == "sqlite":
+        period = func.strftime(_SQLITE_BUCKET_FORMATS[bucket], GenerationRunRow.creation_date)
+    else:
+        period = func.date_trunc(bucket, GenerationRunRow.creation_date)
+    period = period.label("period")
+    query = (
+        select(
+            period,
+            GenerationRunRow.user_id,
+            GenerationRunRow.model,
+            func.count(GenerationRunRow.id).label("runs"),
+            func.sum(GenerationRunRow.prompt_tokens).label("prompt_tokens"),
+            func.sum(GenerationRunRow.completion_tokens).label("completion_tokens"),
+            func.sum(GenerationRunRow.cached_tokens).label("cached_tokens"),
+            func.sum(GenerationRunRow.prefill_tokens).label("prefill_tokens"),
+            func.sum(GenerationRunRow.prompt_ms).label("prompt_ms"),
+            func.sum(GenerationRunRow.predicted_ms).label("predicted_ms"),
+            func.avg(GenerationRunRow.ttft_ms).label("avg_ttft_ms"),
+            func.max(GenerationRunRow.ttft_ms).label("max_ttft_ms"),
+            func.avg(GenerationRunRow.duration_ms).label("avg_duration_ms"),
+        )
+        .where(GenerationRunRow.creation_date >= since, GenerationRunRow.creation_date < until)
+        .group_by(period, GenerationRunRow.user_id, GenerationRunRow.model)
+        .order_by(period, GenerationRunRow.user_id, GenerationRunRow.model)
+    )
+    if user_id is not None:
+        query = query.where(GenerationRunRow.user_id == user_id)
+    if model is not None:
+        query = query.where(GenerationRunRow.model == model)
+    result = await session.execute(query)
+    return result.all()
+
+
+async def get_last_generation_run_start(
+    session: AsyncSession, thread_id: str
+) -> datetime | None:
+    return await session.scalar(
+        select(func.max(GenerationRunRow.creation_date)).where(
+            GenerationRunRow.thread_id == thread_id
+        )
+    )
+
+
 async def get_running_generation_runs(session: AsyncSession) -> list[GenerationRunRow]:
     result = await session.execute(
         select(GenerationRunRow).where(GenerationRunRow.status == "running")
@@ -54,8 +123,11 @@ def mark_interrupted(run: GenerationRunRow) -> None:
 
 
 __all__ = [
+    "UsageBucket",
     "create_generation_run",
     "finish_generation_run",
+    "get_generation_usage",
+    "get_last_generation_run_start",
     "get_running_generation_runs",
     "get_running_run_for_thread",
     "get_running_run_thread_ids",
@@ -4,7 +4,7 @@ from hashlib import sha256
 from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models import Message
+from models import Message, MessageSegment
 from utils import hashing
 
 
@@ -50,14 +50,91 @@ async def reserve_assistant_message(
 
 
 async def update_message_content(
-    session: AsyncSession, message: Message, content: str, thinking: str | None
+    session: AsyncSession,
+    message: Message,
+    content: str,
+    thinking: str | None,
+    content_hash: str | None = None,
+    token_count: int | None = None,
 ) -> None:
+    """Overwrite a message's text; `content_hash` skips re-hashing when the
+    caller already tracks the digest incrementally. Without `token_count` the
+    stored count is cleared, since it no longer matches the text."""
     message.inline_value = content
     message.thinking_value = thinking
-    message.hash = sha256(content.encode("utf-8")).hexdigest()
+    message.hash = content_hash or sha256(content.encode("utf-8")).hexdigest()
+    message.token_count = token_count
     session.add(message)
 
 
+async def append_message_segments(
+    session: AsyncSession, message_id: str, start_seq: int, segments: Sequence[tuple[str, str]]
+) -> int:
+    """Journal (kind, text) deltas for an in-flight message; returns the next seq."""
+    seq = start_seq
+    for kind, text in segments:
+        session.add(MessageSegment(message_id=message_id, seq=seq, kind=kind, text=text))
+        seq += 1
+    return seq
+
+
+async def get_segment_texts(
+    session: AsyncSession, message_ids: Sequence[str]
+) -> dict[str, tuple[str, str]]:
+    """Journaled (content, thinking) tails per message, joined in seq order."""
+    if not message_ids:
+        return {}
+    result = await session.execute(
+        select(MessageSegment.message_id, MessageSegment.kind, MessageSegment.text)
+        .where(MessageSegment.message_id.in_(message_ids))
+        .order_by(MessageSegment.message_id, MessageSegment.seq)
+    )
+    parts: dict[str, tuple[list[str], list[str]]] = {}
+    for message_id, kind, text in result.all():
+        content, thinking = parts.setdefault(message_id, ([], []))
+        (thinking if kind == "thinking" else content).append(text)
+    return {
+        message_id: ("".join(content), "".join(thinking))
+        for message_id, (content, thinking) in parts.items()
+    }
+
+
+async def delete_message_segments(session: AsyncSession, message_id: str) -> None:
+    await session.execute(delete(MessageSegment).where(MessageSegment.message_id == message_id))
+
+
+async def compact_message_segments(session: AsyncSession, thread_ids: Sequence[str]) -> int:
+    """Fold journaled segments of the threads' messages into the message rows.
+
+    Crash recovery: the text appended since the last compaction lives only in
+    segments. Returns the number of messages rebuilt.
+    """
+    if not thread_ids:
+        return 0
+    messages = (
+        await session.scalars(
+            select(Message)
+            .join(MessageSegment, MessageSegment.message_id == Message.id)
+            .where(Message.thread_id.in_(thread_ids))
+            .distinct()
+        )
+    ).all()
+    texts = await get_segment_texts(session, [message.id for message in messages])
+    for message in messages:
+        content, thinking = texts[message.id]
+        await update_message_content(
+            session,
+            message,
+            (message.inline_value or "") + content,
+            ((message.thinking_value or "") + thinking) or None,
+        )
+        await delete_message_segments(session, message.id)
+    # Flush now: a following bulk DELETE on NULL-content rows must already see
+    # the rebuilt text.
+    await session.flush()
+    return len(messages)
+
+
 async def get_last_message_in_thread(
     session: AsyncSession, thread_id: str, user_id: str
 ) -> Message | None:
@@ -120,12 +197,16 @@ async def delete_unwritten_assistant_rows(
 
 
 __all__ = [
+    "append_message_segments",
+    "compact_message_segments",
     "create_message",
+    "delete_message_segments",
     "delete_unwritten_assistant_rows",
     "get_last_message_in_thread",
     "get_last_message_order_in_thread",
     "get_message_by_id",
     "get_messages_in_thread",
+    "get_segment_texts",
     "reserve_assistant_message",
     "update_message_content",
 ]
@@ -1,7 +1,7 @@
-from sqlalchemy import select
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models import LocalConnection, User
+from models import LocalConnection, Role, RoleHasUser, User
 from utils import hashing
 
 #
@@ -73,6 +73,16 @@ async def get_local_conn_by_user_id(
     return conn.scalars().first()
 
 
+async def get_user_privilege_level(session: AsyncSession, user_id: str) -> int:
+    """Highest privilege level among the user's roles; 0 without any role."""
+    level = await session.execute(
+        select(func.max(Role.privilege_level))
+        .join(RoleHasUser, RoleHasUser.role_id == Role.id)
+        .where(RoleHasUser.user_id == user_id)
+    )
+    return level.scalar_one_or_none() or 0
+
+
 # async def get_telegram_conn_by_id(
 #     session: AsyncSession, conn_id: str
 # ) -> TelegramConnection | None:
@@ -99,4 +109,5 @@ __all__ = [
     # "get_telegram_conn_by_id",
     # "get_telegram_conn_id_by_telegram_id",
     "get_user_by_id",
+    "get_user_privilege_level",
 ]
@@ -1,4 +1,5 @@
 import logging
+import time
 from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
 
@@ -10,11 +11,60 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine,
 )
 
-from utils import env
+from utils import env, metrics
 
 Logger = logging.getLogger(__name__)
 Logger.setLevel(logging.INFO)
 
+SESSION_SECONDS = metrics.histogram(
+    "clyre_db_session_seconds",
+    "Lifetime of request-scoped database sessions",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0, 30.0),
+)
+
+# Write statements include the time spent waiting for the database's write
+# lock (SQLite's busy handler, Postgres row locks), so their latency is where
+# write contention shows.
+STATEMENT_SECONDS = metrics.histogram(
+    "clyre_db_statement_seconds",
+    "Database statement execution, lock waits included, by statement kind",
+    ("kind",),
+)
+LOCK_ERRORS = metrics.counter(
+    "clyre_db_lock_errors_total", "Statements that failed on a held database lock"
+)
+
+_STATEMENT_KINDS = ("select", "insert", "update", "delete")
+_LOCK_MARKERS = ("database is locked", "database table is locked", "lock timeout", "deadlock")
+
+
+def _statement_kind(statement: str) -> str:
+    kind = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ""
+    return kind if kind in _STATEMENT_KINDS else "other"
+
+
+def register_statement_timing(engine: AsyncEngine) -> None:
+    # Engine events fire on the event loop thread (the async driver awaits the
+    # cursor from a greenlet), so the histograms need no locking.
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, _cursor, _statement, _parameters, _context, _executemany):
+        conn.info["clyre_statement_started"] = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, _cursor, statement, _parameters, _context, _executemany):
+        started = conn.info.pop("clyre_statement_started", None)
+        if started is not None:
+            STATEMENT_SECONDS.labels(_statement_kind(statement)).observe(
+                time.perf_counter() - started
+            )
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def _error(context):
+        if context.connection is not None:
+            context.connection.info.pop("clyre_statement_started", None)
+        if any(marker in str(context.original_exception).lower() for marker in _LOCK_MARKERS):
+            LOCK_ERRORS.inc()
+
 
 def register_sqlite_vec(engine: AsyncEngine) -> None:
     import sqlite_vec
@@ -48,6 +98,7 @@ class AsyncSessionManager:
         # is safe even when DB_ENGINE is left at its default.
         if self._engine.dialect.name == "sqlite":
             register_sqlite_vec(self._engine)
+        register_statement_timing(self._engine)
 
         self._session_maker: async_sessionmaker[AsyncSession] = async_sessionmaker(
             bind=self._engine,
@@ -98,5 +149,6 @@ def get_session_manager() -> AsyncSessionManager:
 async def get_db_session() -> AsyncIterator[AsyncSession]:
     sm = get_session_manager()
     Logger.debug("Creating database session for request")
-    async with sm.async_session_maker() as session:
-        yield session
+    with SESSION_SECONDS.time():
+        async with sm.async_session_maker() as session:
+            yield session
@@ -16,6 +16,16 @@ from utils import env, fields
 
 
 def main():
+    if env.API_WORKERS > 1:
+        # Worker processes import the app themselves.
+        uvicorn.run(
+            "app:app",
+            host=env.HOST,
+            port=env.PORT,
+            workers=env.API_WORKERS,
+            log_config=fields.UVICORN_LOGGING_CONFIG,
+        )
+        return
     uvicorn.run(
         app,
         host=env.HOST,
@@ -1,7 +1,7 @@
 from .base import Base
 from .file import ChunkVector, FileHasProject, FileHasThread, FileMetadata
 from .generation import GenerationRunRow
-from .message import Message
+from .message import Message, MessageSegment
 from .project import Project
 from .refresh_token import RefreshToken
 from .role import Role, RoleHasUser
@@ -18,6 +18,7 @@ __all__ = [
     "GenerationRunRow",
     "LocalConnection",
     "Message",
+    "MessageSegment",
     "Project",
     "RefreshToken",
     "Role",
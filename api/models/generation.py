@@ -1,4 +1,4 @@
-from sqlalchemy import TIMESTAMP, ForeignKey, SmallInteger, String
+from sqlalchemy import TIMESTAMP, Float, ForeignKey, Integer, SmallInteger, String
 from sqlalchemy.orm import mapped_column
 
 from models import Base
@@ -10,6 +10,11 @@ class GenerationRunRow(Base):
 
     `side_effects` is reserved for the tool era: once a W/RW effect has been
     recorded for a run, retrying it from scratch is forbidden (see PLAN.md 2.7).
+
+    The usage columns come from llama-server's `usage`/`timings` blocks and
+    stay NULL when the stream ended before the server reported them.
+    `budget_exhausted` names the generation budget the run ran out of
+    ("reasoning" or "length"); NULL when it stayed within both.
     """
 
     __tablename__ = "generation_run"
@@ -25,9 +30,20 @@ class GenerationRunRow(Base):
     status = mapped_column(String(20), nullable=False, default="running", index=True)
     side_effects = mapped_column(SmallInteger, nullable=False, default=0)
     creation_date = mapped_column(
-        TIMESTAMP(timezone=True), nullable=False, default=timing.get_utc_now
+        TIMESTAMP(timezone=True), nullable=False, default=timing.get_utc_now, index=True
     )
     update_time = mapped_column(TIMESTAMP(timezone=True), nullable=True)
 
+    model = mapped_column(String(120), nullable=True, index=True)
+    prompt_tokens = mapped_column(Integer, nullable=True)
+    completion_tokens = mapped_column(Integer, nullable=True)
+    cached_tokens = mapped_column(Integer, nullable=True)
+    prefill_tokens = mapped_column(Integer, nullable=True)
+    prompt_ms = mapped_column(Float, nullable=True)
+    predicted_ms = mapped_column(Float, nullable=True)
+    ttft_ms = mapped_column(Float, nullable=True)
+    duration_ms = mapped_column(Float, nullable=True)
+    budget_exhausted = mapped_column(String(16), nullable=True)
+
 
 __all__ = ["GenerationRunRow"]
@@ -16,9 +16,34 @@ class Message(Base):
     thread_id = mapped_column(String(36), ForeignKey("thread.id"), nullable=False, index=True)
 
     order = mapped_column("order", Integer, nullable=False, quote=True)
+    # Tokens of `inline_value` as the chat model tokenizes it; NULL until
+    # counted (legacy rows, or a count that failed), and reset on rewrite.
+    token_count = mapped_column(Integer, nullable=True)
 
     user = relationship("User", back_populates="messages")
     thread = relationship("Thread", back_populates="messages")
+    segments = relationship(
+        "MessageSegment", cascade="all, delete-orphan", passive_deletes=True
+    )
 
 
-__all__ = ["Message"]
+class MessageSegment(Base):
+    """Append-only delta of an in-flight assistant message.
+
+    Partial flushes add one row per changed field instead of rewriting the
+    whole message; the run's finalizer (or the startup sweep after a crash)
+    folds the segments back into `Message` in `seq` order and deletes them.
+    """
+
+    __tablename__ = "message_segment"
+
+    message_id = mapped_column(
+        String(36), ForeignKey("message.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    seq = mapped_column(Integer, nullable=False)
+    # "content" -> inline_value, "thinking" -> thinking_value
+    kind = mapped_column(String(10), nullable=False)
+    text = mapped_column(Text, nullable=False)
+
+
+__all__ = ["Message", "MessageSegment"]
@@ -1,4 +1,4 @@
-from sqlalchemy import TIMESTAMP, Date, ForeignKey, SmallInteger, String, func
+from sqlalchemy import TIMESTAMP, Date, ForeignKey, Integer, SmallInteger, String, Text, func
 from sqlalchemy.orm import mapped_column, relationship
 
 from models import Base
@@ -15,6 +15,14 @@ class Thread(Base):
     creation_date = mapped_column(Date, nullable=False, server_default=func.current_date())
     update_time = mapped_column(TIMESTAMP(timezone=True), nullable=True)
 
+    # Rolling summary of the oldest turns (PLAN 2.4). It covers every message
+    # up to and including `summary_through` (a message order); later turns
+    # are sent verbatim.
+    summary = mapped_column(Text, nullable=True)
+    summary_through = mapped_column(Integer, nullable=True)
+    summary_tokens = mapped_column(Integer, nullable=True)
+    summary_time = mapped_column(TIMESTAMP(timezone=True), nullable=True)
+
     user = relationship("User", back_populates="threads")
     project = relationship("Project", back_populates="threads")
 
@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import time
+import weakref
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from enum import Enum
+
+import httpx
+
+from pipelines.replicas import is_replica_failure
+from utils import env, metrics
+
+Logger = logging.getLogger(__name__)
+Logger.setLevel(logging.INFO)
+
+# Open period before the first /health probe; doubles while probes keep
+# failing, up to the max. Patchable in tests.
+OPEN_SECONDS = 5.0
+MAX_OPEN_SECONDS = 60.0
+
+BreakerProbe = Callable[[], Awaitable[bool]]
+
+
+class BreakerState(str, Enum):
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+
+class BackendUnavailable(ConnectionError):
+    """Raised at once, without a request, while a backend's circuit is open.
+
+    `retry_after` is the time in seconds until the next recovery probe.
+    """
+
+    def __init__(self, backend: str, retry_after: float):
+        super().__init__(f"{backend} backend is unavailable (retry in {retry_after:.1f}s)")
+        self.backend = backend
+        self.retry_after = retry_after
+
+
+def is_backend_failure(exc: BaseException) -> bool:
+    """Errors that count against a backend: it is down, erroring or hung."""
+    return is_replica_failure(exc) or isinstance(exc, httpx.TimeoutException)
+
+
+class _Call:
+    __slots__ = ("started", "responded_at")
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.responded_at: float | None = None
+
+    def responded(self) -> None:
+        """Mark the first byte of the answer; a stream's latency ends here."""
+        if self.responded_at is None:
+            self.responded_at = time.monotonic()
+
+
+class CircuitBreaker:
+    """Fail-fast guard over one backend (a tier's or the embedding servers).
+
+    The outcomes of the last BREAKER_WINDOW calls are kept; a call counts as
+    failed when it raised a backend failure or took longer than
+    BREAKER_SLOW_SECONDS to respond. Once at least BREAKER_MIN_CALLS are in
+    the window and the failed share reaches BREAKER_FAILURE_RATE the circuit
+    opens: calls raise BackendUnavailable without touching the network.
+    After the open period the breaker goes half-open and probes /health
+    (never user traffic); a healthy answer closes it, anything else reopens
+    it for twice as long. BREAKER_FAILURE_RATE=0 disables the breaker.
+    """
+
+    def __init__(self, name: str, probe: BreakerProbe):
+        self.name = name
+        self._probe = probe
+        self._window: deque[bool] = deque(maxlen=max(env.BREAKER_WINDOW, 1))
+        self._state = BreakerState.CLOSED
+        self._open_seconds = OPEN_SECONDS
+        self._retry_at = 0.0
+        self._opened = 0
+        self._rejected = 0
+        self._probe_task: asyncio.Task | None = None
+        _breakers.add(self)
+
+    @property
+    def state(self) -> BreakerState:
+        return self._state
+
+    def check(self) -> None:
+        """Raise BackendUnavailable while the circuit is not closed."""
+        if self._state is BreakerState.CLOSED:
+            return
+        self._rejected += 1
+        REJECTED.labels(self.name).inc()
+        raise BackendUnavailable(self.name, max(self._retry_at - time.monotonic(), 0.0))
+
+    @asynccontextmanager
+    async def call(self, slow_seconds: float | None = None) -> AsyncIterator[_Call]:
+        """Guard one request; call `responded()` on the yielded handle when a
+        streamed answer starts (plain requests end at the block's exit).
+
+        `slow_seconds` replaces BREAKER_SLOW_SECONDS for a request expected
+        to take longer, such as a long prompt's prefill. Cancellation and
+        errors that are not backend failures (a 4xx, a bad payload) leave the
+        window untouched.
+        """
+        self.check()
+        call = _Call()
+        try:
+            yield call
+        except Exception as exc:
+            if is_backend_failure(exc):
+                self._record(False)
+            raise
+        call.responded()
+        latency = call.responded_at - call.started  # type: ignore[operator]
+        limit = env.BREAKER_SLOW_SECONDS if slow_seconds is None else slow_seconds
+        self._record(latency <= limit)
+
+    def _record(self, ok: bool) -> None:
+        if self._state is not BreakerState.CLOSED or env.BREAKER_FAILURE_RATE <= 0:
+            return
+        self._window.append(ok)
+        if len(self._window) < env.BREAKER_MIN_CALLS:
+            return
+        failed = self._window.count(False) / len(self._window)
+        if failed >= env.BREAKER_FAILURE_RATE:
+            self._open(f"{failed:.0%} of the last {len(self._window)} calls failed")
+
+    def _open(self, reason: str) -> None:
+        self._state = BreakerState.OPEN
+        self._opened += 1
+        self._retry_at = time.monotonic() + self._open_seconds
+        OPENED.labels(self.name).inc()
+        Logger.warning(
+            "Circuit for %s opened for %.1fs: %s", self.name, self._open_seconds, reason
+        )
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.create_task(self._recover())
+
+    async def _recover(self) -> None:
+        while True:
+            await asyncio.sleep(max(self._retry_at - time.monotonic(), 0.0))
+            self._state = BreakerState.HALF_OPEN
+            try:
+                ok = await self._probe()
+            except Exception:
+                ok = False
+            if ok:
+                self._state = BreakerState.CLOSED
+                self._window.clear()
+                self._open_seconds = OPEN_SECONDS
+                Logger.info("Circuit for %s closed: /health answered", self.name)
+                return
+            self._open_seconds = min(self._open_seconds * 2, MAX_OPEN_SECONDS)
+            self._state = BreakerState.OPEN
+            self._retry_at = time.monotonic() + self._open_seconds
+            Logger.warning(
+                "Circuit for %s stays open for %.1fs: /health failed",
+                self.name,
+                self._open_seconds,
+            )
+
+    async def aclose(self) -> None:
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "state": self._state.value,
+            "calls": len(self._window),
+            "failure_rate": (
+                self._window.count(False) / len(self._window) if self._window else 0.0
+            ),
+            "retry_after": (
+                max(self._retry_at - time.monotonic(), 0.0)
+                if self._state is not BreakerState.CLOSED
+                else 0.0
+            ),
+            "opened": self._opened,
+            "rejected": self._rejected,
+        }
+
+
+# Every live breaker, for the state gauge and the health endpoint.
+_breakers: "weakref.WeakSet[CircuitBreaker]" = weakref.WeakSet()
+
+_STATE_VALUES = {BreakerState.CLOSED: 0, BreakerState.HALF_OPEN: 1, BreakerState.OPEN: 2}
+
+
+def breaker_stats() -> dict[str, dict[str, object]]:
+    return {breaker.name: breaker.stats() for breaker in list(_breakers)}
+
+
+metrics.gauge(
+    "clyre_backend_circuit_state",
+    "Circuit breaker state per backend: 0 closed, 1 half-open, 2 open",
+    ("backend",),
+    callback=lambda: {
+        (breaker.name,): _STATE_VALUES[breaker.state] for breaker in list(_breakers)
+    },
+)
+OPENED = metrics.counter(
+    "clyre_backend_circuit_opened_total", "Times a backend's circuit opened", ("backend",)
+)
+REJECTED = metrics.counter(
+    "clyre_backend_circuit_rejected_total",
+    "Calls failed fast while a backend's circuit was open",
+    ("backend",),
+)
+
+
+__all__ = [
+    "BackendUnavailable",
+    "BreakerState",
+    "CircuitBreaker",
+    "breaker_stats",
+    "is_backend_failure",
+]
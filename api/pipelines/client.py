@@ -0,0 +1,194 @@
+import logging
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+
+from utils import env
+
+Logger = logging.getLogger(__name__)
+Logger.setLevel(logging.INFO)
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    """Connection-pool shape of one pipeline's long-lived HTTP client.
+
+    `read_timeout` is the default per-request budget; callers with a different
+    budget (e.g. non-streaming completions) pass their own read value.
+    """
+
+    max_connections: int = 32
+    max_keepalive_connections: int = 16
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 10.0
+    read_timeout: float = 60.0
+
+    @classmethod
+    def from_env(cls) -> "PoolConfig":
+        return cls(
+            max_connections=env.INFERENCE_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=env.INFERENCE_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=env.INFERENCE_POOL_KEEPALIVE_EXPIRY,
+            connect_timeout=env.INFERENCE_CONNECT_TIMEOUT,
+            read_timeout=env.INFERENCE_READ_TIMEOUT,
+        )
+
+
+@dataclass(frozen=True)
+class PoolStats:
+    in_use: int
+    idle: int
+    connects: int
+    requests: int
+
+
+@dataclass
+class _PoolCounters:
+    # Lifetime counters: they survive a close/reopen of the client.
+    in_use: int = 0
+    connects: int = 0
+    requests: int = 0
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    def __init__(self, inner: httpx.AsyncByteStream, release):
+        self._inner = inner
+        self._release = release
+        self._released = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._inner:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._inner.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+class _CountingTransport(httpx.AsyncBaseTransport):
+    """Counts in-flight responses and TCP connects around the real transport.
+
+    A response stays "in use" until its body is closed, which for a streamed
+    completion is the end of the generation — not the arrival of headers.
+    Connects are observed through httpcore's public `trace` extension, so an
+    injected test transport simply reports zero.
+    """
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, counters: _PoolCounters):
+        self.inner = inner
+        self._counters = counters
+
+    async def _trace(self, event_name: str, info: dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self._counters.connects += 1
+
+    def _release(self) -> None:
+        self._counters.in_use -= 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions.setdefault("trace", self._trace)
+        self._counters.requests += 1
+        self._counters.in_use += 1
+        try:
+            response = await self.inner.handle_async_request(request)
+        except BaseException:
+            self._release()
+            raise
+        assert isinstance(response.stream, httpx.AsyncByteStream)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_TrackedStream(response.stream, self._release),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+class PooledClient:
+    """One keep-alive `httpx.AsyncClient` owned by a pipeline instance.
+
+    Opened lazily on first use (in practice by `wait_for_startup` at boot) and
+    closed from the app shutdown handler. An injected transport (tests) is
+    wrapped as-is; otherwise a pooled `AsyncHTTPTransport` is built from the
+    config limits.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport | None = None,
+        config: PoolConfig | None = None,
+    ):
+        self._config = config or PoolConfig.from_env()
+        self._injected = transport
+        self._counters = _PoolCounters()
+        self._transport: _CountingTransport | None = None
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def config(self) -> PoolConfig:
+        return self._config
+
+    def timeout(self, read: float | None = None) -> httpx.Timeout:
+        read = self._config.read_timeout if read is None else read
+        return httpx.Timeout(read, connect=self._config.connect_timeout)
+
+    def stream_timeout(self) -> httpx.Timeout:
+        """Connect limit only; a watched stream bounds its own reads."""
+        return httpx.Timeout(None, connect=self._config.connect_timeout)
+
+    def open(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            inner = self._injected or httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=self._config.max_connections,
+                    max_keepalive_connections=self._config.max_keepalive_connections,
+                    keepalive_expiry=self._config.keepalive_expiry,
+                )
+            )
+            self._transport = _CountingTransport(inner, self._counters)
+            self._client = httpx.AsyncClient(transport=self._transport, timeout=self.timeout())
+        return self._client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self.open()
+
+    async def check_health(self, base_url: str, timeout: float = 10.0) -> bool:
+        """True when `base_url`/health answers 2xx (llama-server: model loaded)."""
+        try:
+            response = await self.client.get(
+                f"{base_url}/health", timeout=self.timeout(timeout)
+            )
+            response.raise_for_status()
+            return True
+        except (httpx.HTTPStatusError, httpx.ConnectError, httpx.TimeoutException):
+            return False
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    def stats(self) -> PoolStats:
+        # httpx exposes no public pool handle; the httpcore pool behind the
+        # default transport does list its connections.
+        pool = None if self._client is None else getattr(self._transport, "inner", None)
+        pool = getattr(pool, "_pool", None)
+        idle = sum(1 for conn in getattr(pool, "connections", ()) if conn.is_idle())
+        return PoolStats(
+            in_use=self._counters.in_use,
+            idle=idle,
+            connects=self._counters.connects,
+            requests=self._counters.requests,
+        )
+
+
+__all__ = ["PoolConfig", "PoolStats", "PooledClient"]
@@ -1,10 +1,15 @@
 import asyncio
 import logging
 import math
+from collections.abc import Callable
+from typing import Any
 
 import httpx
 
-from utils import env
+from pipelines.breaker import CircuitBreaker
+from pipelines.client import PoolConfig, PooledClient, PoolStats
+from pipelines.replicas import ReplicaPool, split_urls
+from utils import env, metrics
 
 Logger = logging.getLogger(__name__)
 Logger.setLevel(logging.INFO)
@@ -13,6 +18,19 @@ DEFAULT_EMBEDDING_MODEL = "Qwen3-Embedding-0.6B"
 STARTUP_RETRIES = 60
 STARTUP_RETRY_DELAY = 5.0
 
+# Texts per /v1/embeddings request. Larger inputs are split into batches that
+# fan out across the embedding replicas concurrently.
+EMBED_BATCH_SIZE = 64
+
+BATCH_SECONDS = metrics.histogram(
+    "clyre_embedding_batch_seconds", "Round trip of one /v1/embeddings batch"
+)
+COALESCED_TEXTS = metrics.histogram(
+    "clyre_embedding_coalesced_texts",
+    "Single-text embeddings sent together in one coalesced batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+
 
 def _normalize(vector: list[float]) -> list[float]:
     norm = math.sqrt(sum(x * x for x in vector))
@@ -41,39 +59,146 @@ def _postprocess(vectors: list[list[float]]) -> list[list[float]]:
 
 class EmbeddingPipeline:
     def __init__(
-        self, base_url: str, model: str, transport: httpx.AsyncBaseTransport | None = None
+        self,
+        base_url: str,
+        model: str,
+        transport: httpx.AsyncBaseTransport | None = None,
+        pool: PoolConfig | None = None,
     ):
-        self._base_url = base_url.rstrip("/")
         self._model = model
-        self._transport = transport
+        self._http = PooledClient(transport, pool)
+        self._replicas = ReplicaPool(split_urls(base_url), self._http.check_health)
+        self._breaker = CircuitBreaker("embedding", self._probe_health)
+        # embed_one texts waiting for the coalescing window, and the batches
+        # in flight for them.
+        self._pending: list[tuple[str, asyncio.Future[list[float]]]] = []
+        self._flush_timer: asyncio.TimerHandle | None = None
+        self._coalesced: set[asyncio.Task] = set()
+
+    @property
+    def base_url(self) -> str:
+        return ",".join(replica.url for replica in self._replicas.replicas)
+
+    def pool_stats(self) -> PoolStats:
+        return self._http.stats()
+
+    def replica_stats(self) -> list[dict[str, object]]:
+        return self._replicas.stats()
+
+    def breaker_stats(self) -> dict[str, object]:
+        return self._breaker.stats()
+
+    async def _probe_health(self) -> bool:
+        for replica in self._replicas.replicas:
+            if await self._http.check_health(replica.url, timeout=5.0):
+                return True
+        return False
+
+    async def aclose(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        for _, waiter in self._pending:
+            waiter.cancel()
+        self._pending = []
+        for task in list(self._coalesced):
+            task.cancel()
+        await asyncio.gather(*self._coalesced, return_exceptions=True)
+        await self._breaker.aclose()
+        await self._replicas.aclose()
+        await self._http.aclose()
+
+    async def _embed_batch(self, texts: list[str]) -> list[list[float]]:
+        payload = {"model": self._model, "input": texts}
+        with BATCH_SECONDS.time():
+            async with self._breaker.call(), self._replicas.lease() as replica:
+                response = await self._http.client.post(
+                    f"{replica.url}/v1/embeddings", json=payload
+                )
+                response.raise_for_status()
+        return _postprocess(_extract_embeddings(response.json()))
 
     async def embed(self, texts: list[str]) -> list[list[float]]:
         if not texts:
             return []
-        payload = {"model": self._model, "input": texts}
-        async with httpx.AsyncClient(timeout=60.0, transport=self._transport) as client:
-            response = await client.post(f"{self._base_url}/v1/embeddings", json=payload)
-            response.raise_for_status()
-            return _postprocess(_extract_embeddings(response.json()))
+        # One fast failure rather than one per batch.
+        self._breaker.check()
+        batches = [
+            texts[start : start + EMBED_BATCH_SIZE]
+            for start in range(0, len(texts), EMBED_BATCH_SIZE)
+        ]
+        results = await asyncio.gather(*(self._embed_batch(batch) for batch in batches))
+        return [vector for batch in results for vector in batch]
 
     async def embed_one(self, text: str) -> list[float]:
-        return (await self.embed([text]))[0]
+        """Embed one text, sharing a request with other embed_one calls.
+
+        Texts requested within EMBED_COALESCE_MS of the first one (or until
+        EMBED_BATCH_SIZE of them wait) go out as one batch, and each caller
+        gets its own vector back. A failed batch fails all of its callers.
+        """
+        window = env.EMBED_COALESCE_MS / 1000
+        if window <= 0:
+            return (await self.embed([text]))[0]
+        self._breaker.check()
+        loop = asyncio.get_running_loop()
+        waiter: asyncio.Future[list[float]] = loop.create_future()
+        self._pending.append((text, waiter))
+        if len(self._pending) >= EMBED_BATCH_SIZE:
+            self._flush_pending()
+        elif self._flush_timer is None:
+            self._flush_timer = loop.call_later(window, self._flush_pending)
+        return await waiter
+
+    def _flush_pending(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        batch, self._pending = self._pending, []
+        # Callers cancelled while waiting (a dropped search) need no vector.
+        batch = [(text, waiter) for text, waiter in batch if not waiter.done()]
+        if not batch:
+            return
+        task = asyncio.create_task(self._send_coalesced(batch))
+        self._coalesced.add(task)
+        task.add_done_callback(self._coalesced.discard)
+
+    async def _send_coalesced(
+        self, batch: list[tuple[str, asyncio.Future[list[float]]]]
+    ) -> None:
+        COALESCED_TEXTS.observe(len(batch))
+        try:
+            vectors = await self._embed_batch([text for text, _ in batch])
+        except asyncio.CancelledError:
+            for _, waiter in batch:
+                waiter.cancel()
+            raise
+        except Exception as exc:
+            for _, waiter in batch:
+                if not waiter.done():
+                    waiter.set_exception(exc)
+            return
+        for (_, waiter), vector in zip(batch, vectors):
+            if not waiter.done():
+                waiter.set_result(vector)
 
     async def wait_for_startup(self) -> None:
-        async with httpx.AsyncClient(timeout=10, transport=self._transport) as client:
-            Logger.info("Waiting for the embedding server at %s", self._base_url)
-            for attempt in range(1, STARTUP_RETRIES + 1):
-                try:
-                    (await client.get(f"{self._base_url}/health")).raise_for_status()
-                    return
-                except (httpx.HTTPStatusError, httpx.ConnectError, httpx.TimeoutException):
-                    if attempt == STARTUP_RETRIES:
-                        break
-                    await asyncio.sleep(STARTUP_RETRY_DELAY)
-            raise ConnectionError(
-                f"embedding server at {self._base_url} did not become ready within "
-                f"{STARTUP_RETRIES * STARTUP_RETRY_DELAY:.0f}s"
-            )
+        self._http.open()
+        Logger.info("Waiting for the embedding server at %s", self.base_url)
+        for attempt in range(1, STARTUP_RETRIES + 1):
+            replicas = self._replicas.replicas
+            ready = [await self._http.check_health(replica.url) for replica in replicas]
+            if any(ready):
+                for replica, ok in zip(replicas, ready):
+                    if not ok:
+                        self._replicas.eject(replica, reason="not ready at startup")
+                return
+            if attempt < STARTUP_RETRIES:
+                await asyncio.sleep(STARTUP_RETRY_DELAY)
+        raise ConnectionError(
+            f"embedding server at {self.base_url} did not become ready within "
+            f"{STARTUP_RETRIES * STARTUP_RETRY_DELAY:.0f}s"
+        )
 
 
 _embedding_instance: EmbeddingPipeline | None = None
@@ -90,4 +215,47 @@ def get_embedding_pipeline() -> EmbeddingPipeline:
     return _embedding_instance
 
 
-__all__ = ["EmbeddingPipeline", "get_embedding_pipeline"]
+async def close_embedding_pipeline() -> None:
+    if _embedding_instance is not None:
+        await _embedding_instance.aclose()
+
+
+def _pool_gauge() -> dict[tuple[str, ...], float]:
+    if _embedding_instance is None:
+        return {}
+    stats = _embedding_instance.pool_stats()
+    return {("in_use",): stats.in_use, ("idle",): stats.idle}
+
+
+def _replica_gauge(field: str, convert: Callable[[Any], float] = float):
+    def collect() -> dict[tuple[str, ...], float]:
+        if _embedding_instance is None:
+            return {}
+        return {
+            (row["url"],): convert(row[field]) for row in _embedding_instance.replica_stats()
+        }
+
+    return collect
+
+
+metrics.gauge(
+    "clyre_embedding_pool_connections",
+    "Pooled HTTP connections to the embedding servers, in use or idle",
+    ("state",),
+    callback=_pool_gauge,
+)
+metrics.gauge(
+    "clyre_embedding_replica_in_flight",
+    "Outstanding requests per embedding replica",
+    ("replica",),
+    callback=_replica_gauge("in_flight"),
+)
+metrics.gauge(
+    "clyre_embedding_replica_ejected",
+    "1 while an embedding replica is ejected as unhealthy, else 0",
+    ("replica",),
+    callback=_replica_gauge("healthy", lambda healthy: 0 if healthy else 1),
+)
+
+
+__all__ = ["EmbeddingPipeline", "close_embedding_pipeline", "get_embedding_pipeline"]
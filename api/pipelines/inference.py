@@ -1,13 +1,23 @@
 import asyncio
+import hashlib
 import json
 import logging
-from dataclasses import dataclass
+import math
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import aclosing, asynccontextmanager
+from dataclasses import dataclass, replace
 from enum import Enum
-from typing import Any, AsyncGenerator, Literal
+from typing import Any, AsyncGenerator, Literal, TypeVar
 
 import httpx
 
-from utils import env
+from pipelines.breaker import CircuitBreaker
+from pipelines.client import PoolConfig, PooledClient, PoolStats
+from pipelines.replicas import Replica, ReplicaPool, split_urls
+from pipelines.scheduler import AdmissionScheduler, Priority, QueuedCallback
+from pipelines.slots import PromptCacheStats, SlotAffinity
+from utils import env, metrics
 
 Logger = logging.getLogger(__name__)
 Logger.setLevel(logging.INFO)
@@ -19,7 +29,218 @@ DEFAULT_SMALL_MODEL = "Qwen3.5-9B"
 STARTUP_RETRIES = 60
 STARTUP_RETRY_DELAY = 5.0
 
+# Non-streaming completions return only after the whole answer is decoded;
+# this bounds an uncapped one (see chat_completion_sync).
+SYNC_COMPLETION_TIMEOUT = 100.0
+
+# Token counts remembered per pipeline, keyed by a digest of the text.
+# Patchable in tests.
+TOKEN_COUNT_CACHE_SIZE = 4096
+# /tokenize requests in flight per count_tokens_many call. Patchable in tests.
+TOKENIZE_CONCURRENCY = 4
+
+# /slots polling while confirming that a closed stream's slot stopped
+# decoding. Patchable in tests.
+SLOT_RELEASE_POLL_SECONDS = 0.01
+
+# Times a watched stream's deadline moves on while /slots shows its slot still
+# processing, before the stream counts as stalled. Patchable in tests.
+STALL_EXTENSIONS = 3
+
+# Generation budgets: tokens of the window kept free beyond the estimated
+# prompt (template framing the estimate misses), the smallest completion ever
+# requested, and the part of it a reasoning cap always leaves to the answer.
+# Patchable in tests.
+BUDGET_MARGIN_TOKENS = 32
+MIN_COMPLETION_TOKENS = 16
+MIN_ANSWER_TOKENS = 256
+
+# Closes the reasoning cut off at its budget; sent as an assistant prefill, so
+# the model continues straight into the answer. llama.cpp's reasoning parser
+# (`reasoning_format`) splits on the same tags.
+REASONING_CUTOFF_PREFILL = "<think>\n{reasoning}\n</think>\n\n"
+
 ChunkKind = Literal["thinking", "content"]
+BudgetKind = Literal["reasoning", "length"]
+StreamPhase = Literal["connect", "prefill", "decode"]
+
+T = TypeVar("T")
+
+
+def _int(value: Any) -> int | None:
+    return int(value) if value is not None else None
+
+
+def _float(value: Any) -> float | None:
+    return float(value) if value is not None else None
+
+
+def _shift(value: int | None, by: int) -> int | None:
+    return max(value + by, 0) if value is not None else None
+
+
+@dataclass(frozen=True)
+class CompletionUsage:
+    """Token counts and server timings of one completion.
+
+    Built from llama-server's `usage` and `timings` blocks. `prompt_tokens`
+    is the whole prompt; of it, `cached_tokens` were reused from the slot's
+    KV cache and `prefill_tokens` had to be computed (`prompt_ms`).
+    """
+
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    cached_tokens: int | None = None
+    prefill_tokens: int | None = None
+    prompt_ms: float | None = None
+    predicted_ms: float | None = None
+
+    @classmethod
+    def parse(
+        cls, usage: dict[str, Any] | None, timings: dict[str, Any] | None
+    ) -> "CompletionUsage | None":
+        if not usage and not timings:
+            return None
+        usage = usage or {}
+        timings = timings or {}
+        prefill = _int(timings.get("prompt_n"))
+        cached = _int(timings.get("cache_n"))
+        prompt = _int(usage.get("prompt_tokens"))
+        if prompt is None and prefill is not None:
+            prompt = prefill + (cached or 0)
+        completion = _int(usage.get("completion_tokens"))
+        if completion is None:
+            completion = _int(timings.get("predicted_n"))
+        return cls(
+            prompt_tokens=prompt,
+            completion_tokens=completion,
+            cached_tokens=cached,
+            prefill_tokens=prefill,
+            prompt_ms=_float(timings.get("prompt_ms")),
+            predicted_ms=_float(timings.get("predicted_ms")),
+        )
+
+
+UsageCallback = Callable[[CompletionUsage], None]
+# Awaited with the exhausted budget's kind and its limit in tokens.
+BudgetCallback = Callable[[BudgetKind, int], Awaitable[None]]
+
+
+@dataclass(frozen=True)
+class GenerationBudget:
+    """Token caps for one completion; None leaves a cap off.
+
+    `max_tokens` bounds the whole completion, reasoning included (llama-server
+    counts both against n_predict); the server stops with finish_reason
+    "length" once it is spent. `reasoning_tokens` bounds the reasoning alone:
+    past it the stream is closed and the answer requested with the reasoning
+    so far closed off, so the rest of `max_tokens` goes to content.
+    """
+
+    max_tokens: int | None = None
+    reasoning_tokens: int | None = None
+
+
+@dataclass
+class _StreamOutcome:
+    """What one streamed request reported besides its deltas."""
+
+    usage: dict[str, Any] | None = None
+    timings: dict[str, Any] | None = None
+    finish_reason: str | None = None
+
+
+@dataclass
+class StreamPhases:
+    """Seconds one streamed completion spent per phase, kept by its watchdog.
+
+    `connect` lasts until the response headers, `prefill` until the first
+    delta, `decode` until the stream ends; `max_stall` is the longest wait
+    for a line while decoding. A completion re-requested after a reasoning
+    cut adds the second request's phases. `aborted` names the phase whose
+    deadline ended the stream, if one did.
+    """
+
+    connect: float = 0.0
+    prefill: float = 0.0
+    decode: float = 0.0
+    max_stall: float = 0.0
+    aborted: StreamPhase | None = None
+
+
+class StreamStalled(httpx.ReadTimeout):
+    """A streamed completion missed its deadline in `phase` and was closed."""
+
+    def __init__(self, phase: StreamPhase, waited: float):
+        super().__init__(f"llama.cpp stream stalled in {phase} after {waited:.1f}s")
+        self.phase = phase
+        self.waited = waited
+
+
+def _prefill_allowance(prompt_tokens: int | None) -> float:
+    rate = env.INFERENCE_PREFILL_TOKENS_PER_SECOND
+    return prompt_tokens / rate if prompt_tokens and rate > 0 else 0.0
+
+
+def _completion_allowance(prompt_tokens: int | None, max_tokens: int | None) -> float | None:
+    """Seconds a non-streamed completion may take: the prefill of
+    `prompt_tokens` plus `max_tokens` decoded at INFERENCE_DECODE_TOKENS_PER_SECOND.
+    None when the answer has no cap (or no decode speed is set)."""
+    rate = env.INFERENCE_DECODE_TOKENS_PER_SECOND
+    if not max_tokens or rate <= 0:
+        return None
+    return _prefill_allowance(prompt_tokens) + max_tokens / rate
+
+
+class _Watchdog:
+    """Deadlines for one stream's reads.
+
+    A read past its period does not fail at once: `busy()` asks the server
+    first, and while it answers that the request's slot is still processing
+    the deadline moves on by `extension` (the period by default), at most
+    STALL_EXTENSIONS times.
+    A server that is down, hung or idle on the slot gets the read cancelled
+    and StreamStalled raised.
+    """
+
+    def __init__(self, busy: Callable[[], Awaitable[bool | None]]):
+        self._busy = busy
+
+    async def read(
+        self,
+        step: Awaitable[T],
+        phase: StreamPhase,
+        period: float,
+        extension: float | None = None,
+    ) -> T:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        extensions = 0
+        verdict: asyncio.Task | None = None
+
+        async def judge() -> None:
+            nonlocal extensions, timer
+            if extensions < STALL_EXTENSIONS and await self._busy():
+                extensions += 1
+                timer = loop.call_later(period if extension is None else extension, expire)
+            else:
+                window.reschedule(loop.time())
+
+        def expire() -> None:
+            nonlocal verdict
+            verdict = loop.create_task(judge())
+
+        try:
+            async with asyncio.timeout(None) as window:
+                timer = loop.call_later(period, expire)
+                try:
+                    return await step
+                finally:
+                    timer.cancel()
+                    if verdict is not None:
+                        verdict.cancel()
+        except TimeoutError:
+            raise StreamStalled(phase, loop.time() - started) from None
 
 
 @dataclass(frozen=True)
@@ -72,7 +293,21 @@ class LLMPipeline:
 
     Talks to an OpenAI-compatible endpoint (/v1/chat/completions, /tokenize).
     One client class, configured per tier (small / big); the embedding tier uses
-    the dedicated EmbeddingPipeline instead.
+    the dedicated EmbeddingPipeline instead. Each instance owns one pooled
+    keep-alive HTTP client; call `aclose()` on shutdown.
+
+    `base_url` may list several comma-separated replicas of the same model;
+    every request goes to the replica with the fewest requests in flight.
+    Requests carrying an `affinity_key` (the thread id) are pinned to the
+    replica slot that last served that key so llama-server can reuse the
+    cached prompt prefix. Every request first passes the tier's admission
+    scheduler, which caps concurrency at the total slot count.
+
+    `context_tokens` is the per-slot context window reported by /props
+    (`CHAT_CONTEXT_TOKENS` until a replica reported one).
+
+    A circuit breaker named `name` (the tier; the model by default) fails
+    requests fast with BackendUnavailable while the backend is down or hung.
     """
 
     def __init__(
@@ -80,38 +315,221 @@ class LLMPipeline:
         base_url: str,
         model_name: str,
         transport: httpx.AsyncBaseTransport | None = None,
+        pool: PoolConfig | None = None,
+        name: str | None = None,
     ):
-        self.__base_url = base_url.rstrip("/")
         self.__model_name = model_name
-        self.__transport = transport
+        self.__http = PooledClient(transport, pool)
+        self.__replicas = ReplicaPool(split_urls(base_url), self.__http.check_health)
+        self.__slots = {
+            replica.url: SlotAffinity(env.INFERENCE_SLOTS)
+            for replica in self.__replicas.replicas
+        }
+        self.__cache_stats = PromptCacheStats()
+        self.__scheduler = AdmissionScheduler(self._total_slots())
+        self.__context_tokens: dict[str, int] = {}
+        self.__token_counts: OrderedDict[bytes, int] = OrderedDict()
+        self.__breaker = CircuitBreaker(name or model_name, self._probe_health)
 
     @property
     def base_url(self) -> str:
-        return self.__base_url
+        return ",".join(replica.url for replica in self.__replicas.replicas)
 
     @property
     def model_name(self) -> str:
         return self.__model_name
 
-    async def wait_for_startup(self) -> None:
-        """Poll /health until the server is ready, then raise on timeout."""
-        async with httpx.AsyncClient(timeout=10, transport=self.__transport) as client:
-            Logger.info("Waiting for llama.cpp to become ready at %s", self.__base_url)
-            for attempt in range(1, STARTUP_RETRIES + 1):
+    @property
+    def context_tokens(self) -> int:
+        # Replicas of one model should agree; the smallest window is the safe one.
+        return min(self.__context_tokens.values(), default=env.CHAT_CONTEXT_TOKENS)
+
+    def pool_stats(self) -> PoolStats:
+        return self.__http.stats()
+
+    def replica_stats(self) -> list[dict[str, object]]:
+        return self.__replicas.stats()
+
+    def prompt_cache_stats(self) -> dict[str, float]:
+        """Token-level reuse from llama-server timings, plus slot affinity
+        hits, misses and evictions summed over the replicas."""
+        tables = self.__slots.values()
+        return {
+            **self.__cache_stats.as_dict(),
+            "affinity_hits": sum(table.hits for table in tables),
+            "affinity_misses": sum(table.misses for table in tables),
+            "affinity_evictions": sum(table.evictions for table in tables),
+        }
+
+    def scheduler_stats(self) -> dict[str, int]:
+        return self.__scheduler.stats()
+
+    def breaker_stats(self) -> dict[str, object]:
+        return self.__breaker.stats()
+
+    async def _probe_health(self) -> bool:
+        for replica in self.__replicas.replicas:
+            if await self.__http.check_health(replica.url, timeout=5.0):
+                return True
+        return False
+
+    def _total_slots(self) -> int:
+        return sum(table.n_slots for table in self.__slots.values())
+
+    async def _discover_slots(self, replica: Replica) -> None:
+        """Size the affinity table from the server's parallel slot count and
+        note the per-slot context window."""
+        try:
+            response = await self.__http.client.get(
+                f"{replica.url}/props", timeout=self.__http.timeout(10)
+            )
+            response.raise_for_status()
+            props = response.json()
+            total = int(props.get("total_slots") or 0)
+            n_ctx = int((props.get("default_generation_settings") or {}).get("n_ctx") or 0)
+        except (httpx.HTTPError, ValueError):
+            return
+        if n_ctx > 0:
+            self.__context_tokens[replica.url] = n_ctx
+        if total > 0:
+            self.__slots[replica.url].resize(total)
+            self.__scheduler.resize(self._total_slots())
+            Logger.info("llama.cpp at %s serves %d parallel slot(s)", replica.url, total)
+
+    @asynccontextmanager
+    async def _slot_lease(
+        self,
+        affinity_key: str | None,
+        priority: Priority,
+        user_id: str | None,
+        on_queued: QueuedCallback | None = None,
+    ) -> AsyncIterator[tuple[Replica, int | None]]:
+        def holds_key(replica: Replica) -> bool:
+            return self.__slots[replica.url].holds(affinity_key)
+
+        async with self.__scheduler.admit(priority, user_id, on_queued):
+            async with self.__replicas.lease(prefer=holds_key) as replica:
+                slots = self.__slots[replica.url]
+                slot = slots.acquire(affinity_key)
                 try:
-                    (
-                        await client.get(f"{self.__base_url}/health", timeout=10)
-                    ).raise_for_status()
-                    Logger.info("llama.cpp ready at %s", self.__base_url)
-                    return
-                except (httpx.HTTPStatusError, httpx.ConnectError, httpx.TimeoutException):
-                    if attempt == STARTUP_RETRIES:
-                        break
-                    await asyncio.sleep(STARTUP_RETRY_DELAY)
-            raise ConnectionError(
-                f"llama.cpp at {self.__base_url} did not become ready within "
-                f"~{STARTUP_RETRIES * (STARTUP_RETRY_DELAY + 10):.0f}s"
+                    yield replica, slot
+                finally:
+                    slots.release(slot)
+
+    @asynccontextmanager
+    async def _confirmed_release(
+        self, replica: Replica, slot: int | None
+    ) -> AsyncIterator[None]:
+        """Around a stream: when it ends early (stopped, failed, abandoned),
+        wait until the server stopped decoding on `slot` before the lease
+        lets the tier admit onto it again.
+
+        llama-server has no cancel endpoint; a closed connection is how it is
+        told to stop, and /slots shows when it has. Off unless
+        INFERENCE_RELEASE_CONFIRM_SECONDS is set.
+        """
+        try:
+            yield
+        except BaseException:
+            if env.INFERENCE_RELEASE_CONFIRM_SECONDS > 0 and slot is not None:
+                await self._confirm_release(replica, slot)
+            raise
+
+    async def _slot_busy(self, replica: Replica, slot: int | None) -> bool | None:
+        """Whether /slots shows `slot` processing; None when it cannot tell."""
+        if slot is None:
+            return None
+        try:
+            response = await self.__http.client.get(
+                f"{replica.url}/slots", timeout=self.__http.timeout(1)
             )
+            response.raise_for_status()
+            return any(
+                entry.get("id") == slot and entry.get("is_processing")
+                for entry in response.json()
+            )
+        except (httpx.HTTPError, ValueError, AttributeError):
+            return None
+
+    async def _confirm_release(self, replica: Replica, slot: int) -> None:
+        loop = asyncio.get_running_loop()
+        closed_at = loop.time()
+        deadline = closed_at + env.INFERENCE_RELEASE_CONFIRM_SECONDS
+        while loop.time() < deadline:
+            busy = await self._slot_busy(replica, slot)
+            if busy is None:
+                # /slots disabled (--no-slots) or unreachable: nothing to wait on.
+                return
+            if not busy:
+                SLOT_RELEASE_SECONDS.labels(self.__model_name).observe(loop.time() - closed_at)
+                return
+            await asyncio.sleep(SLOT_RELEASE_POLL_SECONDS)
+        Logger.warning(
+            "Slot %d at %s still decoding %.1fs after its stream closed",
+            slot,
+            replica.url,
+            env.INFERENCE_RELEASE_CONFIRM_SECONDS,
+        )
+
+    def _record_timings(self, timings: dict[str, Any] | None, affinity_key: str | None) -> None:
+        if not timings:
+            return
+        self.__cache_stats.record(timings)
+        if timings.get("predicted_per_second"):
+            DECODE_RATE.labels(self.__model_name).observe(
+                float(timings["predicted_per_second"])
+            )
+        Logger.debug(
+            "Prompt cache key=%s reused=%s prefilled=%s (overall hit ratio %.2f)",
+            affinity_key,
+            timings.get("cache_n"),
+            timings.get("prompt_n"),
+            self.__cache_stats.hit_ratio,
+        )
+
+    def _report_usage(
+        self,
+        usage: dict[str, Any] | None,
+        timings: dict[str, Any] | None,
+        on_usage: UsageCallback | None,
+    ) -> None:
+        if on_usage is None:
+            return
+        parsed = CompletionUsage.parse(usage, timings)
+        if parsed is not None:
+            on_usage(parsed)
+
+    async def aclose(self) -> None:
+        await self.__breaker.aclose()
+        await self.__replicas.aclose()
+        await self.__http.aclose()
+
+    async def wait_for_startup(self) -> None:
+        """Poll /health until a replica is ready, then raise on timeout.
+
+        Replicas still loading once the first one is up are ejected and
+        re-admitted by the background probe. Also opens the pooled client, so
+        the first chat turn reuses a warm connection.
+        """
+        self.__http.open()
+        Logger.info("Waiting for llama.cpp to become ready at %s", self.base_url)
+        for attempt in range(1, STARTUP_RETRIES + 1):
+            replicas = self.__replicas.replicas
+            ready = [await self.__http.check_health(replica.url) for replica in replicas]
+            if any(ready):
+                for replica, ok in zip(replicas, ready):
+                    if ok:
+                        await self._discover_slots(replica)
+                    else:
+                        self.__replicas.eject(replica, reason="not ready at startup")
+                Logger.info("llama.cpp ready at %s", self.base_url)
+                return
+            if attempt < STARTUP_RETRIES:
+                await asyncio.sleep(STARTUP_RETRY_DELAY)
+        raise ConnectionError(
+            f"llama.cpp at {self.base_url} did not become ready within "
+            f"~{STARTUP_RETRIES * (STARTUP_RETRY_DELAY + 10):.0f}s"
+        )
 
     def _build_payload(
         self,
@@ -121,13 +539,23 @@ class LLMPipeline:
         response_format: dict[str, Any] | None = None,
         grammar: str | None = None,
         enable_thinking: bool | None = None,
+        id_slot: int | None = None,
+        max_tokens: int | None = None,
     ):
         payload = {
             "model": self.__model_name,
             "messages": history,
             "temperature": temperature,
             "stream": stream,
+            "cache_prompt": True,
         }
+        if stream:
+            # The final chunk then carries `usage` next to `timings`.
+            payload["stream_options"] = {"include_usage": True}
+        if id_slot is not None:
+            payload["id_slot"] = id_slot
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
         if response_format is not None:
             payload["response_format"] = response_format
         if grammar is not None:
@@ -145,27 +573,173 @@ class LLMPipeline:
         response_format: dict[str, Any] | None = None,
         grammar: str | None = None,
         enable_thinking: bool | None = None,
+        affinity_key: str | None = None,
+        priority: Priority = Priority.INTERACTIVE,
+        user_id: str | None = None,
+        on_usage: UsageCallback | None = None,
+        max_tokens: int | None = None,
+        prompt_tokens: int | None = None,
     ):
-        payload = self._build_payload(
-            history,
-            temperature,
-            stream=False,
-            response_format=response_format,
-            grammar=grammar,
-            enable_thinking=enable_thinking,
+        """One completion, returned once fully decoded.
+
+        Its latency grows with the answer, so with `max_tokens` set the
+        request may take INFERENCE_FIRST_TOKEN_SECONDS plus the prefill of
+        `prompt_tokens` and `max_tokens` of decode (SYNC_COMPLETION_TIMEOUT
+        plus the prefill when uncapped), and the breaker only counts it as
+        slow past BREAKER_SLOW_SECONDS plus that allowance; an uncapped
+        answer is never counted as slow (errors and timeouts still are).
+        """
+        allowance = _completion_allowance(prompt_tokens, max_tokens)
+        if allowance is None:
+            read_timeout = SYNC_COMPLETION_TIMEOUT + _prefill_allowance(prompt_tokens)
+            slow_seconds = math.inf
+        else:
+            read_timeout = env.INFERENCE_FIRST_TOKEN_SECONDS + allowance
+            slow_seconds = env.BREAKER_SLOW_SECONDS + allowance
+        self.__breaker.check()
+        async with self._slot_lease(affinity_key, priority, user_id) as (replica, slot):
+            payload = self._build_payload(
+                history,
+                temperature,
+                stream=False,
+                response_format=response_format,
+                grammar=grammar,
+                enable_thinking=enable_thinking,
+                id_slot=slot,
+                max_tokens=max_tokens,
+            )
+            async with self.__breaker.call(slow_seconds):
+                response = await self.__http.client.post(
+                    f"{replica.url}/v1/chat/completions",
+                    json=payload,
+                    timeout=self.__http.timeout(read_timeout),
+                )
+                response.raise_for_status()
+        response_json = response.json()
+        self._record_timings(response_json.get("timings"), affinity_key)
+        Logger.info(
+            "LLM response:\n\t%s\n\t%s\n\t%s",
+            response_json["id"],
+            response_json["usage"],
+            response_json["timings"],
         )
-        link = f"{self.__base_url}/v1/chat/completions"
-        async with httpx.AsyncClient(timeout=100.0, transport=self.__transport) as client:
-            response = await client.post(link, json=payload)
-            response.raise_for_status()
-            response_json = response.json()
-            Logger.info(
-                "LLM response:\n\t%s\n\t%s\n\t%s",
-                response_json["id"],
-                response_json["usage"],
-                response_json["timings"],
+        self._report_usage(response_json.get("usage"), response_json.get("timings"), on_usage)
+        return response_json
+
+    async def _stream_deltas(
+        self,
+        link: str,
+        payload: dict[str, Any],
+        outcome: _StreamOutcome,
+        watchdog: _Watchdog,
+        first_token_seconds: float,
+        phases: StreamPhases,
+    ) -> AsyncGenerator[tuple[ChunkKind, str], None]:
+        """Yield one streamed request's (kind, text) deltas.
+
+        Usage, timings and the finish reason are left on `outcome`, phase
+        durations on `phases`. The headers and the first delta must arrive
+        within `first_token_seconds`, each later line within
+        INFERENCE_STALL_SECONDS (see _Watchdog). Closing the generator early
+        closes the upstream request.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        first_token_at = started + first_token_seconds
+        phase: StreamPhase = "connect"
+        request = self.__http.client.build_request(
+            "POST", link, json=payload, timeout=self.__http.stream_timeout()
+        )
+        try:
+            stream = await watchdog.read(
+                self.__http.client.send(request, stream=True), phase, first_token_seconds
             )
-            return response_json
+        except StreamStalled as exc:
+            phases.aborted = exc.phase
+            raise
+        headers_at = loop.time()
+        phases.connect += headers_at - started
+        STREAM_PHASE_SECONDS.labels(self.__model_name, phase).observe(headers_at - started)
+        phase = "prefill"
+        first_at: float | None = None
+        try:
+            stream.raise_for_status()
+            lines = stream.aiter_lines()
+            while True:
+                waiting_since = loop.time()
+                if first_at is None:
+                    # The prefill deadline counts from the request, connect included.
+                    period, extension = first_token_at - waiting_since, first_token_seconds
+                else:
+                    period = extension = env.INFERENCE_STALL_SECONDS
+                try:
+                    line = await watchdog.read(anext(lines), phase, period, extension)
+                except StopAsyncIteration:
+                    break
+                if first_at is not None:
+                    phases.max_stall = max(phases.max_stall, loop.time() - waiting_since)
+                try:
+                    formatted_chunk = line[6:].strip()
+                    if not formatted_chunk:
+                        continue
+
+                    if formatted_chunk == "[DONE]":
+                        break
+
+                    chunk_json: dict[str, Any] = json.loads(formatted_chunk)
+                    if chunk_json.get("timings"):
+                        outcome.timings = chunk_json["timings"]
+                    if chunk_json.get("usage"):
+                        outcome.usage = chunk_json["usage"]
+
+                    if len(chunk_json.get("choices", ())) <= 0:
+                        if not chunk_json.get("usage") or not chunk_json.get("timings"):
+                            continue
+                        Logger.info(
+                            "LLM response:\n\t%s\n\t%s\n\t%s",
+                            chunk_json["id"],
+                            chunk_json["usage"],
+                            chunk_json["timings"],
+                        )
+                        continue
+
+                    choice = chunk_json["choices"][0]
+                    if choice.get("finish_reason"):
+                        outcome.finish_reason = choice["finish_reason"]
+
+                    delta = choice["delta"]
+                    reasoning: str | None = delta.get("reasoning_content")
+                    token: str | None = delta.get("content")
+                    if reasoning:
+                        kind: ChunkKind = "thinking"
+                        text = reasoning
+                    elif token:
+                        kind, text = "content", token
+                    else:
+                        continue
+                except json.JSONDecodeError:
+                    Logger.error("Failed to decode JSON from llama.cpp response (%s)", line)
+                    continue
+
+                if first_at is None:
+                    first_at = loop.time()
+                    phases.prefill += first_at - headers_at
+                    STREAM_PHASE_SECONDS.labels(self.__model_name, phase).observe(
+                        first_at - headers_at
+                    )
+                    phase = "decode"
+                yield kind, text
+        except StreamStalled as exc:
+            phases.aborted = exc.phase
+            if exc.phase == "decode":
+                phases.max_stall = max(phases.max_stall, exc.waited)
+            raise
+        finally:
+            await stream.aclose()
+            if first_at is not None:
+                decoded = loop.time() - first_at
+                phases.decode += decoded
+                STREAM_PHASE_SECONDS.labels(self.__model_name, "decode").observe(decoded)
 
     async def chat_completion_stream(
         self,
@@ -174,71 +748,190 @@ class LLMPipeline:
         response_format: dict[str, Any] | None = None,
         grammar: str | None = None,
         enable_thinking: bool | None = None,
+        affinity_key: str | None = None,
+        priority: Priority = Priority.INTERACTIVE,
+        user_id: str | None = None,
+        on_queued: QueuedCallback | None = None,
+        on_usage: UsageCallback | None = None,
+        budget: GenerationBudget | None = None,
+        on_budget: BudgetCallback | None = None,
+        prompt_tokens: int | None = None,
+        phases: StreamPhases | None = None,
     ) -> AsyncGenerator[tuple[ChunkKind, str], None]:
-        """Yield (kind, text) pairs; kind is "thinking" or "content"."""
-        payload = self._build_payload(
-            history,
-            temperature,
-            stream=True,
-            response_format=response_format,
-            grammar=grammar,
-            enable_thinking=enable_thinking,
-        )
-        link = f"{self.__base_url}/v1/chat/completions"
-        async with httpx.AsyncClient(timeout=60.0, transport=self.__transport) as client:
-            async with client.stream("POST", link, json=payload) as stream:
-                async for line in stream.aiter_lines():
-                    try:
-                        formatted_chunk = line[6:].strip()
-                        if not formatted_chunk:
-                            continue
+        """Yield (kind, text) pairs; kind is "thinking" or "content".
 
-                        if formatted_chunk == "[DONE]":
-                            break
+        `on_queued(position)` is awaited while the request waits for capacity.
+        `on_usage(usage)` is called once the server reported usage and
+        timings; a stream closed early reports nothing. `on_budget(kind,
+        limit)` is awaited when `budget` runs out: "reasoning" once the
+        reasoning cap switched the stream to the answer (reasoning deltas are
+        counted as tokens, as llama-server streams one token per delta),
+        "length" when the server stopped the completion at its cap.
 
-                        chunk_json: dict[str, Any] = json.loads(formatted_chunk)
-
-                        if len(chunk_json.get("choices", ())) <= 0:
-                            if not chunk_json.get("usage") or not chunk_json.get("timings"):
-                                continue
-                            Logger.info(
-                                "LLM response:\n\t%s\n\t%s\n\t%s",
-                                chunk_json["id"],
-                                chunk_json["usage"],
-                                chunk_json["timings"],
-                            )
-                            continue
+        The stream is watched per phase rather than by a read timeout: the
+        first delta may take INFERENCE_FIRST_TOKEN_SECONDS plus the prefill
+        of `prompt_tokens` (llama-server is silent while it processes the
+        prompt), later deltas INFERENCE_STALL_SECONDS each. A missed deadline
+        raises StreamStalled; how long each phase took is left on `phases`.
 
-                        delta = chunk_json["choices"][0]["delta"]
-                        reasoning: str | None = delta.get("reasoning_content")
-                        if reasoning:
-                            yield ("thinking", reasoning)
-                            continue
+        Closing the generator or cancelling its consumer closes the upstream
+        request right away, which is what makes llama-server stop decoding.
+        """
+        budget = budget or GenerationBudget()
+        phases = phases if phases is not None else StreamPhases()
+        allowance = _prefill_allowance(prompt_tokens)
+        # Before queueing: an open circuit fails the turn now, not after the wait.
+        self.__breaker.check()
+        lease = self._slot_lease(affinity_key, priority, user_id, on_queued)
+        async with (
+            lease as (replica, slot),
+            self._confirmed_release(replica, slot),
+            # A long prompt's prefill is expected, not a slow backend.
+            self.__breaker.call(env.BREAKER_SLOW_SECONDS + allowance) as call,
+        ):
+            watchdog = _Watchdog(lambda: self._slot_busy(replica, slot))
+            link = f"{replica.url}/v1/chat/completions"
+            payload = self._build_payload(
+                history,
+                temperature,
+                stream=True,
+                response_format=response_format,
+                grammar=grammar,
+                enable_thinking=enable_thinking,
+                id_slot=slot,
+                max_tokens=budget.max_tokens,
+            )
+            outcome = _StreamOutcome()
+            reasoning: list[str] = []
+            cut = False
+            first_token_seconds = env.INFERENCE_FIRST_TOKEN_SECONDS + allowance
+            deltas = self._stream_deltas(
+                link, payload, outcome, watchdog, first_token_seconds, phases
+            )
+            async with aclosing(deltas):
+                async for kind, text in deltas:
+                    call.responded()
+                    if kind == "thinking" and budget.reasoning_tokens is not None:
+                        if len(reasoning) >= budget.reasoning_tokens:
+                            cut = True
+                            break
+                        reasoning.append(text)
+                    yield kind, text
 
-                        token: str | None = delta.get("content")
-                        if not token:
-                            continue
+            if cut:
+                # The upstream request is closed, so the slot stops decoding
+                # reasoning; the same slot still holds the prompt prefix.
+                Logger.info(
+                    "Reasoning budget of %d tokens spent key=%s; switching to the answer",
+                    budget.reasoning_tokens,
+                    affinity_key,
+                )
+                if on_budget is not None:
+                    await on_budget("reasoning", budget.reasoning_tokens)
+                prefill = REASONING_CUTOFF_PREFILL.format(reasoning="".join(reasoning).strip())
+                remaining = (
+                    max(budget.max_tokens - len(reasoning), 1)
+                    if budget.max_tokens is not None
+                    else None
+                )
+                payload = self._build_payload(
+                    [*history, {"role": "assistant", "content": prefill}],
+                    temperature,
+                    stream=True,
+                    response_format=response_format,
+                    grammar=grammar,
+                    enable_thinking=False,
+                    id_slot=slot,
+                    max_tokens=remaining,
+                )
+                outcome = _StreamOutcome()
+                # The prompt now ends in the reasoning, which is mostly cached.
+                first_token_seconds += _prefill_allowance(len(reasoning))
+                deltas = self._stream_deltas(
+                    link, payload, outcome, watchdog, first_token_seconds, phases
+                )
+                async with aclosing(deltas):
+                    async for kind, text in deltas:
+                        yield kind, text
 
-                        yield ("content", token)
-                    except json.JSONDecodeError:
-                        Logger.error("Failed to decode JSON from llama.cpp response (%s)", line)
-                        continue
+            self._record_timings(outcome.timings, affinity_key)
+            if outcome.finish_reason == "length" and on_budget is not None:
+                await on_budget("length", budget.max_tokens or self.context_tokens)
+            if on_usage is not None:
+                usage = CompletionUsage.parse(outcome.usage, outcome.timings)
+                if usage is not None and cut:
+                    # The answer's prompt carried the cut reasoning; count it
+                    # as generated, as it was.
+                    usage = replace(
+                        usage,
+                        prompt_tokens=_shift(usage.prompt_tokens, -len(reasoning)),
+                        completion_tokens=_shift(usage.completion_tokens, len(reasoning)),
+                    )
+                if usage is not None:
+                    on_usage(usage)
+
+    async def count_tokens_many(
+        self,
+        texts: list[str],
+        priority: Priority = Priority.INGESTION,
+        user_id: str | None = None,
+        admission: bool = True,
+    ) -> list[int]:
+        """Count tokens through llama-server without approximating them locally.
 
-    async def count_tokens_many(self, texts: list[str]) -> list[int]:
-        """Count tokens through llama-server without approximating them locally."""
+        Counts are cached per text, so repeated texts (the system prompt, a
+        re-sent history) cost no request. The uncached texts are admitted once
+        as a batch (one scheduler waiter, not one per text) and sent at most
+        TOKENIZE_CONCURRENCY at a time. `admission=False` skips the tier's
+        scheduler: /tokenize holds no slot, and a chat turn counting its own
+        message must not queue behind running generations.
+        """
         if not texts:
             return []
 
-        async with httpx.AsyncClient(timeout=60.0, transport=self.__transport) as client:
-            responses = await asyncio.gather(
-                *(
-                    client.post(f"{self.__base_url}/tokenize", json={"content": text})
-                    for text in texts
-                )
-            )
-        for response in responses:
-            response.raise_for_status()
-        return [len(response.json()["tokens"]) for response in responses]
+        keys = [
+            hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest() for text in texts
+        ]
+        counts: dict[bytes, int] = {}
+        missing: dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            cached = self.__token_counts.get(key)
+            if cached is not None:
+                self.__token_counts.move_to_end(key)
+                counts[key] = cached
+            else:
+                missing[key] = text
+
+        if missing:
+            self.__breaker.check()
+            limit = asyncio.Semaphore(TOKENIZE_CONCURRENCY)
+
+            async def _request(key: bytes, text: str) -> None:
+                async with (
+                    limit,
+                    self.__breaker.call(),
+                    self.__replicas.lease() as replica,
+                ):
+                    response = await self.__http.client.post(
+                        f"{replica.url}/tokenize", json={"content": text}
+                    )
+                    response.raise_for_status()
+                    counts[key] = len(response.json()["tokens"])
+
+            async def _send() -> None:
+                await asyncio.gather(*(_request(key, text) for key, text in missing.items()))
+
+            if admission:
+                async with self.__scheduler.admit(priority, user_id):
+                    await _send()
+            else:
+                await _send()
+            for key in missing:
+                self.__token_counts[key] = counts[key]
+            while len(self.__token_counts) > TOKEN_COUNT_CACHE_SIZE:
+                self.__token_counts.popitem(last=False)
+
+        return [counts[key] for key in keys]
 
 
 def _resolve_chat_tier(role: Tier) -> tuple[str, str]:
@@ -272,14 +965,158 @@ def _resolve_chat_tier(role: Tier) -> tuple[str, str]:
     return url, model
 
 
+def generation_budget(role: Tier, prompt_tokens: int, context_tokens: int) -> GenerationBudget:
+    """Caps for a completion on `role` whose prompt takes `prompt_tokens` of
+    a `context_tokens` window.
+
+    The completion gets the rest of the window, bounded by the tier's
+    *_MAX_COMPLETION_TOKENS; the tier's *_REASONING_BUDGET_TOKENS is lowered
+    so at least MIN_ANSWER_TOKENS of that stay for the answer. 0 disables
+    either setting.
+    """
+    if role is Tier.SMALL:
+        ceiling, reasoning = env.SMALL_MAX_COMPLETION_TOKENS, env.SMALL_REASONING_BUDGET_TOKENS
+    else:
+        ceiling, reasoning = env.BIG_MAX_COMPLETION_TOKENS, env.BIG_REASONING_BUDGET_TOKENS
+    max_tokens = max(
+        context_tokens - prompt_tokens - BUDGET_MARGIN_TOKENS, MIN_COMPLETION_TOKENS
+    )
+    if ceiling > 0:
+        max_tokens = min(max_tokens, ceiling)
+    return GenerationBudget(
+        max_tokens=max_tokens,
+        reasoning_tokens=(
+            max(min(reasoning, max_tokens - MIN_ANSWER_TOKENS), 0) if reasoning > 0 else None
+        ),
+    )
+
+
 _instances: dict[Tier, LLMPipeline] = {}
 
 
+def _scheduler_gauge(field: str):
+    def collect() -> dict[tuple[str, ...], float]:
+        return {
+            (tier.value,): pipeline.scheduler_stats()[field]
+            for tier, pipeline in _instances.items()
+        }
+
+    return collect
+
+
+def _replica_gauge(field: str, convert: Callable[[Any], float] = float):
+    def collect() -> dict[tuple[str, ...], float]:
+        return {
+            (tier.value, row["url"]): convert(row[field])
+            for tier, pipeline in _instances.items()
+            for row in pipeline.replica_stats()
+        }
+
+    return collect
+
+
+def _affinity_gauge() -> dict[tuple[str, ...], float]:
+    values = {}
+    for tier, pipeline in _instances.items():
+        stats = pipeline.prompt_cache_stats()
+        for outcome in ("hits", "misses", "evictions"):
+            values[(tier.value, outcome)] = stats[f"affinity_{outcome}"]
+    return values
+
+
+DECODE_RATE = metrics.histogram(
+    "clyre_llm_tokens_per_second",
+    "Decode speed reported by llama-server per completion",
+    ("model",),
+    buckets=(1, 2, 5, 10, 15, 20, 30, 40, 60, 80, 100, 150, 200, 400),
+)
+SLOT_RELEASE_SECONDS = metrics.histogram(
+    "clyre_llm_slot_release_seconds",
+    "Time from closing an unfinished stream until /slots showed its slot idle",
+    ("model",),
+)
+STREAM_PHASE_SECONDS = metrics.histogram(
+    "clyre_llm_stream_phase_seconds",
+    "Time a streamed completion spent connecting, prefilling and decoding",
+    ("model", "phase"),
+    buckets=metrics.SLOW_LATENCY_BUCKETS,
+)
+metrics.gauge(
+    "clyre_llm_queue_depth",
+    "Requests waiting for tier capacity",
+    ("tier",),
+    callback=_scheduler_gauge("queued"),
+)
+metrics.gauge(
+    "clyre_llm_slots_in_use",
+    "Admitted requests holding tier capacity",
+    ("tier",),
+    callback=_scheduler_gauge("in_use"),
+)
+metrics.gauge(
+    "clyre_llm_pool_connections",
+    "Pooled HTTP connections to the tier's llama-servers, in use or idle",
+    ("tier", "state"),
+    callback=lambda: {
+        (tier.value, state): getattr(pipeline.pool_stats(), state)
+        for tier, pipeline in _instances.items()
+        for state in ("in_use", "idle")
+    },
+)
+metrics.gauge(
+    "clyre_llm_replica_in_flight",
+    "Outstanding requests per llama-server replica",
+    ("tier", "replica"),
+    callback=_replica_gauge("in_flight"),
+)
+metrics.gauge(
+    "clyre_llm_replica_ejected",
+    "1 while a llama-server replica is ejected as unhealthy, else 0",
+    ("tier", "replica"),
+    callback=_replica_gauge("healthy", lambda healthy: 0 if healthy else 1),
+)
+metrics.gauge(
+    "clyre_llm_prompt_cache_hit_ratio",
+    "Share of prompt tokens reused from the slot KV cache since startup",
+    ("tier",),
+    callback=lambda: {
+        (tier.value,): pipeline.prompt_cache_stats()["hit_ratio"]
+        for tier, pipeline in _instances.items()
+    },
+)
+metrics.gauge(
+    "clyre_llm_slot_affinity_total",
+    "Keyed requests served on their own slot (hits) or moved (misses), and slot "
+    "owners evicted, since startup",
+    ("tier", "outcome"),
+    callback=_affinity_gauge,
+)
+
+
 def get_inference_pipeline(role: Tier) -> LLMPipeline:
     if role not in _instances:
         base_url, model = _resolve_chat_tier(role)
-        _instances[role] = LLMPipeline(base_url, model)
+        _instances[role] = LLMPipeline(base_url, model, name=role.value)
     return _instances[role]
 
 
-__all__ = ["LLMPipeline", "Tier", "get_inference_pipeline"]
+async def close_inference_pipelines() -> None:
+    """Close every tier's pooled client (app shutdown)."""
+    for pipeline in _instances.values():
+        await pipeline.aclose()
+
+
+__all__ = [
+    "BudgetKind",
+    "CompletionUsage",
+    "GenerationBudget",
+    "LLMPipeline",
+    "Priority",
+    "StreamPhase",
+    "StreamPhases",
+    "StreamStalled",
+    "Tier",
+    "close_inference_pipelines",
+    "generation_budget",
+    "get_inference_pipeline",
+]
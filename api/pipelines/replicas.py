@@ -0,0 +1,140 @@
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Awaitable, Callable, Sequence
+from contextlib import asynccontextmanager
+
+import httpx
+
+Logger = logging.getLogger(__name__)
+Logger.setLevel(logging.INFO)
+
+# Backoff between /health probes of an ejected replica. Patchable in tests.
+PROBE_INTERVAL = 2.0
+PROBE_MAX_INTERVAL = 30.0
+
+HealthProbe = Callable[[str], Awaitable[bool]]
+
+
+def split_urls(base_url: str) -> list[str]:
+    """Parse a tier URL setting: one URL or a comma-separated replica list."""
+    urls = [url.strip().rstrip("/") for url in base_url.split(",")]
+    urls = [url for url in urls if url]
+    if not urls:
+        raise ValueError("at least one endpoint URL is required")
+    return urls
+
+
+def is_replica_failure(exc: BaseException) -> bool:
+    """Errors that say "this server is down", not "this request was bad"."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(
+        exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+    )
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.in_flight = 0
+        self.healthy = True
+        self.requests = 0
+        self.ejections = 0
+
+
+class ReplicaPool:
+    """Least-outstanding-requests balancing over the replicas of one backend.
+
+    A replica that fails at the transport level (or answers 5xx) is ejected and
+    probed on /health in the background until it recovers. When every replica
+    is ejected the pool still hands out the least-loaded one: failing fast is
+    the caller's decision, not the balancer's.
+    """
+
+    def __init__(self, urls: Sequence[str], probe: HealthProbe):
+        if not urls:
+            raise ValueError("at least one endpoint URL is required")
+        self._replicas = [Replica(url) for url in urls]
+        self._probe = probe
+        self._cursor = 0
+        self._probes: dict[str, asyncio.Task] = {}
+
+    @property
+    def replicas(self) -> list[Replica]:
+        return list(self._replicas)
+
+    def pick(self, prefer: Callable[[Replica], bool] | None = None) -> Replica:
+        candidates = [
+            replica for replica in self._replicas if replica.healthy
+        ] or self._replicas
+        if prefer is not None:
+            preferred = [replica for replica in candidates if prefer(replica)]
+            candidates = preferred or candidates
+        # Rotate the scan start so equally idle replicas share the load
+        # instead of the first one taking every tie.
+        start = self._cursor % len(candidates)
+        self._cursor += 1
+        rotated = candidates[start:] + candidates[:start]
+        return min(rotated, key=lambda replica: replica.in_flight)
+
+    @asynccontextmanager
+    async def lease(
+        self, prefer: Callable[[Replica], bool] | None = None
+    ) -> AsyncIterator[Replica]:
+        replica = self.pick(prefer)
+        replica.in_flight += 1
+        replica.requests += 1
+        try:
+            yield replica
+        except Exception as exc:
+            if is_replica_failure(exc):
+                self.eject(replica, reason=repr(exc))
+            raise
+        finally:
+            replica.in_flight -= 1
+
+    def eject(self, replica: Replica, reason: str = "") -> None:
+        if replica.healthy:
+            replica.healthy = False
+            replica.ejections += 1
+            Logger.warning("Ejecting replica %s (%s)", replica.url, reason)
+        if replica.url not in self._probes:
+            self._probes[replica.url] = asyncio.create_task(self._probe_until_healthy(replica))
+
+    async def _probe_until_healthy(self, replica: Replica) -> None:
+        delay = PROBE_INTERVAL
+        try:
+            while True:
+                await asyncio.sleep(delay)
+                try:
+                    ok = await self._probe(replica.url)
+                except Exception:
+                    ok = False
+                if ok:
+                    replica.healthy = True
+                    Logger.info("Replica %s recovered; re-admitted", replica.url)
+                    return
+                delay = min(delay * 2, PROBE_MAX_INTERVAL)
+        finally:
+            self._probes.pop(replica.url, None)
+
+    async def aclose(self) -> None:
+        probes = list(self._probes.values())
+        for task in probes:
+            task.cancel()
+        await asyncio.gather(*probes, return_exceptions=True)
+
+    def stats(self) -> list[dict[str, object]]:
+        return [
+            {
+                "url": replica.url,
+                "healthy": replica.healthy,
+                "in_flight": replica.in_flight,
+                "requests": replica.requests,
+                "ejections": replica.ejections,
+            }
+            for replica in self._replicas
+        ]
+
+
+__all__ = ["Replica", "ReplicaPool", "is_replica_failure", "split_urls"]
@@ -0,0 +1,255 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from enum import IntEnum
+
+Logger = logging.getLogger(__name__)
+Logger.setLevel(logging.INFO)
+
+QueuedCallback = Callable[[int], Awaitable[None]]
+
+
+class Priority(IntEnum):
+    """Admission classes, most urgent first."""
+
+    INTERACTIVE = 0
+    TITLE = 1
+    COMPACTION = 2
+    INGESTION = 3
+
+
+class _Waiter:
+    __slots__ = ("priority", "user_id", "seq", "granted", "position", "changed")
+
+    def __init__(self, priority: Priority, user_id: str | None, seq: int):
+        self.priority = priority
+        self.user_id = user_id
+        self.seq = seq
+        self.granted = False
+        # Last computed place in line; kept only for waiters with on_queued.
+        self.position = 0
+        self.changed = asyncio.Event()
+
+
+def _seq(waiter: _Waiter) -> int:
+    return waiter.seq
+
+
+class _Line:
+    """Waiters of one (priority, user) pair, in arrival order."""
+
+    __slots__ = ("items", "start")
+
+    def __init__(self) -> None:
+        self.items: list[_Waiter] = []
+        self.start = 0
+
+    def __len__(self) -> int:
+        return len(self.items) - self.start
+
+    def head(self) -> _Waiter:
+        return self.items[self.start]
+
+    def append(self, waiter: _Waiter) -> None:
+        self.items.append(waiter)
+
+    def popleft(self) -> _Waiter:
+        waiter = self.items[self.start]
+        self.start += 1
+        if self.start * 2 > len(self.items):
+            del self.items[: self.start]
+            self.start = 0
+        return waiter
+
+    def count_before(self, seq: int) -> int:
+        return bisect_left(self.items, seq, self.start, key=_seq) - self.start
+
+    def remove(self, waiter: _Waiter) -> None:
+        del self.items[self.start + self.count_before(waiter.seq)]
+
+
+class AdmissionScheduler:
+    """Bounded concurrency in front of one tier's llama-server(s).
+
+    `capacity` matches the parallel slots the tier serves, so requests beyond
+    it wait here instead of piling up inside llama-server. Waiters are ordered
+    by priority class, then by how many admitted requests their user already
+    holds (a user with a long burst yields to one with nothing running), then
+    by arrival.
+
+    Waiters sit in one FIFO line per (priority, user); a heap holds each
+    line's head keyed by that ordering. Entries go stale when the head or the
+    user's running count moves and are skipped when popped, so a release
+    costs O(log n) and wakes only the waiters it admits. Queue positions are
+    computed only for waiters that asked for them, line by line.
+    """
+
+    def __init__(self, capacity: int):
+        self._capacity = max(capacity, 1)
+        self._running: Counter[str | None] = Counter()
+        self._in_use = 0
+        self._lines: dict[tuple[Priority, str | None], _Line] = {}
+        self._heads: list[tuple[Priority, int, int, str | None]] = []
+        self._queued = 0
+        self._tracked: set[_Waiter] = set()
+        self._seq = itertools.count()
+        self._admitted = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def resize(self, capacity: int) -> None:
+        self._capacity = max(capacity, 1)
+        self._dispatch()
+
+    def _push_head(self, priority: Priority, user_id: str | None) -> None:
+        line = self._lines.get((priority, user_id))
+        if not line:
+            return
+        if len(self._heads) > 4 * len(self._lines) + 64:
+            # Mostly stale entries: rebuild from the live heads instead.
+            self._heads = [
+                (key[0], self._running[key[1]], other.head().seq, key[1])
+                for key, other in self._lines.items()
+            ]
+            heapq.heapify(self._heads)
+            return
+        entry = (priority, self._running[user_id], line.head().seq, user_id)
+        heapq.heappush(self._heads, entry)
+
+    def _user_changed(self, user_id: str | None) -> None:
+        # The user's running count is part of every one of its lines' keys.
+        for priority in Priority:
+            self._push_head(priority, user_id)
+
+    def _pop_next(self) -> _Waiter:
+        while True:
+            priority, running, seq, user_id = heapq.heappop(self._heads)
+            line = self._lines.get((priority, user_id))
+            if line is None or line.head().seq != seq or self._running[user_id] != running:
+                continue  # stale: that line's head or its user's count moved since
+            waiter = line.popleft()
+            if not line:
+                del self._lines[(waiter.priority, user_id)]
+            return waiter
+
+    def _enqueue(self, waiter: _Waiter, tracked: bool) -> None:
+        key = (waiter.priority, waiter.user_id)
+        line = self._lines.setdefault(key, _Line())
+        line.append(waiter)
+        self._queued += 1
+        if len(line) == 1:
+            self._push_head(*key)
+        if tracked:
+            self._tracked.add(waiter)
+
+    def _leave(self, waiter: _Waiter) -> None:
+        key = (waiter.priority, waiter.user_id)
+        line = self._lines[key]
+        was_head = line.head() is waiter
+        line.remove(waiter)
+        self._queued -= 1
+        self._tracked.discard(waiter)
+        if not line:
+            del self._lines[key]
+        elif was_head:
+            self._push_head(*key)
+
+    def position(self, waiter: _Waiter) -> int:
+        """1-based place in line under the current ordering."""
+        rank = (waiter.priority, self._running[waiter.user_id])
+        ahead = 0
+        for (priority, user_id), line in self._lines.items():
+            other = (priority, self._running[user_id])
+            if other < rank:
+                ahead += len(line)
+            elif other == rank:
+                ahead += line.count_before(waiter.seq)
+        return ahead + 1
+
+    def _dispatch(self) -> None:
+        while self._queued and self._in_use < self._capacity:
+            waiter = self._pop_next()
+            self._queued -= 1
+            self._tracked.discard(waiter)
+            waiter.granted = True
+            self._grant(waiter)
+        # Waiters that report their place may have moved up (or down, when a
+        # burst of higher priority arrived); wake only those whose place changed.
+        for waiter in self._tracked:
+            position = self.position(waiter)
+            if position != waiter.position:
+                waiter.position = position
+                waiter.changed.set()
+
+    def _grant(self, waiter: _Waiter) -> None:
+        self._in_use += 1
+        self._running[waiter.user_id] += 1
+        self._admitted += 1
+        self._user_changed(waiter.user_id)
+        waiter.changed.set()
+
+    def _release(self, user_id: str | None) -> None:
+        self._in_use -= 1
+        self._running[user_id] -= 1
+        if self._running[user_id] <= 0:
+            del self._running[user_id]
+        self._user_changed(user_id)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        priority: Priority = Priority.INTERACTIVE,
+        user_id: str | None = None,
+        on_queued: QueuedCallback | None = None,
+    ) -> AsyncIterator[None]:
+        """Hold one unit of tier capacity for the body of the block.
+
+        `on_queued(position)` runs when the request has to wait and again
+        whenever its position changes; it is never called for an immediate
+        admission.
+        """
+        waiter = _Waiter(priority, user_id, next(self._seq))
+        if self._in_use < self._capacity and not self._queued:
+            self._grant(waiter)
+        else:
+            self._enqueue(waiter, tracked=on_queued is not None)
+            self._dispatch()
+            reported = 0
+            try:
+                while not waiter.granted:
+                    waiter.changed.clear()
+                    if on_queued is not None and waiter.position != reported:
+                        reported = waiter.position
+                        await on_queued(reported)
+                    if not waiter.granted and not waiter.changed.is_set():
+                        await waiter.changed.wait()
+            except BaseException:
+                if waiter.granted:
+                    self._release(user_id)
+                else:
+                    self._leave(waiter)
+                    self._dispatch()
+                raise
+        try:
+            yield
+        finally:
+            self._release(user_id)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "capacity": self._capacity,
+            "in_use": self._in_use,
+            "queued": self._queued,
+            "admitted": self._admitted,
+        }
+
+
+__all__ = ["AdmissionScheduler", "Priority", "QueuedCallback"]
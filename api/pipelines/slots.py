@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+
+class SlotAffinity:
+    """Thread -> slot table for one llama-server.
+
+    A slot keeps the KV cache of the last prompt it processed, so sending a
+    thread's next turn to the same `id_slot` lets llama-server reuse the whole
+    shared prefix. Owners are kept in LRU order: with more threads than slots
+    the least recently served thread loses its slot first. Keyless requests
+    (titles, one-off calls) take free slots nobody owns before evicting one.
+
+    `hits` counts keyed requests served on their own slot, `misses` keyed
+    requests that had to move (first turn, slot busy or lost) and `evictions`
+    owners dropped to make room.
+    """
+
+    def __init__(self, n_slots: int):
+        self._n_slots = max(n_slots, 1)
+        self._owners: OrderedDict[str, int] = OrderedDict()
+        self._busy: set[int] = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def n_slots(self) -> int:
+        return self._n_slots
+
+    def resize(self, n_slots: int) -> None:
+        self._n_slots = max(n_slots, 1)
+        for key, slot in list(self._owners.items()):
+            if slot >= self._n_slots:
+                del self._owners[key]
+
+    def holds(self, key: str | None) -> bool:
+        return key is not None and key in self._owners
+
+    def acquire(self, key: str | None) -> int | None:
+        """Reserve a slot for one request; None when every slot is busy.
+
+        The preferred (owned) slot wins when free; otherwise any free slot is
+        taken over and the key moves there, since the new slot is where its
+        prefix will live after this request.
+        """
+        preferred = self._owners.get(key) if key is not None else None
+        if preferred is not None and preferred not in self._busy:
+            self._owners.move_to_end(key)  # type: ignore[arg-type]
+            self._busy.add(preferred)
+            self.hits += 1
+            return preferred
+
+        free = [slot for slot in range(self._n_slots) if slot not in self._busy]
+        if not free:
+            return None
+        if key is not None:
+            self.misses += 1
+
+        owned = set(self._owners.values())
+        slot = next((slot for slot in free if slot not in owned), None)
+        if slot is None:
+            # Every free slot holds someone's prefix: evict the least recently used.
+            slot = next(slot for slot in self._owners.values() if slot in free)
+            for owner, owned_slot in list(self._owners.items()):
+                if owned_slot == slot:
+                    del self._owners[owner]
+                    self.evictions += 1
+                    break
+
+        if key is not None:
+            self._owners.pop(key, None)
+            self._owners[key] = slot
+        self._busy.add(slot)
+        return slot
+
+    def release(self, slot: int | None) -> None:
+        if slot is not None:
+            self._busy.discard(slot)
+
+
+@dataclass
+class PromptCacheStats:
+    """Prompt-cache effectiveness from llama-server `timings` blocks.
+
+    `cache_n` counts prompt tokens reused from the slot's KV cache and
+    `prompt_n` the tokens that still had to be prefilled.
+    """
+
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+
+    def record(self, timings: dict[str, Any] | None) -> None:
+        if not timings:
+            return
+        self.requests += 1
+        self.prompt_tokens += int(timings.get("prompt_n") or 0)
+        self.cached_tokens += int(timings.get("cache_n") or 0)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.prompt_tokens + self.cached_tokens
+        return self.cached_tokens / total if total else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "hit_ratio": self.hit_ratio,
+        }
+
+
+__all__ = ["PromptCacheStats", "SlotAffinity"]
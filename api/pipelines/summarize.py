@@ -0,0 +1,111 @@
+import logging
+import math
+
+from pipelines.inference import LLMPipeline, Priority, Tier, get_inference_pipeline
+
+Logger = logging.getLogger(__name__)
+Logger.setLevel(logging.INFO)
+
+# Instructions, separators and the previous summary's framing around each
+# piece, on top of the piece and the previous summary themselves.
+PROMPT_OVERHEAD_TOKENS = 256
+# Never split text into pieces smaller than this, even on a tiny window.
+MIN_PIECE_TOKENS = 256
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain the running summary of a conversation between a user and an "
+    "assistant. Merge the new excerpt into the summary so far and return only the "
+    "updated summary, in the language of the conversation. Keep names, numbers, "
+    "decisions, open questions and the user's stated preferences; drop small talk. "
+    "Stay under about {words} words."
+)
+
+
+def split_text(text: str, pieces: int) -> list[str]:
+    """Cut `text` into about `pieces` parts of similar length, on line breaks
+    where possible."""
+    if pieces <= 1:
+        return [text]
+    limit = math.ceil(len(text) / pieces)
+    parts: list[str] = []
+    current = ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + len(line) > limit:
+            parts.append(current)
+            current = ""
+        current += line
+    if current:
+        parts.append(current)
+    return parts
+
+
+async def _fold(
+    llama: LLMPipeline,
+    piece: str,
+    previous: str | None,
+    target_tokens: int,
+    user_id: str | None,
+    piece_tokens: int,
+) -> str:
+    # Roughly 0.75 words per token for the instruction; max_tokens is the
+    # hard cap.
+    system = SUMMARY_INSTRUCTIONS.format(words=max(target_tokens * 3 // 4, 1))
+    content = f"New excerpt:\n{piece}"
+    if previous:
+        content = f"Summary so far:\n{previous}\n\n{content}"
+    # Sizes the request's deadline; the previous summary is at most
+    # target_tokens long.
+    prompt_tokens = piece_tokens + PROMPT_OVERHEAD_TOKENS + (target_tokens if previous else 0)
+    response = await llama.chat_completion_sync(
+        [{"role": "system", "content": system}, {"role": "user", "content": content}],
+        temperature=0.2,
+        enable_thinking=False,
+        priority=Priority.COMPACTION,
+        user_id=user_id,
+        max_tokens=target_tokens,
+        prompt_tokens=prompt_tokens,
+    )
+    return (response["choices"][0]["message"]["content"] or "").strip()
+
+
+async def summarize(
+    text: str,
+    target_tokens: int,
+    previous: str | None = None,
+    user_id: str | None = None,
+    llama: LLMPipeline | None = None,
+) -> str:
+    """Summarize `text` into about `target_tokens` tokens on the SMALL tier.
+
+    `previous` is an existing summary to extend, so a rolling summary only
+    ever reads the new text. Text that does not fit the model's window next
+    to the summary is folded in piece by piece; sizes come from /tokenize.
+    """
+    llama = llama or get_inference_pipeline(Tier.SMALL)
+    [tokens] = await llama.count_tokens_many(
+        [text], priority=Priority.COMPACTION, user_id=user_id
+    )
+    # The previous summary and the answer each take up to target_tokens.
+    room = llama.context_tokens - 2 * target_tokens - PROMPT_OVERHEAD_TOKENS
+    room = max(room, MIN_PIECE_TOKENS)
+    pieces = split_text(text, math.ceil(tokens / room))
+    summary = previous
+    piece_tokens = math.ceil(tokens / len(pieces))
+    for piece in pieces:
+        summary = await _fold(llama, piece, summary, target_tokens, user_id, piece_tokens)
+    Logger.debug(
+        "Summarized %d tokens in %d piece(s) into %d chars",
+        tokens,
+        len(pieces),
+        len(summary or ""),
+    )
+    return summary or ""
+
+
+__all__ = ["split_text", "summarize"]
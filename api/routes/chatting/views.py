@@ -1,7 +1,7 @@
 import logging
 from typing import Annotated
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException
 from fastapi.params import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.requests import Request
@@ -73,17 +73,85 @@ async def stream_response(
             enable_thinking=request.enable_thinking,
         )
 
-        async def stream():
-            async for line in run.subscribe(offset):
-                yield line
-
-        return StreamingResponse(stream(), media_type="application/x-ndjson")
+        return StreamingResponse(run.stream(offset), media_type="application/x-ndjson")
     except GenerationConflict as exc:
         raise HTTPException(status_code=409, detail=str(exc)) from exc
     except ValueError:
         raise HTTPException(status_code=400, detail="Thread not found")
 
 
+def _sse_frame(event_id: int, line: str) -> str:
+    # `id` is the offset of the NEXT event, so a reconnect's Last-Event-ID is
+    # directly the offset to resume from.
+    return f"id: {event_id}\ndata: {line.rstrip()}\n\n"
+
+
+async def _attach(session: AsyncSession, thread_id: str, user_id: str):
+    try:
+        run = await chatting_sc.attach_generation(session, thread_id, user_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Thread not found")
+    if run is None:
+        raise HTTPException(status_code=404, detail="No generation for this thread")
+    return run
+
+
+@chat_router.get("/{thread_id}/events")
+async def generation_events(
+    thread_id: str,
+    token_payload: Annotated[TokenPayload, Depends(web.extract_access_token)],
+    session: Annotated[AsyncSession, Depends(get_db_session)],
+    offset: int = 0,
+):
+    """Re-attach to a thread's run: NDJSON events from `offset` until terminal."""
+    Logger.info(
+        "chat_events request from %s for thread %s (offset=%s)",
+        token_payload.user_id,
+        thread_id,
+        offset,
+    )
+    run = await _attach(session, thread_id, token_payload.user_id)
+    return StreamingResponse(run.stream(offset), media_type="application/x-ndjson")
+
+
+@chat_router.get("/{thread_id}/events/sse")
+async def generation_events_sse(
+    thread_id: str,
+    token_payload: Annotated[TokenPayload, Depends(web.extract_access_token)],
+    session: Annotated[AsyncSession, Depends(get_db_session)],
+    offset: int = 0,
+    last_event_id: Annotated[str | None, Header()] = None,
+):
+    """SSE variant of the events endpoint; `Last-Event-ID` overrides `offset`."""
+    if last_event_id:
+        try:
+            offset = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Malformed Last-Event-ID")
+    Logger.info(
+        "chat_events_sse request from %s for thread %s (offset=%s)",
+        token_payload.user_id,
+        thread_id,
+        offset,
+    )
+    run = await _attach(session, thread_id, token_payload.user_id)
+
+    async def stream():
+        event_id = max(offset, 0)
+        async for batch in run.subscribe_batches(event_id):
+            frames = []
+            for line in batch:
+                event_id += 1
+                frames.append(_sse_frame(event_id, line))
+            yield "".join(frames)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @chat_router.post("/stop")
 async def stop_generation(
     request: ThreadRequest,
@@ -103,7 +171,7 @@ async def stop_generation(
         )
         raise HTTPException(status_code=404, detail="Thread not found")
 
-    if not chatting_sc.stop_generation(request.thread_id):
+    if not await chatting_sc.stop_generation(request.thread_id):
         raise HTTPException(status_code=409, detail="No active generation for this thread")
 
     return {"result": "stopping"}
@@ -127,11 +195,7 @@ async def retry_generation(
             enable_thinking=request.enable_thinking,
         )
 
-        async def stream():
-            async for line in run.subscribe(0):
-                yield line
-
-        return StreamingResponse(stream(), media_type="application/x-ndjson")
+        return StreamingResponse(run.stream(0), media_type="application/x-ndjson")
     except GenerationConflict as exc:
         raise HTTPException(status_code=409, detail=str(exc)) from exc
     except ValueError:
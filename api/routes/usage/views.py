@@ -0,0 +1,42 @@
+import datetime
+import logging
+from typing import Annotated
+
+from fastapi import APIRouter, HTTPException
+from fastapi.params import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from crud.generation import UsageBucket
+from db import get_db_session
+from schemas.general import TokenPayload
+from schemas.usage import GetUsageResponse
+from services.usage import UsageService
+from utils import web
+
+Logger = logging.getLogger(__name__)
+Logger.setLevel(logging.INFO)
+usage_router = APIRouter(tags=["usage"])
+
+usage_sc = UsageService()
+
+
+@usage_router.get("", response_model=GetUsageResponse)
+async def generation_usage(
+    token_payload: Annotated[TokenPayload, Depends(web.extract_access_token)],
+    session: Annotated[AsyncSession, Depends(get_db_session)],
+    since: datetime.datetime | None = None,
+    until: datetime.datetime | None = None,
+    bucket: UsageBucket = "day",
+    user_id: str | None = None,
+    model: str | None = None,
+    all_users: bool = False,
+):
+    Logger.info("Usage report requested by user %s", token_payload.user_id)
+    try:
+        return await usage_sc.report(
+            session, token_payload.user_id, since, until, bucket, user_id, model, all_users
+        )
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e)) from e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
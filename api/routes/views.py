@@ -3,13 +3,17 @@ import os
 from datetime import UTC, datetime
 
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 
+from pipelines.breaker import BreakerState, breaker_stats
 from routes.auth.views import auth_router
 from routes.chatting.views import chat_router
 from routes.files.views import files_router
 from routes.projects.views import projects_router
 from routes.thread.views import thread_router
+from routes.usage.views import usage_router
 from routes.user.views import user_router
+from utils import metrics
 
 Logger = logging.getLogger(__name__)
 Logger.setLevel(logging.INFO)
@@ -21,12 +25,28 @@ api_router.include_router(files_router, prefix="/files")
 api_router.include_router(projects_router, prefix="/projects")
 api_router.include_router(user_router, prefix="/user")
 api_router.include_router(thread_router, prefix="/thread")
+api_router.include_router(usage_router, prefix="/usage")
 
 
 @api_router.get("/health", tags=["api"])
-def health():
+async def health():
+    # async for the same reason as /metrics: breakers live on the event loop.
     logging.info("Health check")
-    return {"status": "ok", "time": datetime.now(UTC).isoformat()}
+    backends = breaker_stats()
+    degraded = any(b["state"] != BreakerState.CLOSED.value for b in backends.values())
+    return {
+        "status": "degraded" if degraded else "ok",
+        "time": datetime.now(UTC).isoformat(),
+        "backends": backends,
+    }
+
+
+@api_router.get("/metrics", tags=["api"], response_class=PlainTextResponse)
+async def metrics_exposition():
+    # async on purpose: the registry is only ever touched on the event loop.
+    return PlainTextResponse(
+        metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
 
 
 @api_router.get("/version", tags=["api"])
@@ -1,3 +1,4 @@
+from json.encoder import encode_basestring
 from typing import Annotated, Literal
 
 from annotated_types import MinLen
@@ -30,3 +31,91 @@ class StreamingBlock(BaseModel):
         "done",
     ]
     thread_id: Annotated[str | None, Field(serialization_alias="threadId")] = None
+
+
+ChunkEvent = Literal["new_chunk", "new_thinking_chunk"]
+
+# Chunk lines are by far the most frequent event and have a fixed shape, so
+# they skip the model round trip. Byte-identical to
+# StreamingBlock(chunk=..., event=...).model_dump_json(by_alias=True) + "\n".
+_CHUNK_LINE_SUFFIX: dict[str, str] = {
+    event: f',"event":"{event}","threadId":null}}\n'
+    for event in ("new_chunk", "new_thinking_chunk")
+}
+
+
+def encode_chunk_line(event: ChunkEvent, chunk: str) -> str:
+    return '{"chunk":' + encode_basestring(chunk) + _CHUNK_LINE_SUFFIX[event]
+
+
+class QueuedBlock(BaseModel):
+    """Sent while a generation waits for tier capacity; `position` is 1-based."""
+
+    event: Literal["queued"] = "queued"
+    position: int
+    thread_id: Annotated[str | None, Field(serialization_alias="threadId")] = None
+
+
+class ContextUsageBlock(BaseModel):
+    """Sent before generation: the prompt's size against the model's window.
+
+    `omitted_messages` counts the oldest turns left out to fit the budget.
+    """
+
+    event: Literal["context_usage"] = "context_usage"
+    prompt_tokens: Annotated[int, Field(serialization_alias="promptTokens")]
+    context_tokens: Annotated[int, Field(serialization_alias="contextTokens")]
+    omitted_messages: Annotated[int, Field(serialization_alias="omittedMessages")] = 0
+    thread_id: Annotated[str | None, Field(serialization_alias="threadId")] = None
+
+
+class ContextCompactedBlock(BaseModel):
+    """Sent on the first turn whose prompt carries a newly compacted summary.
+
+    `summarized_messages` of the thread's oldest messages are sent as a
+    summary of `summary_tokens` tokens instead of verbatim.
+    """
+
+    event: Literal["context_compacted"] = "context_compacted"
+    summarized_messages: Annotated[int, Field(serialization_alias="summarizedMessages")]
+    summary_tokens: Annotated[int, Field(serialization_alias="summaryTokens")]
+    thread_id: Annotated[str | None, Field(serialization_alias="threadId")] = None
+
+
+class BudgetExhaustedBlock(BaseModel):
+    """Sent when the generation ran out of its token budget.
+
+    `kind` "reasoning": thinking reached `limit_tokens` and the model was
+    switched to answering; "length": the answer was cut off at the
+    completion's `limit_tokens`.
+    """
+
+    event: Literal["budget_exhausted"] = "budget_exhausted"
+    kind: Literal["reasoning", "length"]
+    limit_tokens: Annotated[int, Field(serialization_alias="limitTokens")]
+    thread_id: Annotated[str | None, Field(serialization_alias="threadId")] = None
+
+
+class GenerationErrorBlock(BaseModel):
+    """Sent before the terminal events of a failed generation.
+
+    `code` "backend_unavailable": the model server's circuit is open, so the
+    turn failed at once without a request; retrying makes sense after
+    `retry_after_seconds`. "generation_failed": any other failure.
+    """
+
+    event: Literal["generation_error"] = "generation_error"
+    code: Literal["backend_unavailable", "generation_failed"]
+    message: str
+    retry_after_seconds: Annotated[
+        float | None, Field(serialization_alias="retryAfterSeconds")
+    ] = None
+    thread_id: Annotated[str | None, Field(serialization_alias="threadId")] = None
+
+
+class ThreadTitleBlock(BaseModel):
+    """Sent once the background title generation for a new thread has landed."""
+
+    event: Literal["thread_title_update"] = "thread_title_update"
+    title: str
+    thread_id: Annotated[str | None, Field(serialization_alias="threadId")] = None
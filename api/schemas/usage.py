@@ -0,0 +1,34 @@
+import datetime
+from typing import Annotated, Literal
+
+from pydantic import BaseModel, Field
+
+
+class UsageRow(BaseModel):
+    period: datetime.datetime
+    user_id: Annotated[str, Field(serialization_alias="userId")]
+    model: str | None
+    runs: int
+    prompt_tokens: Annotated[int, Field(serialization_alias="promptTokens")]
+    completion_tokens: Annotated[int, Field(serialization_alias="completionTokens")]
+    cached_tokens: Annotated[int, Field(serialization_alias="cachedTokens")]
+    cache_hit_rate: Annotated[float | None, Field(serialization_alias="cacheHitRate")]
+    decode_tokens_per_second: Annotated[
+        float | None, Field(serialization_alias="decodeTokensPerSecond")
+    ]
+    prefill_tokens_per_second: Annotated[
+        float | None, Field(serialization_alias="prefillTokensPerSecond")
+    ]
+    avg_ttft_ms: Annotated[float | None, Field(serialization_alias="avgTtftMs")]
+    max_ttft_ms: Annotated[float | None, Field(serialization_alias="maxTtftMs")]
+    avg_duration_ms: Annotated[float | None, Field(serialization_alias="avgDurationMs")]
+
+
+class GetUsageResponse(BaseModel):
+    since: datetime.datetime
+    until: datetime.datetime
+    bucket: Literal["hour", "day"]
+    buckets: list[UsageRow]
+
+
+__all__ = ["GetUsageResponse", "UsageRow"]
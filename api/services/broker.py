@@ -0,0 +1,545 @@
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import os
+from collections.abc import Callable
+from typing import IO, Any
+
+from services.generation import (
+    GenerationRun,
+    GenerationStatus,
+    get_run,
+    set_registry_link,
+    sweep_interrupted_runs,
+)
+from utils import env
+
+Logger = logging.getLogger(__name__)
+
+# Seconds between attempts to reach (or take over) the broker. Patchable in tests.
+BROKER_RETRY_SECONDS = 0.5
+
+# How long a claim, stop or attach waits for the broker before giving up on
+# it. Patchable in tests.
+BROKER_TIMEOUT_SECONDS = 5.0
+
+# After taking over from a dead broker, surviving workers get this long to
+# re-claim their runs before orphaned journal rows are swept. Patchable in tests.
+BROKER_RECLAIM_SECONDS = 5.0
+
+DEFAULT_BROKER_SOCKET = "./data/generation-broker.sock"
+
+# Frames carry single NDJSON event lines; the asyncio default (64 KiB) is too
+# tight for a long coalesced frame.
+_LINE_LIMIT = 16 * 1024 * 1024
+
+Message = dict[str, Any]
+
+
+def _frame(message: Message) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class _Peer:
+    """Broker-side end of one worker's connection."""
+
+    __slots__ = ("writer", "owned")
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.owned: set[str] = set()
+
+    def send(self, message: Message) -> None:
+        if not self.writer.is_closing():
+            self.writer.write(_frame(message))
+
+
+class Broker:
+    """Routing hub for the API workers of one host, served on a Unix socket.
+
+    Knows which worker owns each thread's run and whether it is still
+    generating, forwards stop requests to the owner and relays event feeds
+    from the owner to workers whose clients subscribed elsewhere. It holds
+    no events itself. Hosted inside whichever worker holds the election lock.
+    """
+
+    def __init__(self) -> None:
+        # thread id -> (owning worker, still generating)
+        self._owners: dict[str, tuple[_Peer, bool]] = {}
+        # forwarded stop id -> (requester, its request id, owner asked)
+        self._stops: dict[int, tuple[_Peer, int, _Peer]] = {}
+        # feed id -> (subscriber, its subscription id, owner feeding it)
+        self._feeds: dict[int, tuple[_Peer, int, _Peer]] = {}
+        self._feed_ids: dict[tuple[_Peer, int], int] = {}
+        self._peers: set[_Peer] = set()
+        self._ids = itertools.count(1)
+        self._server: asyncio.AbstractServer | None = None
+
+    def active_threads(self) -> set[str]:
+        return {thread for thread, (_, active) in self._owners.items() if active}
+
+    async def start(self, path: str) -> None:
+        self._server = await asyncio.start_unix_server(self._serve, path, limit=_LINE_LIMIT)
+
+    async def aclose(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        for peer in list(self._peers):
+            peer.writer.close()
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = _Peer(writer)
+        self._peers.add(peer)
+        try:
+            while line := await reader.readline():
+                self._handle(peer, json.loads(line))
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self._peers.discard(peer)
+            self._drop(peer)
+            writer.close()
+
+    def _handle(self, peer: _Peer, message: Message) -> None:
+        op = message["op"]
+        if op == "claim":
+            self._claim(peer, message["thread"], message["id"])
+        elif op == "finished":
+            owner = self._owners.get(message["thread"])
+            if owner is not None and owner[0] is peer:
+                self._owners[message["thread"]] = (peer, False)
+        elif op == "release":
+            owner = self._owners.get(message["thread"])
+            if owner is not None and owner[0] is peer:
+                del self._owners[message["thread"]]
+                peer.owned.discard(message["thread"])
+        elif op == "stop":
+            owner = self._owners.get(message["thread"])
+            if owner is None or not owner[1]:
+                peer.send({"op": "reply", "id": message["id"], "ok": False})
+                return
+            forward = next(self._ids)
+            self._stops[forward] = (peer, message["id"], owner[0])
+            owner[0].send({"op": "stop", "id": forward, "thread": message["thread"]})
+        elif op == "reply":
+            pending = self._stops.pop(message["id"], None)
+            if pending is not None:
+                pending[0].send({"op": "reply", "id": pending[1], "ok": message["ok"]})
+        elif op == "subscribe":
+            self._subscribe(peer, message["thread"], message["sub"], message["offset"])
+        elif op == "events":
+            entry = self._feeds.get(message["feed"])
+            if entry is not None:
+                entry[0].send({"op": "events", "sub": entry[1], "lines": message["lines"]})
+        elif op == "end":
+            entry = self._feeds.pop(message["feed"], None)
+            if entry is not None:
+                self._feed_ids.pop((entry[0], entry[1]), None)
+                entry[0].send({"op": "end", "sub": entry[1], "status": message["status"]})
+
+    def _claim(self, peer: _Peer, thread: str, request_id: int) -> None:
+        # The same worker may re-claim; another one only once the owner's run
+        # stopped generating (its replay log is then simply superseded).
+        owner = self._owners.get(thread)
+        ok = owner is None or owner[0] is peer or not owner[1]
+        if ok:
+            if owner is not None:
+                owner[0].owned.discard(thread)
+            self._owners[thread] = (peer, True)
+            peer.owned.add(thread)
+        peer.send({"op": "reply", "id": request_id, "ok": ok})
+
+    def _subscribe(self, peer: _Peer, thread: str, sub: int, offset: int) -> None:
+        owner = self._owners.get(thread)
+        if owner is None:
+            peer.send({"op": "end", "sub": sub, "status": None})
+            return
+        feed = next(self._ids)
+        self._feeds[feed] = (peer, sub, owner[0])
+        self._feed_ids[(peer, sub)] = feed
+        owner[0].send({"op": "feed", "feed": feed, "thread": thread, "offset": offset})
+
+    def _drop(self, peer: _Peer) -> None:
+        for thread in peer.owned:
+            if self._owners.get(thread, (None,))[0] is peer:
+                del self._owners[thread]
+        for feed, (subscriber, sub, owner) in list(self._feeds.items()):
+            if subscriber is peer:
+                del self._feeds[feed]
+                self._feed_ids.pop((subscriber, sub), None)
+                owner.send({"op": "unfeed", "feed": feed})
+            elif owner is peer:
+                # The owner's process is gone, and its run with it.
+                del self._feeds[feed]
+                self._feed_ids.pop((subscriber, sub), None)
+                subscriber.send(
+                    {"op": "end", "sub": sub, "status": GenerationStatus.INTERRUPTED.value}
+                )
+        for forward, (requester, request_id, owner) in list(self._stops.items()):
+            if requester is peer or owner is peer:
+                del self._stops[forward]
+                if owner is peer:
+                    requester.send({"op": "reply", "id": request_id, "ok": False})
+
+
+class BrokerLink:
+    """One worker's connection to the host's generation broker.
+
+    Every worker holds one link. The worker that wins the lock file next to
+    the socket also hosts the Broker; when it dies the lock is released, a
+    surviving worker takes over, and every link reconnects, re-claims the
+    runs it owns and resumes its remote feeds from the events it already has.
+    Runs watched from another worker are mirrored into a local GenerationRun,
+    so any number of local subscribers share one feed.
+    """
+
+    def __init__(self, path: str, lookup: Callable[[str], GenerationRun | None] = get_run):
+        self._path = path
+        self._lookup = lookup
+        self._broker: Broker | None = None
+        self._lock_file: IO[str] | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._connected = asyncio.Event()
+        self._ids = itertools.count(1)
+        self._replies: dict[int, asyncio.Future[bool | None]] = {}
+        # Threads this worker owns a run for, and those still generating.
+        self._owned: set[str] = set()
+        self._active: set[str] = set()
+        # Owner side: feeds this worker serves to others.
+        self._feeds: dict[int, asyncio.Task] = {}
+        # Subscriber side: mirrors of runs owned elsewhere.
+        self._mirrors: dict[str, GenerationRun] = {}
+        self._subs: dict[int, GenerationRun] = {}
+        self._found: dict[str, asyncio.Future[bool]] = {}
+        self._task: asyncio.Task | None = None
+        self._sweeper: asyncio.Task | None = None
+
+    @property
+    def hosting(self) -> bool:
+        return self._broker is not None
+
+    def active_threads(self) -> set[str]:
+        """Threads generating anywhere on the host (meaningful on the host only)."""
+        return self._broker.active_threads() if self._broker is not None else set()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._maintain())
+        if not await self._wait_connected():
+            Logger.warning("Generation broker at %s not reachable yet", self._path)
+
+    async def aclose(self) -> None:
+        for task in (self._task, self._sweeper, *self._feeds.values()):
+            if task is not None and not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if self._writer is not None:
+            self._writer.close()
+        if self._broker is not None:
+            await self._broker.aclose()
+            self._broker = None
+            # Unlink before the lock goes: afterwards the path may already
+            # belong to the next host.
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self._path)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def _maintain(self) -> None:
+        initial = True
+        while True:
+            try:
+                await self._elect(initial)
+                reader, writer = await asyncio.open_unix_connection(
+                    self._path, limit=_LINE_LIMIT
+                )
+            except OSError as exc:
+                Logger.debug("Generation broker unavailable: %s", exc)
+            else:
+                self._writer = writer
+                self._resume()
+                self._connected.set()
+                try:
+                    while line := await reader.readline():
+                        await self._handle(json.loads(line))
+                except (ConnectionError, ValueError):
+                    pass
+                finally:
+                    self._connected.clear()
+                    self._writer = None
+                    writer.close()
+                    self._disconnected()
+                Logger.warning("Lost the generation broker at %s; reconnecting", self._path)
+            initial = False
+            await asyncio.sleep(BROKER_RETRY_SECONDS)
+
+    async def _elect(self, initial: bool) -> None:
+        if self._broker is not None or not self._try_lock():
+            return
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self._path)  # left behind by a dead host
+        broker = Broker()
+        await broker.start(self._path)
+        self._broker = broker
+        Logger.info("Hosting the generation broker at %s", self._path)
+        if not initial:
+            self._sweeper = asyncio.create_task(self._sweep_after_takeover())
+
+    def _try_lock(self) -> bool:
+        import fcntl  # Unix only, like the socket itself
+
+        if self._lock_file is None:
+            self._lock_file = open(f"{self._path}.lock", "a+")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    async def _sweep_after_takeover(self) -> None:
+        # The dead host's runs are orphans; everyone else's are re-claimed
+        # within the grace period and kept.
+        await asyncio.sleep(BROKER_RECLAIM_SECONDS)
+        try:
+            await sweep_interrupted_runs(keep=self.active_threads)
+        except Exception:
+            Logger.exception("Sweep after broker takeover failed")
+
+    def _send(self, message: Message) -> None:
+        if self._writer is not None and not self._writer.is_closing():
+            self._writer.write(_frame(message))
+
+    def _resume(self) -> None:
+        for thread in self._owned:
+            self._send({"op": "claim", "id": 0, "thread": thread})
+            if thread not in self._active:
+                self._send({"op": "finished", "thread": thread})
+        for mirror in self._mirrors.values():
+            self._follow(mirror)
+
+    def _disconnected(self) -> None:
+        for future in self._replies.values():
+            if not future.done():
+                future.set_result(None)
+        for task in self._feeds.values():
+            task.cancel()
+        self._feeds.clear()
+        self._subs.clear()
+        for future in self._found.values():
+            if not future.done():
+                future.set_result(False)
+
+    async def _handle(self, message: Message) -> None:
+        op = message["op"]
+        if op == "reply":
+            future = self._replies.get(message["id"])
+            if future is not None and not future.done():
+                future.set_result(message["ok"])
+        elif op == "stop":
+            run = self._lookup(message["thread"])
+            ok = run is not None and run.request_stop()
+            Logger.info("Stop from another worker thread=%s stopped=%s", message["thread"], ok)
+            self._send({"op": "reply", "id": message["id"], "ok": ok})
+        elif op == "feed":
+            self._feeds[message["feed"]] = asyncio.create_task(
+                self._serve_feed(message["feed"], message["thread"], message["offset"])
+            )
+        elif op == "unfeed":
+            task = self._feeds.pop(message["feed"], None)
+            if task is not None:
+                task.cancel()
+        elif op == "events":
+            mirror = self._subs.get(message["sub"])
+            if mirror is not None:
+                self._resolve(mirror.thread_id, True)
+                mirror.publish_many(message["lines"])
+        elif op == "end":
+            mirror = self._subs.pop(message["sub"], None)
+            if mirror is not None:
+                await self._end_mirror(mirror, message["status"])
+
+    async def _serve_feed(self, feed: int, thread_id: str, offset: int) -> None:
+        run = self._lookup(thread_id)
+        try:
+            status = None
+            if run is not None:
+                # Unbounded: a cut-off feed would read as the end of the run.
+                async for lines in run.subscribe_batches(offset, bounded=False):
+                    self._send({"op": "events", "feed": feed, "lines": lines})
+                    if self._writer is not None:
+                        await self._writer.drain()
+                status = run.status.value
+            self._send({"op": "end", "feed": feed, "status": status})
+        finally:
+            if self._feeds.get(feed) is asyncio.current_task():
+                del self._feeds[feed]
+
+    def _follow(self, mirror: GenerationRun) -> None:
+        sub = next(self._ids)
+        self._subs[sub] = mirror
+        self._send(
+            {
+                "op": "subscribe",
+                "sub": sub,
+                "thread": mirror.thread_id,
+                "offset": mirror.events_count,
+            }
+        )
+
+    def _resolve(self, thread_id: str, found: bool) -> None:
+        future = self._found.pop(thread_id, None)
+        if future is not None and not future.done():
+            future.set_result(found)
+
+    async def _end_mirror(self, mirror: GenerationRun, status: str | None) -> None:
+        self._resolve(mirror.thread_id, status is not None or mirror.events_count > 0)
+        # Finished mirrors are not kept: a later attach asks the owner again,
+        # which also notices a newer run on the thread.
+        if self._mirrors.get(mirror.thread_id) is mirror:
+            del self._mirrors[mirror.thread_id]
+        await mirror.finish(GenerationStatus(status or GenerationStatus.INTERRUPTED.value))
+
+    async def _wait_connected(self) -> bool:
+        if self._connected.is_set():
+            return True
+        try:
+            await asyncio.wait_for(self._connected.wait(), BROKER_TIMEOUT_SECONDS)
+        except TimeoutError:
+            return False
+        return True
+
+    async def _request(self, message: Message) -> bool | None:
+        """Send a request and wait for its reply; None when the broker is unreachable."""
+        if not await self._wait_connected():
+            return None
+        request_id = next(self._ids)
+        future: asyncio.Future[bool | None] = asyncio.get_running_loop().create_future()
+        self._replies[request_id] = future
+        self._send({**message, "id": request_id})
+        try:
+            return await asyncio.wait_for(future, BROKER_TIMEOUT_SECONDS)
+        except TimeoutError:
+            return None
+        finally:
+            self._replies.pop(request_id, None)
+
+    async def claim(self, thread_id: str) -> bool:
+        """Register this worker as the thread's generating owner; False on conflict."""
+        ok = await self._request({"op": "claim", "thread": thread_id})
+        if ok is None:
+            # The journal check still guards the thread; refusing every send
+            # while the broker fails over would be worse.
+            Logger.warning("Generation broker unreachable; claim skipped thread=%s", thread_id)
+            ok = True
+        if ok:
+            self._owned.add(thread_id)
+            self._active.add(thread_id)
+        return ok
+
+    def finished(self, thread_id: str) -> None:
+        """The local run stopped generating but still serves its replay log."""
+        if thread_id in self._active:
+            self._active.discard(thread_id)
+            self._send({"op": "finished", "thread": thread_id})
+
+    def released(self, thread_id: str) -> None:
+        if thread_id in self._owned:
+            self._owned.discard(thread_id)
+            self._active.discard(thread_id)
+            self._send({"op": "release", "thread": thread_id})
+
+    async def stop(self, thread_id: str) -> bool:
+        return bool(await self._request({"op": "stop", "thread": thread_id}))
+
+    async def attach(self, thread_id: str) -> GenerationRun | None:
+        """A local mirror of the thread's run on another worker, if there is one."""
+        pending = self._found.get(thread_id)
+        if pending is None:
+            if thread_id in self._mirrors:
+                return self._mirrors[thread_id]
+            if not await self._wait_connected():
+                return None
+            mirror = GenerationRun(thread_id)
+            self._mirrors[thread_id] = mirror
+            pending = self._found[thread_id] = asyncio.get_running_loop().create_future()
+            self._follow(mirror)
+        mirror = self._mirrors.get(thread_id)
+        if not await asyncio.shield(pending) or mirror is None:
+            self._mirrors.pop(thread_id, None)
+            return None
+        return mirror
+
+
+_link: BrokerLink | None = None
+
+
+def broker_socket_path() -> str | None:
+    if env.GENERATION_BROKER_SOCKET:
+        return env.GENERATION_BROKER_SOCKET
+    if env.API_WORKERS > 1:
+        return DEFAULT_BROKER_SOCKET
+    return None
+
+
+async def start_broker_link() -> None:
+    """Join (or host) the host's broker; a no-op for a single worker."""
+    global _link
+    path = broker_socket_path()
+    if path is None or _link is not None:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    _link = BrokerLink(path)
+    set_registry_link(_link)
+    await _link.start()
+
+
+async def close_broker_link() -> None:
+    global _link
+    if _link is not None:
+        set_registry_link(None)
+        await _link.aclose()
+        _link = None
+
+
+async def sweep_interrupted_generations() -> None:
+    """Startup recovery. With a broker only its host sweeps, sparing every
+    run another worker has already claimed."""
+    if _link is None:
+        await sweep_interrupted_runs()
+    elif _link.hosting:
+        await sweep_interrupted_runs(keep=_link.active_threads)
+
+
+async def claim_thread(thread_id: str) -> bool:
+    return True if _link is None else await _link.claim(thread_id)
+
+
+def release_thread(thread_id: str) -> None:
+    if _link is not None:
+        _link.released(thread_id)
+
+
+async def stop_remote(thread_id: str) -> bool:
+    return False if _link is None else await _link.stop(thread_id)
+
+
+async def attach_remote(thread_id: str) -> GenerationRun | None:
+    return None if _link is None else await _link.attach(thread_id)
+
+
+__all__ = [
+    "Broker",
+    "BrokerLink",
+    "attach_remote",
+    "broker_socket_path",
+    "claim_thread",
+    "close_broker_link",
+    "release_thread",
+    "start_broker_link",
+    "stop_remote",
+    "sweep_interrupted_generations",
+]
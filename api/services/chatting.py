@@ -1,6 +1,9 @@
 import asyncio
+import dataclasses
 import logging
-from collections.abc import Iterable
+from collections.abc import AsyncIterator, Iterable
+from contextlib import aclosing, asynccontextmanager
+from dataclasses import dataclass
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -9,30 +12,54 @@ from crud import (
     create_message,
     create_thread,
     finish_generation_run,
+    get_last_generation_run_start,
     get_messages_in_thread,
     get_running_run_for_thread,
     get_thread_by_id,
+    rename_thread,
     update_thread_time,
 )
 from crud.message import (
+    delete_message_segments,
     get_last_message_order_in_thread,
     reserve_assistant_message,
     update_message_content,
 )
 from db import get_session_manager
 from models import GenerationRunRow, Message, Thread
-from pipelines.inference import Tier, get_inference_pipeline
-from schemas.chatting import StreamingBlock
+from pipelines.breaker import BackendUnavailable
+from pipelines.inference import (
+    BudgetKind,
+    CompletionUsage,
+    LLMPipeline,
+    Priority,
+    StreamStalled,
+    Tier,
+    generation_budget,
+    get_inference_pipeline,
+)
+from pipelines.summarize import summarize
+from schemas.chatting import (
+    BudgetExhaustedBlock,
+    ContextCompactedBlock,
+    ContextUsageBlock,
+    GenerationErrorBlock,
+    QueuedBlock,
+    StreamingBlock,
+    ThreadTitleBlock,
+)
+from services.broker import attach_remote, claim_thread, release_thread, stop_remote
 from services.generation import (
-    PARTIAL_FLUSH_SECONDS,
+    FrameCoalescer,
     GenerationConflict,
     GenerationRun,
     GenerationStatus,
+    get_partial_flusher,
     get_run,
     register_run,
     schedule_eviction,
 )
-from utils import timing
+from utils import env, metrics, timing
 
 Logger = logging.getLogger(__name__)
 Logger.setLevel(logging.DEBUG)
@@ -47,26 +74,207 @@ DEFAULT_SYSTEM_PROMPT = (
     "Format answers with Markdown."
 )
 
-# Serializes generation starts process-wide: the active-run check, the
-# user-message save (incl. the title call) and run registration must be one
-# atomic section — two concurrent sends on a thread would otherwise both pass
-# the check and the second registration orphans the first run.
-_generation_start_lock = asyncio.Lock()
+# Chat-template framing around each message (role markers, separators) that
+# /tokenize does not see when it counts the bare content. Patchable in tests.
+MESSAGE_OVERHEAD_TOKENS = 8
+# A turn's own token counting gives up after this long; the budget then uses
+# an estimate and the count is retried on the next turn. Patchable in tests.
+TOKEN_COUNT_TIMEOUT_SECONDS = 2.0
+# Appended to the system prompt when older turns did not fit the budget.
+OMITTED_TURNS_NOTE = "\n\n({count} earlier messages of this conversation are not shown.)"
+# Carries a thread's rolling summary in the system prompt (PLAN 2.4).
+SUMMARY_NOTE = "\n\nSummary of the earlier conversation:\n{summary}"
+# Compaction keeps the newest turns verbatim up to this fraction of the
+# prompt budget and summarizes the rest. Patchable in tests.
+COMPACT_KEEP_FRACTION = 0.5
+
+# A new thread is created under a title cut from the first message; the
+# generated title replaces it once the background title task lands.
+PROVISIONAL_TITLE_WORDS = 6
+PROVISIONAL_TITLE_CHARS = 90
+
+# How long a finishing run waits for its thread's pending title before closing
+# the stream without the thread_title_update event. Patchable in tests.
+TITLE_WAIT_SECONDS = 10.0
+
+TTFT_SECONDS = metrics.histogram(
+    "clyre_generation_ttft_seconds",
+    "Time from generation start (incl. queueing) to the first streamed token",
+    buckets=metrics.SLOW_LATENCY_BUCKETS,
+)
+INTER_TOKEN_SECONDS = metrics.histogram(
+    "clyre_generation_inter_token_seconds", "Gap between consecutive streamed deltas"
+)
+GENERATIONS = metrics.counter(
+    "clyre_generations_total", "Generations by terminal status", ("status",)
+)
+STOP_RELEASE_SECONDS = metrics.histogram(
+    "clyre_generation_stop_release_seconds",
+    "Time from an accepted stop request until the upstream stream was closed "
+    "and its slot released",
+)
+BUDGET_EXHAUSTED = metrics.counter(
+    "clyre_generation_budget_exhausted_total",
+    "Generations that ran out of their reasoning or completion budget",
+    ("kind",),
+)
+
+# Background compactions by thread id; at most one per thread at a time.
+_compaction_tasks: dict[str, asyncio.Task] = {}
+
+# Pending background title tasks by thread id. They outlive the run that
+# follows them (stop, failure), so the registry also keeps them referenced.
+# A task that produced a title stays here until its run picks it up: it may
+# well finish before the run is launched.
+_title_tasks: dict[str, asyncio.Task] = {}
+
+
+class _KeyedLocks:
+    """One asyncio.Lock per key, dropped once nobody holds or waits for it."""
+
+    class _Entry:
+        __slots__ = ("lock", "users")
+
+        def __init__(self) -> None:
+            self.lock = asyncio.Lock()
+            self.users = 0
+
+    def __init__(self) -> None:
+        self._entries: dict[str, _KeyedLocks._Entry] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = self._Entry()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                del self._entries[key]
+
+
+# Serializes generation starts per thread: the active-run check, the
+# user-message save and run registration must be one atomic section — two
+# concurrent sends on a thread would otherwise both pass the check and the
+# second registration orphans the first run. Starts on different threads
+# never wait for each other.
+_thread_start_locks = _KeyedLocks()
+
+
+def estimate_tokens(text: str) -> int:
+    # Pessimistic (about 3 characters per token) on purpose: only used for
+    # messages whose count is unknown, where overshooting the window is worse.
+    return len(text) // 3 + 1
+
+
+@dataclass(frozen=True)
+class ChatHistory:
+    """The messages sent for one turn and their size in tokens."""
+
+    messages: list[dict[str, str]]
+    prompt_tokens: int
+    omitted: int = 0
+    summarized: int = 0
+
+
+@dataclass(frozen=True)
+class RollingSummary:
+    """A thread's summary of every message up to order `through`."""
+
+    text: str
+    through: int
+    tokens: int
+
+    @classmethod
+    def of(cls, thread: Thread) -> "RollingSummary | None":
+        if thread.summary is None or thread.summary_through is None:
+            return None
+        tokens = thread.summary_tokens
+        return cls(
+            thread.summary,
+            thread.summary_through,
+            tokens if tokens is not None else estimate_tokens(thread.summary),
+        )
 
 
 class ChattingService:
     # Raw inline LLM call. Should be replaced by a dedicated functional node
     # (e.g. a title-generation step in the pipeline layer), not kept here.
     @staticmethod
-    async def generate_thread_title(message: str) -> str:
+    async def generate_thread_title(message: str, user_id: str | None = None) -> str:
         llama = get_inference_pipeline(Tier.SMALL)
         llama_prompt = f"Create a concise and descriptive title for the given message (min. 4 words and up to 6 words (strict), use language of context given below):\n\n{message}\n\nTitle:"
         response_data = await llama.chat_completion_sync(
             [{"role": "user", "content": llama_prompt}],
             enable_thinking=False,
+            priority=Priority.TITLE,
+            user_id=user_id,
         )
         return response_data["choices"][0]["message"]["content"][:90].strip().strip('"')
 
+    @staticmethod
+    def provisional_title(message: str) -> str:
+        words = message.split()
+        title = " ".join(words[:PROVISIONAL_TITLE_WORDS])[:PROVISIONAL_TITLE_CHARS]
+        if title and len(title) < len(" ".join(words)):
+            title += "…"
+        return title or "New Thread"
+
+    async def update_thread_title(
+        self, thread_id: str, user_id: str, message: str, provisional: str
+    ) -> str | None:
+        """Generate and persist the real title; None when it was not applied.
+
+        Runs detached from the request. The provisional title stays in place
+        when generation fails, and a title the user set in the meantime (or a
+        thread deleted in the meantime) is left alone.
+        """
+        try:
+            title = await self.generate_thread_title(message, user_id)
+        except Exception:
+            Logger.exception("Title generation failed thread=%s", thread_id)
+            return None
+        if not title:
+            return None
+        try:
+            async with get_session_manager().async_session_maker() as session:
+                thread = await get_thread_by_id(
+                    session, thread_id, user_id, load_messages=False
+                )
+                if thread is None or thread.title != provisional:
+                    Logger.info("Title skipped thread=%s (deleted or renamed)", thread_id)
+                    return None
+                await rename_thread(session, thread, title)
+                await session.commit()
+        except Exception:
+            Logger.exception("Title persist failed thread=%s", thread_id)
+            return None
+        Logger.debug("Title updated thread=%s", thread_id)
+        return title
+
+    def _spawn_title_update(
+        self, thread_id: str, user_id: str, message: str, provisional: str
+    ) -> None:
+        task = asyncio.create_task(
+            self.update_thread_title(thread_id, user_id, message, provisional)
+        )
+        _title_tasks[thread_id] = task
+
+        def discard(done: asyncio.Task) -> None:
+            if _title_tasks.get(thread_id) is not done:
+                return
+            if done.cancelled() or done.exception() is not None or done.result() is None:
+                del _title_tasks[thread_id]
+
+        task.add_done_callback(discard)
+
     async def save_message(
         self,
         session: AsyncSession,
@@ -81,9 +289,8 @@ class ChattingService:
         current_thread_id: str = thread_id or ""
 
         if not current_thread_id:
-            thread = await create_thread(
-                session, user_id=user_id, title=await self.generate_thread_title(message)
-            )
+            provisional = self.provisional_title(message)
+            thread = await create_thread(session, user_id=user_id, title=provisional)
             current_thread_id = thread.id
             last_order = -1
         else:
@@ -101,6 +308,11 @@ class ChattingService:
 
         await session.commit()
 
+        if not thread_id:
+            # Only after the commit: the title task looks the thread up in its
+            # own session.
+            self._spawn_title_update(current_thread_id, user_id, message, provisional)
+
         new_message = await create_message(
             session,
             user_id=user_id,
@@ -113,21 +325,216 @@ class ChattingService:
         return new_message.id, current_thread_id
 
     @staticmethod
-    def build_history(messages: Iterable[Message]) -> list[dict[str, str]]:
+    def _sendable(messages: Iterable[Message]) -> list[Message]:
+        return [
+            msg
+            for msg in messages
+            # Reserved row never written by its run (crash before the first
+            # flush): sending it would hand the model a null turn.
+            if msg.role != "system"
+            and not (msg.role == "assistant" and msg.inline_value is None)
+        ]
+
+    @classmethod
+    def build_history(
+        cls,
+        messages: Iterable[Message],
+        budget: int | None = None,
+        system_tokens: int | None = None,
+        summary: RollingSummary | None = None,
+    ) -> ChatHistory:
+        """The system prompt plus the most recent turns that fit in `budget` tokens.
+
+        Sizes come from the stored `Message.token_count` (an estimate where
+        it is still unknown), so budgeting costs no request. Turns covered by
+        `summary` are replaced by it in the system prompt. The newest turn is
+        always sent; older turns that do not fit are left out and the system
+        prompt says how many. Without a budget every turn is sent.
+        """
         # Thinking blocks are intentionally never re-sent to the model (Qwen3.5
         # model card: no thinking content in history). If a preserve-thinking
         # model is ever added, it will likely need its own context-building
         # function instead of extending this one.
-        history = [{"role": "system", "content": DEFAULT_SYSTEM_PROMPT}]
-        for msg in messages:
-            if msg.role == "system":
-                continue
-            if msg.role == "assistant" and msg.inline_value is None:
-                # Reserved row never written by its run (crash before the
-                # first flush) — sending it would hand the model a null turn.
-                continue
-            history.append({"role": msg.role, "content": msg.inline_value or ""})
-        return history
+        turns = cls._sendable(messages)
+        summarized = 0
+        if summary is not None:
+            summarized = sum(1 for msg in turns if msg.order <= summary.through)
+            turns = turns[summarized:]
+        costs = [
+            MESSAGE_OVERHEAD_TOKENS
+            + (
+                msg.token_count
+                if msg.token_count is not None
+                else estimate_tokens(msg.inline_value or "")
+            )
+            for msg in turns
+        ]
+        if system_tokens is None:
+            system_tokens = estimate_tokens(DEFAULT_SYSTEM_PROMPT)
+        used = MESSAGE_OVERHEAD_TOKENS + system_tokens
+        system = DEFAULT_SYSTEM_PROMPT
+        if summary is not None:
+            system += SUMMARY_NOTE.format(summary=summary.text)
+            used += summary.tokens + estimate_tokens(SUMMARY_NOTE)
+
+        start = 0
+        if budget is not None:
+            note_tokens = estimate_tokens(OMITTED_TURNS_NOTE)
+            start = len(turns)
+            while start > 0:
+                cost = costs[start - 1]
+                if start < len(turns) and used + cost + note_tokens > budget:
+                    break
+                used += cost
+                start -= 1
+            # Chat templates expect the first turn after the system prompt to
+            # be the user's.
+            while start < len(turns) - 1 and turns[start].role == "assistant":
+                used -= costs[start]
+                start += 1
+        else:
+            used += sum(costs)
+
+        if start:
+            note = OMITTED_TURNS_NOTE.format(count=start)
+            system += note
+            used += estimate_tokens(note)
+        history = [{"role": "system", "content": system}]
+        history.extend(
+            {"role": msg.role, "content": msg.inline_value or ""} for msg in turns[start:]
+        )
+        return ChatHistory(history, used, omitted=start, summarized=summarized)
+
+    @classmethod
+    async def _count_tokens(
+        cls, llama: LLMPipeline, messages: Iterable[Message], user_id: str
+    ) -> int | None:
+        """Fill in the messages' missing token counts; returns the system
+        prompt's count, or None when counting failed (estimates apply)."""
+        pending = [msg for msg in cls._sendable(messages) if msg.token_count is None]
+        try:
+            counts = await asyncio.wait_for(
+                llama.count_tokens_many(
+                    [DEFAULT_SYSTEM_PROMPT, *(msg.inline_value or "" for msg in pending)],
+                    priority=Priority.INTERACTIVE,
+                    user_id=user_id,
+                    admission=False,
+                ),
+                TOKEN_COUNT_TIMEOUT_SECONDS,
+            )
+        except Exception:
+            Logger.warning("Token counting failed; budgeting on estimates", exc_info=True)
+            return None
+        for msg, count in zip(pending, counts[1:]):
+            msg.token_count = count
+        return counts[0]
+
+    def _schedule_compaction(self, thread_id: str, user_id: str) -> None:
+        if env.CHAT_COMPACT_AT <= 0:
+            return
+        running = _compaction_tasks.get(thread_id)
+        if running is not None and not running.done():
+            return
+        task = asyncio.create_task(self.compact_thread(thread_id, user_id))
+        _compaction_tasks[thread_id] = task
+
+        def discard(done: asyncio.Task) -> None:
+            if _compaction_tasks.get(thread_id) is done:
+                del _compaction_tasks[thread_id]
+
+        task.add_done_callback(discard)
+
+    async def compact_thread(self, thread_id: str, user_id: str) -> bool:
+        """Fold the thread's oldest turns into its rolling summary (PLAN 2.4).
+
+        Runs in the background after a run. Only turns past the summary's
+        watermark are read, so each compaction summarizes just the new
+        overflow on top of the previous summary. The newest turns stay
+        verbatim up to COMPACT_KEEP_FRACTION of the prompt budget. Returns
+        whether a new summary was stored.
+        """
+        llama = get_inference_pipeline(Tier.SMALL)
+        budget = llama.context_tokens - env.CHAT_RESPONSE_RESERVE_TOKENS
+        try:
+            maker = get_session_manager().async_session_maker
+            async with maker() as session:
+                thread = await get_thread_by_id(
+                    session, thread_id, user_id, load_messages=False
+                )
+                if thread is None:
+                    return False
+                messages = await get_messages_in_thread(session, thread_id, user_id)
+                system_tokens = await self._count_tokens(llama, messages, user_id)
+                await session.commit()
+                summary = RollingSummary.of(thread)
+                full = self.build_history(
+                    messages, system_tokens=system_tokens, summary=summary
+                )
+                if full.prompt_tokens <= budget * env.CHAT_COMPACT_AT:
+                    return False
+
+                turns = self._sendable(messages)[full.summarized :]
+                kept = 0
+                split = len(turns)
+                while split > 1:
+                    cost = MESSAGE_OVERHEAD_TOKENS + (
+                        turns[split - 1].token_count
+                        if turns[split - 1].token_count is not None
+                        else estimate_tokens(turns[split - 1].inline_value or "")
+                    )
+                    if kept + cost > budget * COMPACT_KEEP_FRACTION:
+                        break
+                    kept += cost
+                    split -= 1
+                # The verbatim part opens on a user turn, like build_history's:
+                # an answer stays with its question.
+                while split > 0 and split < len(turns) and turns[split].role == "assistant":
+                    split -= 1
+                overflow = turns[:split]
+                if not overflow:
+                    return False
+                transcript = "\n\n".join(
+                    f"{msg.role.capitalize()}: {msg.inline_value or ''}" for msg in overflow
+                )
+                through = overflow[-1].order
+                watermark = thread.summary_through
+
+            # No session is held while the model writes the summary.
+            text = await summarize(
+                transcript,
+                env.CHAT_SUMMARY_TOKENS,
+                previous=summary.text if summary is not None else None,
+                user_id=user_id,
+                llama=llama,
+            )
+            if not text:
+                return False
+            [tokens] = await llama.count_tokens_many(
+                [text], priority=Priority.COMPACTION, user_id=user_id
+            )
+
+            async with maker() as session:
+                thread = await get_thread_by_id(
+                    session, thread_id, user_id, load_messages=False
+                )
+                if thread is None or thread.summary_through != watermark:
+                    return False
+                thread.summary = text
+                thread.summary_through = through
+                thread.summary_tokens = tokens
+                thread.summary_time = timing.get_utc_now()
+                await session.commit()
+        except Exception:
+            Logger.exception("Compaction failed thread=%s", thread_id)
+            return False
+        Logger.info(
+            "Compacted thread=%s: %d messages folded into a %d-token summary (through order %d)",
+            thread_id,
+            len(overflow),
+            tokens,
+            through,
+        )
+        return True
 
     # Legacy non-streaming path. Do not use for new code; kept only as a
     # fallback and a likely candidate for removal.
@@ -146,7 +553,7 @@ class ChattingService:
 
         await update_thread_time(session, thread, timing.get_utc_now())
 
-        history = self.build_history(messages)
+        history = self.build_history(messages).messages
         response_data = await llama.chat_completion_sync(history)
         response_message = await create_message(
             session,
@@ -179,10 +586,28 @@ class ChattingService:
     async def _ensure_owned_thread(session: AsyncSession, thread_id: str, user_id: str) -> None:
         # Ownership before activity: a foreign thread id must fail with
         # "not found" instead of leaking generation state via 409-vs-404.
-        thread = await get_thread_by_id(session, thread_id, user_id)
+        thread = await get_thread_by_id(session, thread_id, user_id, load_messages=False)
         if not thread:
             raise ValueError("Thread not found")
 
+    @asynccontextmanager
+    async def _claimed(
+        self, session: AsyncSession, thread_id: str, new_thread: bool = False
+    ) -> AsyncIterator[None]:
+        # With several API workers the per-thread lock is process-local; the
+        # broker claim makes the start atomic across processes. Released again
+        # when the start fails before a run is registered.
+        if not new_thread:
+            await self._ensure_no_active(session, thread_id)
+        if not await claim_thread(thread_id):
+            Logger.warning("Generation conflict (broker) thread=%s", thread_id)
+            raise GenerationConflict("Generation already active for this thread")
+        try:
+            yield
+        except BaseException:
+            release_thread(thread_id)
+            raise
+
     async def start_generation(
         self,
         session: AsyncSession,
@@ -191,13 +616,18 @@ class ChattingService:
         message: str,
         enable_thinking: bool | None = None,
     ) -> GenerationRun:
-        if thread_id is not None:
-            await self._ensure_owned_thread(session, thread_id, user_id)
+        if thread_id is None:
+            # A new thread's id is unknown to every other request until its
+            # run is registered, so there is nothing to race against.
+            _, thread_id = await self.save_message(session, user_id, message, "user")
+            await session.commit()
+            Logger.debug("User message saved for new thread_id: %s", thread_id)
+            async with self._claimed(session, thread_id, new_thread=True):
+                return await self._launch(session, thread_id, user_id, enable_thinking)
 
-        async with _generation_start_lock:
-            if thread_id is not None:
-                await self._ensure_no_active(session, thread_id)
+        await self._ensure_owned_thread(session, thread_id, user_id)
 
+        async with _thread_start_locks.hold(thread_id), self._claimed(session, thread_id):
             _, thread_id = await self.save_message(
                 session,
                 user_id,
@@ -222,9 +652,7 @@ class ChattingService:
         """Regenerate the trailing assistant message in place (retry policy in PLAN 2.7)."""
         await self._ensure_owned_thread(session, thread_id, user_id)
 
-        async with _generation_start_lock:
-            await self._ensure_no_active(session, thread_id)
-
+        async with _thread_start_locks.hold(thread_id), self._claimed(session, thread_id):
             thread = await get_thread_by_id(session, thread_id, user_id)
             if not thread:
                 raise ValueError("Thread not found")
@@ -246,10 +674,25 @@ class ChattingService:
                 session, thread_id, user_id, enable_thinking, forced_order=order
             )
 
+    async def attach_generation(
+        self, session: AsyncSession, thread_id: str, user_id: str
+    ) -> GenerationRun | None:
+        """The thread's live (or recently finished) run, for re-subscribing.
+
+        Ownership is the only database access: the run itself is served from
+        the in-memory registry, or mirrored from the worker process that owns
+        it. None when nothing is buffered for the thread.
+        """
+        await self._ensure_owned_thread(session, thread_id, user_id)
+        return get_run(thread_id) or await attach_remote(thread_id)
+
     @staticmethod
-    def stop_generation(thread_id: str) -> bool:
+    async def stop_generation(thread_id: str) -> bool:
         run = get_run(thread_id)
         if run is None or run.done:
+            if await stop_remote(thread_id):
+                Logger.info("Stop routed to the owning worker thread=%s", thread_id)
+                return True
             Logger.info("Stop ignored: no active generation thread=%s", thread_id)
             return False
         Logger.info(
@@ -273,17 +716,37 @@ class ChattingService:
         if not thread:
             raise ValueError("Thread not found")
 
+        title_task = _title_tasks.pop(thread_id, None)
+
+        llama = get_inference_pipeline(Tier.SMALL)
         # Fresh query on purpose: a retried run must not see a just-deleted
         # partial answer lingering in the identity map's relationship cache.
-        history = self.build_history(await get_messages_in_thread(session, thread_id, user_id))
-        llama = get_inference_pipeline(Tier.SMALL)
+        messages = await get_messages_in_thread(session, thread_id, user_id)
+        # Counts filled in here are committed with the journal row below.
+        system_tokens = await self._count_tokens(llama, messages, user_id)
+        summary = RollingSummary.of(thread)
+        budget = llama.context_tokens - env.CHAT_RESPONSE_RESERVE_TOKENS
+        context = self.build_history(
+            messages, budget=budget, system_tokens=system_tokens, summary=summary
+        )
+        history = context.messages
+        generation = generation_budget(Tier.SMALL, context.prompt_tokens, llama.context_tokens)
+        # Announce a summary once: on the first run started after it landed.
+        compacted = False
+        if summary is not None and thread.summary_time is not None:
+            last_start = await get_last_generation_run_start(session, thread_id)
+            compacted = last_start is None or timing.ensure_utc(
+                thread.summary_time
+            ) > timing.ensure_utc(last_start)
 
         if forced_order is not None:
             order = forced_order
         else:
             order = await get_last_message_order_in_thread(session, thread_id, user_id) + 1
 
-        journal_row = await create_generation_run(session, thread_id, user_id)
+        journal_row = await create_generation_run(
+            session, thread_id, user_id, model=llama.model_name
+        )
         reserved = await reserve_assistant_message(
             session,
             user_id=user_id,
@@ -293,57 +756,134 @@ class ChattingService:
         reserved_id = reserved.id
         await session.commit()
 
-        run = GenerationRun(thread_id, journal_row.id)
+        run = GenerationRun(thread_id, journal_row.id, reserved_id)
         register_run(run)
         Logger.info(
-            "Generation starting thread=%s user=%s run=%s order=%d thinking=%s history=%d",
+            "Generation starting thread=%s user=%s run=%s order=%d thinking=%s history=%d "
+            "prompt_tokens=%d omitted=%d max_tokens=%s reasoning_budget=%s",
             thread_id,
             user_id,
             journal_row.id,
             order,
             bool(enable_thinking),
             len(history),
+            context.prompt_tokens,
+            context.omitted,
+            generation.max_tokens,
+            generation.reasoning_tokens,
         )
 
         async def _load_reserved(fresh_session: AsyncSession) -> Message | None:
             return await fresh_session.get(Message, reserved_id)
 
+        flusher = get_partial_flusher()
+
         async def flush_partial(force: bool = False) -> None:
-            now = asyncio.get_running_loop().time()
-            if not force and now - run.last_flush < PARTIAL_FLUSH_SECONDS:
-                return
-            run.last_flush = now
+            # The shared flusher journals the delta on its next tick (or now,
+            # batched with every other dirty run, when forced).
+            if force:
+                await flusher.flush_run(run)
+            else:
+                flusher.mark_dirty(run)
+
+        async def count_response() -> int | None:
+            response = str(run.response)
+            if not response:
+                return 0
             try:
-                async with get_session_manager().async_session_maker() as fresh_session:
-                    message = await _load_reserved(fresh_session)
-                    if message is not None:
-                        await update_message_content(
-                            fresh_session, message, run.response, run.thinking or None
-                        )
-                        await fresh_session.commit()
+                [count] = await asyncio.wait_for(
+                    llama.count_tokens_many([response], user_id=user_id, admission=False),
+                    TOKEN_COUNT_TIMEOUT_SECONDS,
+                )
             except Exception:
-                # A failed partial flush must never kill the generation itself;
-                # finalize_journal retries the write at the terminal state.
-                Logger.exception(
-                    "Partial flush failed thread=%s run=%s", thread_id, run.journal_id
+                Logger.warning(
+                    "Token counting failed run=%s; counted on the next turn",
+                    run.journal_id,
+                    exc_info=True,
                 )
+                return None
+            return count
 
-        async def finalize_journal(status: GenerationStatus) -> None:
+        async def finalize_journal(
+            status: GenerationStatus, usage: dict[str, int | float | str | None]
+        ) -> None:
+            token_count = await count_response()
+            # No batch may append segments after the compaction below.
+            await flusher.forget(run)
             async with get_session_manager().async_session_maker() as fresh_session:
                 message = await _load_reserved(fresh_session)
                 if message is not None:
-                    if run.response == "" and run.thinking == "":
+                    if not run.response and not run.thinking:
                         await fresh_session.delete(message)
                     else:
+                        # Compaction: the in-memory buffers are the complete
+                        # text, so the journaled segments are simply dropped.
                         await update_message_content(
-                            fresh_session, message, run.response, run.thinking or None
+                            fresh_session,
+                            message,
+                            str(run.response),
+                            str(run.thinking) or None,
+                            content_hash=run.response.sha256(),
+                            token_count=token_count,
                         )
+                        await delete_message_segments(fresh_session, reserved_id)
                 row = await fresh_session.get(GenerationRunRow, run.journal_id)
                 if row is not None:
-                    await finish_generation_run(fresh_session, row, status.value)
+                    await finish_generation_run(fresh_session, row, status.value, usage)
                 await fresh_session.commit()
 
+        async def report_queued(position: int) -> None:
+            Logger.info(
+                "Generation queued thread=%s run=%s position=%d",
+                thread_id,
+                run.journal_id,
+                position,
+            )
+            await run.publish(
+                QueuedBlock(position=position, thread_id=thread_id).model_dump_json(
+                    by_alias=True
+                )
+                + "\n"
+            )
+
+        title_published = False
+
+        async def publish_title(wait: bool = False) -> None:
+            # Only ever called from execute(), so the title event can never
+            # land after the terminal events.
+            nonlocal title_published
+            if title_task is None or title_published:
+                return
+            if wait and not title_task.done():
+                await asyncio.wait({title_task}, timeout=TITLE_WAIT_SECONDS)
+            if not title_task.done() or title_task.cancelled():
+                return
+            title_published = True
+            title = title_task.result()
+            if title is not None:
+                await run.publish(
+                    ThreadTitleBlock(title=title, thread_id=thread_id).model_dump_json(
+                        by_alias=True
+                    )
+                    + "\n"
+                )
+
+        async def publish_error(
+            code: str, message: str, retry_after: float | None = None
+        ) -> None:
+            frames.flush()
+            await run.publish(
+                GenerationErrorBlock(
+                    code=code,
+                    message=message,
+                    retry_after_seconds=retry_after,
+                    thread_id=thread_id,
+                ).model_dump_json(by_alias=True)
+                + "\n"
+            )
+
         async def emit_terminal() -> None:
+            frames.flush()
             await run.publish(
                 StreamingBlock(
                     chunk=None, event="assistant_message_insert", thread_id=thread_id
@@ -354,13 +894,44 @@ class ChattingService:
                 StreamingBlock(chunk=None, event="done").model_dump_json(by_alias=True) + "\n"
             )
 
+        frames = FrameCoalescer(run, env.STREAM_COALESCE_MS / 1000, env.STREAM_COALESCE_CHARS)
+
         async def execute() -> None:
             loop = asyncio.get_running_loop()
             started_at = loop.time()
             first_token_at: float | None = None
+            last_token_at = 0.0
             content_chunks = 0
             thinking_chunks = 0
             status = GenerationStatus.FINISHED
+            reported: CompletionUsage | None = None
+            exhausted: BudgetKind | None = None
+
+            def record_usage(usage: CompletionUsage) -> None:
+                nonlocal reported
+                reported = usage
+
+            async def report_budget(kind: BudgetKind, limit: int) -> None:
+                nonlocal exhausted
+                # A cut answer outranks the reasoning switch before it.
+                exhausted = kind
+                BUDGET_EXHAUSTED.labels(kind).inc()
+                Logger.warning(
+                    "Generation budget exhausted thread=%s run=%s kind=%s limit=%d",
+                    thread_id,
+                    run.journal_id,
+                    kind,
+                    limit,
+                )
+                # Chunks still held by the coalescer go out first.
+                frames.flush()
+                await run.publish(
+                    BudgetExhaustedBlock(
+                        kind=kind, limit_tokens=limit, thread_id=thread_id
+                    ).model_dump_json(by_alias=True)
+                    + "\n"
+                )
+
             try:
                 await run.publish(
                     StreamingBlock(
@@ -368,40 +939,95 @@ class ChattingService:
                     ).model_dump_json(by_alias=True)
                     + "\n"
                 )
-
-                async for kind, text in llama.chat_completion_stream(
-                    history, enable_thinking=enable_thinking
-                ):
-                    if first_token_at is None:
-                        first_token_at = loop.time()
-                        Logger.info(
-                            "First token thread=%s run=%s after %.3fs",
-                            thread_id,
-                            run.journal_id,
-                            first_token_at - started_at,
-                        )
-
-                    if kind == "thinking":
-                        event = "new_thinking_chunk"
-                        run.thinking += text
-                        thinking_chunks += 1
-                    else:
-                        event = "new_chunk"
-                        run.response += text
-                        content_chunks += 1
-
+                await run.publish(
+                    ContextUsageBlock(
+                        prompt_tokens=context.prompt_tokens,
+                        context_tokens=llama.context_tokens,
+                        omitted_messages=context.omitted,
+                        thread_id=thread_id,
+                    ).model_dump_json(by_alias=True)
+                    + "\n"
+                )
+                if compacted:
                     await run.publish(
-                        StreamingBlock(chunk=text, event=event).model_dump_json(by_alias=True)
+                        ContextCompactedBlock(
+                            summarized_messages=context.summarized,
+                            summary_tokens=summary.tokens,
+                            thread_id=thread_id,
+                        ).model_dump_json(by_alias=True)
                         + "\n"
                     )
-                    await flush_partial()
 
-                Logger.debug("Generation completed for thread_id: %s", thread_id)
+                stream = llama.chat_completion_stream(
+                    history,
+                    enable_thinking=enable_thinking,
+                    affinity_key=thread_id,
+                    user_id=user_id,
+                    on_queued=report_queued,
+                    on_usage=record_usage,
+                    budget=generation,
+                    on_budget=report_budget,
+                    prompt_tokens=context.prompt_tokens,
+                    phases=run.phases,
+                )
+                # Closed on the way out whatever ends the loop, so a stop
+                # landing between chunks closes the upstream request (and
+                # frees the slot) now rather than when the generator is
+                # garbage collected.
+                async with aclosing(stream):
+                    async for kind, text in stream:
+                        now = loop.time()
+                        if first_token_at is None:
+                            first_token_at = now
+                            TTFT_SECONDS.observe(now - started_at)
+                            Logger.info(
+                                "First token thread=%s run=%s after %.3fs",
+                                thread_id,
+                                run.journal_id,
+                                first_token_at - started_at,
+                            )
+                        else:
+                            INTER_TOKEN_SECONDS.observe(now - last_token_at)
+                        last_token_at = now
+
+                        if kind == "thinking":
+                            event = "new_thinking_chunk"
+                            run.thinking += text
+                            thinking_chunks += 1
+                        else:
+                            event = "new_chunk"
+                            run.response += text
+                            content_chunks += 1
+
+                        frames.add(event, text)
+                        await flush_partial()
+                        await publish_title()
+
+                Logger.debug(
+                    "Generation completed thread=%s run=%s (connect %.3fs, prefill %.3fs, "
+                    "decode %.3fs, longest stall %.3fs)",
+                    thread_id,
+                    run.journal_id,
+                    run.phases.connect,
+                    run.phases.prefill,
+                    run.phases.decode,
+                    run.phases.max_stall,
+                )
 
                 await flush_partial(force=True)
+                await publish_title(wait=True)
                 await emit_terminal()
             except asyncio.CancelledError:
                 status = GenerationStatus.STOPPED
+                if run.stop_requested_at is not None:
+                    released = loop.time() - run.stop_requested_at
+                    STOP_RELEASE_SECONDS.observe(released)
+                    Logger.info(
+                        "Stop released the slot thread=%s run=%s after %.1fms",
+                        thread_id,
+                        run.journal_id,
+                        released * 1000,
+                    )
                 await flush_partial(force=True)
                 await emit_terminal()
                 Logger.warning(
@@ -414,6 +1040,38 @@ class ChattingService:
                     thinking_chunks,
                     len(run.response),
                 )
+            except BackendUnavailable as exc:
+                status = GenerationStatus.FAILED
+                Logger.warning(
+                    "Generation failed fast thread=%s run=%s: %s",
+                    thread_id,
+                    run.journal_id,
+                    exc,
+                )
+                await flush_partial(force=True)
+                await publish_error(
+                    "backend_unavailable",
+                    "The model server is unavailable. Try again shortly.",
+                    retry_after=exc.retry_after,
+                )
+                await emit_terminal()
+            except StreamStalled as exc:
+                status = GenerationStatus.FAILED
+                Logger.warning(
+                    "Generation stalled thread=%s run=%s: %s (connect %.3fs, prefill %.3fs, "
+                    "decode %.3fs, %d content / %d thinking chunks)",
+                    thread_id,
+                    run.journal_id,
+                    exc,
+                    run.phases.connect,
+                    run.phases.prefill,
+                    run.phases.decode,
+                    content_chunks,
+                    thinking_chunks,
+                )
+                await flush_partial(force=True)
+                await publish_error("generation_failed", "The model server stopped responding.")
+                await emit_terminal()
             except Exception:
                 status = GenerationStatus.FAILED
                 Logger.exception(
@@ -428,14 +1086,27 @@ class ChattingService:
                     len(run.thinking),
                 )
                 await flush_partial(force=True)
+                await publish_error("generation_failed", "The answer could not be generated.")
                 await emit_terminal()
             finally:
                 # A failed journal write must never wedge the run: skipping
                 # finish() hangs every subscriber and 409-locks the thread
                 # until process restart. Finalize is best-effort; the terminal
                 # transition itself is mandatory.
+                usage = dataclasses.asdict(reported) if reported is not None else {}
+                usage["duration_ms"] = (loop.time() - started_at) * 1000
+                if first_token_at is not None:
+                    usage["ttft_ms"] = (first_token_at - started_at) * 1000
+                usage["budget_exhausted"] = exhausted
+                finalizing = asyncio.ensure_future(finalize_journal(status, usage))
                 try:
-                    await finalize_journal(status)
+                    try:
+                        await asyncio.shield(finalizing)
+                    except asyncio.CancelledError:
+                        # A stop landing after the answer ended (the run is
+                        # still RUNNING until finish()) must not skip the
+                        # journal write or the terminal transition.
+                        await finalizing
                 except Exception:
                     Logger.exception(
                         "Journal finalize failed thread=%s run=%s status=%s",
@@ -445,6 +1116,18 @@ class ChattingService:
                     )
                 await run.finish(status)
                 schedule_eviction(run)
+                GENERATIONS.labels(status.value).inc()
+                # The thread's next prompt: this one plus the answer (and a
+                # new user turn). Compaction re-checks with exact counts.
+                thread_tokens = (
+                    context.prompt_tokens
+                    + MESSAGE_OVERHEAD_TOKENS
+                    + estimate_tokens(str(run.response))
+                )
+                if status is not GenerationStatus.FAILED and (
+                    context.omitted or thread_tokens > budget * env.CHAT_COMPACT_AT
+                ):
+                    self._schedule_compaction(thread_id, user_id)
                 Logger.info(
                     "Generation terminal thread=%s run=%s status=%s duration=%.3fs "
                     "first_token=%.3fs content_chunks=%d thinking_chunks=%d "
@@ -1,3 +1,4 @@
+import asyncio
 import contextlib
 import logging
 from datetime import date
@@ -19,6 +20,7 @@ from crud.thread import get_thread_by_id
 from crud.vector import VectorRepository, get_vector_repository
 from db import get_session_manager
 from models import FileMetadata
+from pipelines.breaker import BackendUnavailable
 from pipelines.fs import FileStore, get_file_store
 from pipelines.ingest import UnsupportedFileType, extract_text
 from services.ingestion import _purge_file_vectors
@@ -26,6 +28,14 @@ from utils import hashing
 
 Logger = logging.getLogger(__name__)
 
+# Indexing that hit an open embedding circuit is retried this many times in
+# total, no sooner than this many seconds later. Patchable in tests.
+INDEX_RETRY_ATTEMPTS = 5
+INDEX_RETRY_SECONDS = 30.0
+
+# Pending deferred-indexing retries by file id; one per file.
+_index_retries: dict[str, asyncio.Task] = {}
+
 
 def _head_value(data: bytes, *, content_type: str, filename: str) -> str | None:
     try:
@@ -148,7 +158,9 @@ async def unlink_file_with_project(
         raise
 
 
-async def index_file_in_background(user_id: str, file_id: str, project_id: str) -> None:
+async def index_file_in_background(
+    user_id: str, file_id: str, project_id: str, attempt: int = 1
+) -> None:
     from services.ingestion import index_file_for_project
 
     session_manager = get_session_manager()
@@ -158,15 +170,42 @@ async def index_file_in_background(user_id: str, file_id: str, project_id: str)
             await index_file_for_project(session, file_metadata, project_id)
         except Exception as exc:
             await session.rollback()
+            deferred = isinstance(exc, BackendUnavailable) and attempt < INDEX_RETRY_ATTEMPTS
             try:
                 file_metadata = await get_user_file(session, user_id, file_id)
-                file_metadata.index_status = "failed"
+                file_metadata.index_status = "deferred" if deferred else "failed"
                 file_metadata.index_error = str(exc)[:2000]
                 session.add(file_metadata)
                 await session.commit()
             except Exception:
                 await session.rollback()
-            Logger.exception("Failed to index file %s for project %s", file_id, project_id)
+            if not deferred:
+                Logger.exception("Failed to index file %s for project %s", file_id, project_id)
+                return
+            delay = max(exc.retry_after, INDEX_RETRY_SECONDS)  # type: ignore[attr-defined]
+            Logger.warning(
+                "Deferred indexing file %s for project %s by %.0fs (attempt %d): %s",
+                file_id,
+                project_id,
+                delay,
+                attempt,
+                exc,
+            )
+            _schedule_index_retry(user_id, file_id, project_id, attempt + 1, delay)
+
+
+def _schedule_index_retry(
+    user_id: str, file_id: str, project_id: str, attempt: int, delay: float
+) -> None:
+    async def retry() -> None:
+        await asyncio.sleep(delay)
+        _index_retries.pop(file_id, None)
+        await index_file_in_background(user_id, file_id, project_id, attempt)
+
+    previous = _index_retries.get(file_id)
+    if previous is not None and not previous.done():
+        previous.cancel()
+    _index_retries[file_id] = asyncio.create_task(retry())
 
 
 async def delete_user_file(
@@ -1,12 +1,26 @@
 import asyncio
+import hashlib
 import logging
-from collections.abc import AsyncGenerator
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from collections.abc import AsyncGenerator, Callable, Iterator
+from dataclasses import asdict, dataclass
 from enum import Enum
 
+from sqlalchemy.ext.asyncio import AsyncSession
+
 from crud.generation import get_running_generation_runs, mark_interrupted
-from crud.message import delete_unwritten_assistant_rows
+from crud.message import (
+    append_message_segments,
+    compact_message_segments,
+    delete_unwritten_assistant_rows,
+)
 from db import get_session_manager
 from models import GenerationRunRow
+from pipelines.inference import StreamPhases
+from schemas.chatting import ChunkEvent, encode_chunk_line
+from utils import env, metrics
 
 Logger = logging.getLogger(__name__)
 
@@ -14,26 +28,55 @@ Logger = logging.getLogger(__name__)
 # reached a terminal state. Patchable in tests.
 EVENTS_GRACE_SECONDS = 30.0
 
-# How often a running generation flushes its partial content into the reserved
-# assistant message row. Patchable in tests.
+# Size of the contiguous byte blocks a run's event log is stored in.
+# Patchable in tests.
+EVENT_BLOCK_BYTES = 64 * 1024
+
+# Event-log bytes the registry may hold before finished runs are evicted ahead
+# of their grace period, least recently used first. Patchable in tests.
+EVENTS_MEMORY_CAP_BYTES = env.GENERATION_EVENTS_CAP_MB * 1024 * 1024
+
+# Upper bound of the events one subscriber drains per wakeup (one response
+# write). Patchable in tests.
+SUBSCRIBE_BATCH_MAX_BYTES = 64 * 1024
+
+# A live subscriber that falls this far behind the head of the log after
+# having caught up once is cut off instead of staying parked on a stalled
+# connection for the rest of the run; it re-attaches from its own offset.
+# Patchable in tests.
+SUBSCRIBER_MAX_LAG_BYTES = 1024 * 1024
+
+# How often the write-behind flusher journals the partial content of every
+# running generation. Patchable in tests.
 PARTIAL_FLUSH_SECONDS = 1.0
 
 
-async def sweep_interrupted_runs() -> int:
+async def sweep_interrupted_runs(keep: Callable[[], set[str]] | None = None) -> int:
     """Mark orphaned running journal rows as interrupted (startup recovery).
 
-    Also deletes assistant rows those runs reserved but never wrote: a
+    First folds the partial-content journal of those runs back into their
+    assistant rows, so a recovered answer keeps everything flushed before the
+    crash. Then deletes assistant rows those runs reserved but never wrote: a
     NULL-content assistant turn left in place poisons every later prompt
     for its thread.
+
+    `keep()` names threads still generating in other live worker processes.
+    It is read after the rows, so a run claimed before its row was written is
+    never swept.
     """
     async with get_session_manager().async_session_maker() as session:
         rows: list[GenerationRunRow] = await get_running_generation_runs(session)
+        if keep is not None:
+            alive = keep()
+            rows = [row for row in rows if row.thread_id not in alive]
         for row in rows:
             mark_interrupted(row)
         if rows:
-            deleted = await delete_unwritten_assistant_rows(
-                session, [row.thread_id for row in rows]
-            )
+            thread_ids = [row.thread_id for row in rows]
+            recovered = await compact_message_segments(session, thread_ids)
+            if recovered:
+                Logger.warning("Reassembled %d partial message(s) from segments", recovered)
+            deleted = await delete_unwritten_assistant_rows(session, thread_ids)
             if deleted:
                 Logger.warning("Deleted %d unwritten assistant message(s)", deleted)
             Logger.warning("Marked %d interrupted generation run(s)", len(rows))
@@ -53,25 +96,207 @@ class GenerationConflict(RuntimeError):
     """Another generation is already active for the thread, or nothing to retry."""
 
 
+class TextBuffer:
+    """Append-only text accumulator for a streaming answer.
+
+    `+=` on a str copies the whole answer on every token; here appends only
+    store the delta. The joined text is cached until the next append, and the
+    sha256 of the content is kept as a running digest so it costs O(delta) per
+    token instead of re-hashing the full text at every flush.
+    """
+
+    __slots__ = ("_parts", "_length", "_joined", "_sha")
+
+    def __init__(self) -> None:
+        self._parts: list[str] = []
+        self._length = 0
+        self._joined: str | None = ""
+        self._sha = hashlib.sha256()
+
+    def append(self, text: str) -> None:
+        if not text:
+            return
+        self._parts.append(text)
+        self._length += len(text)
+        self._joined = None
+        self._sha.update(text.encode("utf-8"))
+
+    def __iadd__(self, text: str) -> "TextBuffer":
+        self.append(text)
+        return self
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __bool__(self) -> bool:
+        return self._length > 0
+
+    def __str__(self) -> str:
+        if self._joined is None:
+            self._joined = "".join(self._parts)
+            # Later joins start from one segment instead of every token.
+            self._parts = [self._joined]
+        return self._joined
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, TextBuffer):
+            return str(self) == str(other)
+        if isinstance(other, str):
+            return len(other) == self._length and str(self) == other
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def tail(self, start: int) -> str:
+        """Text from character `start` on, touching only the trailing segments."""
+        need = self._length - start
+        if need <= 0:
+            return ""
+        pieces: list[str] = []
+        for part in reversed(self._parts):
+            if len(part) >= need:
+                pieces.append(part[len(part) - need :])
+                break
+            pieces.append(part)
+            need -= len(part)
+        return "".join(reversed(pieces))
+
+    def sha256(self) -> str:
+        """Hex digest of the content so far (the running state is not consumed)."""
+        return self._sha.hexdigest()
+
+
+class EventLog:
+    """Append-only NDJSON event log stored as UTF-8 in fixed-size byte blocks.
+
+    Events are written back to back (one may straddle two blocks) and an array
+    of start positions serves as the offset index, so a run costs its encoded
+    size plus 8 bytes per event instead of one Python str object per token.
+    `seal()` collapses the blocks into a single exact-size snapshot once the run
+    is terminal; every offset stays readable from it.
+    """
+
+    __slots__ = ("_block_size", "_blocks", "_starts", "_size", "_snapshot")
+
+    def __init__(self) -> None:
+        self._block_size = EVENT_BLOCK_BYTES
+        self._blocks: list[bytearray] = []
+        self._starts = array("Q")
+        self._size = 0
+        self._snapshot: bytes | None = None
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[index] for index in range(len(self)))
+
+    def __getitem__(self, index: int) -> str:
+        start = self._starts[index]
+        end = self._starts[index + 1] if index + 1 < len(self._starts) else self._size
+        return self._read(start, end).decode("utf-8")
+
+    @property
+    def sealed(self) -> bool:
+        return self._snapshot is not None
+
+    @property
+    def size(self) -> int:
+        """Encoded bytes of all events."""
+        return self._size
+
+    def position(self, index: int) -> int:
+        """Byte position where event `index` starts (the end for `len(self)`)."""
+        return self._starts[index] if index < len(self._starts) else self._size
+
+    def read(self, start: int, end: int) -> str:
+        """Events [start, end) as one string, decoded in a single pass."""
+        return self._read(self.position(start), self.position(end)).decode("utf-8")
+
+    def lines(self, start: int, end: int) -> list[str]:
+        return [self[index] for index in range(start, end)]
+
+    def end_within(self, start: int, max_bytes: int) -> int:
+        """Furthest end such that [start, end) fits `max_bytes` (at least one event)."""
+        limit = self.position(start) + max_bytes
+        if self._size <= limit:
+            return len(self._starts)
+        return max(bisect_right(self._starts, limit, start + 1) - 1, start + 1)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held: allocated blocks (or the snapshot) plus the offset index."""
+        data = len(self._snapshot) if self._snapshot is not None else 0
+        data += len(self._blocks) * self._block_size
+        return data + len(self._starts) * self._starts.itemsize
+
+    def append(self, line: str) -> None:
+        if self._snapshot is not None:
+            raise RuntimeError("event log is sealed")
+        data = memoryview(line.encode("utf-8"))
+        self._starts.append(self._size)
+        size = self._block_size
+        while data:
+            block, within = divmod(self._size, size)
+            if block == len(self._blocks):
+                self._blocks.append(bytearray(size))
+            n = min(len(data), size - within)
+            self._blocks[block][within : within + n] = data[:n]
+            data = data[n:]
+            self._size += n
+
+    def _read(self, start: int, end: int) -> bytes:
+        if self._snapshot is not None:
+            return self._snapshot[start:end]
+        size = self._block_size
+        parts: list[bytes] = []
+        while start < end:
+            block, within = divmod(start, size)
+            n = min(end - start, size - within)
+            parts.append(self._blocks[block][within : within + n])
+            start += n
+        return b"".join(parts)
+
+    def seal(self) -> None:
+        """Freeze the log into one snapshot, releasing the block slack."""
+        if self._snapshot is None:
+            self._snapshot = self._read(0, self._size)
+            self._blocks = []
+
+
 class GenerationRun:
     """One decoupled chat generation owned by the runtime, not by a connection.
 
-    Buffers every NDJSON event line at a stable integer offset so any number of
+    Logs every NDJSON event line at a stable integer offset so any number of
     subscribers can (re)join from an arbitrary offset exactly once. Subscribers
-    wait on a condition instead of queues: the publisher can never be blocked
-    or dropped by a slow consumer.
+    wait on a shared wakeup event instead of queues: the publisher can never be
+    blocked or dropped by a slow consumer, and publishing never has to await.
     """
 
-    def __init__(self, thread_id: str, journal_id: str | None = None):
+    def __init__(
+        self, thread_id: str, journal_id: str | None = None, message_id: str | None = None
+    ):
         self.thread_id = thread_id
         self.journal_id = journal_id
+        # Reserved assistant row the partial-content journal appends to.
+        self.message_id = message_id
         self.status = GenerationStatus.RUNNING
-        self.response = ""
-        self.thinking = ""
-        self.last_flush = 0.0
+        self.response = TextBuffer()
+        self.thinking = TextBuffer()
+        # Partial-content journal position: characters already persisted as
+        # segments, the next segment seq, and when unflushed text first
+        # appeared (loop time; None while clean).
+        self.response_flushed = 0
+        self.thinking_flushed = 0
+        self.segment_seq = 0
+        self.dirty_since: float | None = None
         self._stop_requested = False
-        self._events: list[str] = []
-        self._cond: asyncio.Condition = asyncio.Condition()
+        # Loop time of the accepted stop request, for stop -> release latency.
+        self.stop_requested_at: float | None = None
+        # Per-phase durations of the upstream stream, kept by its watchdog.
+        self.phases = StreamPhases()
+        self._events = EventLog()
+        self._wakeup = asyncio.Event()
         self._task: asyncio.Task | None = None
 
     def attach_task(self, task: asyncio.Task) -> None:
@@ -91,6 +316,7 @@ class GenerationRun:
         if self._stop_requested or self.done:
             return False
         self._stop_requested = True
+        self.stop_requested_at = asyncio.get_running_loop().time()
         self.cancel()
         return True
 
@@ -98,40 +324,366 @@ class GenerationRun:
     def done(self) -> bool:
         return self.status is not GenerationStatus.RUNNING
 
+    @property
+    def events_nbytes(self) -> int:
+        return self._events.nbytes
+
+    @property
+    def events_count(self) -> int:
+        return len(self._events)
+
+    def pending_segments(self) -> list[tuple[str, str]]:
+        """(kind, text) produced since the last successful partial flush."""
+        return [
+            (kind, text)
+            for kind, text in (
+                ("thinking", self.thinking.tail(self.thinking_flushed)),
+                ("content", self.response.tail(self.response_flushed)),
+            )
+            if text
+        ]
+
     async def wait_done(self) -> None:
         if self._task is not None:
             await asyncio.shield(self._task)
 
+    def _notify(self) -> None:
+        # Wake everyone parked on the current event; later waiters park on a
+        # fresh one. Single-threaded, so no lock is needed around the swap.
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    def publish_nowait(self, event_line: str) -> None:
+        if self._events.sealed:
+            Logger.warning("Event after terminal state dropped thread=%s", self.thread_id)
+            return
+        self._events.append(event_line)
+        self._notify()
+
+    def publish_many(self, event_lines: list[str]) -> None:
+        """Append several events behind a single subscriber wakeup."""
+        if self._events.sealed:
+            Logger.warning("Event after terminal state dropped thread=%s", self.thread_id)
+            return
+        for line in event_lines:
+            self._events.append(line)
+        self._notify()
+
     async def publish(self, event_line: str) -> None:
-        async with self._cond:
-            self._events.append(event_line)
-            self._cond.notify_all()
+        self.publish_nowait(event_line)
 
     async def finish(self, status: GenerationStatus) -> None:
-        async with self._cond:
-            self.status = status
-            self._cond.notify_all()
-
-    async def subscribe(self, offset: int = 0) -> AsyncGenerator[str, None]:
-        """Yield buffered events from `offset`, then follow live until terminal."""
+        self.status = status
+        self._events.seal()
+        self._notify()
+
+    async def _ranges(
+        self, offset: int, bounded: bool
+    ) -> AsyncGenerator[tuple[int, int], None]:
+        # Every wakeup drains everything published since the last one (up to
+        # SUBSCRIBE_BATCH_MAX_BYTES) as one [start, end) range of the log.
+        events = self._events
         index = max(offset, 0)
+        caught_up = False
         while True:
-            async with self._cond:
-                while index >= len(self._events) and not self.done:
-                    await self._cond.wait()
-            while index < len(self._events):
+            while index >= len(events) and not self.done:
+                caught_up = True
+                await self._wakeup.wait()
+            if index >= len(events):
+                return
+            lag = events.size - events.position(index)
+            if bounded and caught_up and not self.done and lag > SUBSCRIBER_MAX_LAG_BYTES:
+                Logger.warning(
+                    "Lagging subscriber cut off thread=%s offset=%d lag=%d bytes",
+                    self.thread_id,
+                    index,
+                    lag,
+                )
+                return
+            end = events.end_within(index, SUBSCRIBE_BATCH_MAX_BYTES)
+            yield index, end
+            index = end
+
+    async def subscribe(self, offset: int = 0) -> AsyncGenerator[str, None]:
+        """Yield logged events from `offset` one by one, then follow live until terminal."""
+        async for start, end in self._ranges(offset, bounded=False):
+            for index in range(start, end):
                 yield self._events[index]
-                index += 1
-            if self.done and index >= len(self._events):
+
+    async def subscribe_batches(
+        self, offset: int = 0, bounded: bool = True
+    ) -> AsyncGenerator[list[str], None]:
+        """Like subscribe(), but one list of events per wakeup.
+
+        `bounded` applies the lag policy (SUBSCRIBER_MAX_LAG_BYTES): the
+        generator simply ends, without a terminal event, when the reader has
+        fallen too far behind.
+        """
+        async for start, end in self._ranges(offset, bounded):
+            yield self._events.lines(start, end)
+
+    async def stream(self, offset: int = 0) -> AsyncGenerator[str, None]:
+        """NDJSON body from `offset`: one combined write per wakeup, lag-bounded."""
+        async for start, end in self._ranges(offset, bounded=True):
+            yield self._events.read(start, end)
+
+
+class FrameCoalescer:
+    """Merges consecutive chunk deltas of one kind into a single event line.
+
+    A frame is published when the kind changes, when it reaches `max_chars`,
+    or `window` seconds after its first delta (a timer, so a stalled model
+    never holds text back). `window <= 0` publishes every delta as is. Frames
+    go through `publish_nowait`, so the timer cannot reorder them against the
+    generation's own events; call `flush()` before the terminal events.
+    """
+
+    def __init__(self, run: GenerationRun, window: float, max_chars: int = 0):
+        self._run = run
+        self._window = window
+        self._max_chars = max_chars
+        self._event: ChunkEvent | None = None
+        self._parts: list[str] = []
+        self._chars = 0
+        self._timer: asyncio.TimerHandle | None = None
+
+    def add(self, event: ChunkEvent, text: str) -> None:
+        if self._window <= 0:
+            self._run.publish_nowait(encode_chunk_line(event, text))
+            return
+        if self._event is not None and event != self._event:
+            self.flush()
+        self._event = event
+        self._parts.append(text)
+        self._chars += len(text)
+        if self._max_chars and self._chars >= self._max_chars:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self._window, self.flush)
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._event is None:
+            return
+        self._run.publish_nowait(encode_chunk_line(self._event, "".join(self._parts)))
+        self._event = None
+        self._parts = []
+        self._chars = 0
+
+
+@dataclass
+class FlushStats:
+    batches: int = 0
+    segments: int = 0
+    failures: int = 0
+    last_batch_runs: int = 0
+    max_batch_runs: int = 0
+    # Seconds spent in the batch transaction.
+    last_latency: float = 0.0
+    max_latency: float = 0.0
+    # Seconds the oldest text of a batch waited between generation and commit.
+    last_lag: float = 0.0
+    max_lag: float = 0.0
+
+
+class PartialFlusher:
+    """Write-behind journal writer shared by every running generation.
+
+    Runs only mark themselves dirty; one background tick per
+    PARTIAL_FLUSH_SECONDS appends the new segments of all dirty runs in a
+    single transaction, so N concurrent generations cost one writer
+    transaction per tick instead of N. Forced flushes (stop, failure,
+    completion) go through the same lock-serialized path. If the batch fails,
+    each run is retried in its own transaction so one bad row (e.g. a thread
+    deleted mid-run) cannot stall everyone else's journal.
+    """
+
+    def __init__(self) -> None:
+        self._dirty: dict[str, GenerationRun] = {}
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._stats = FlushStats()
+
+    def mark_dirty(self, run: GenerationRun) -> None:
+        if run.message_id is None:
+            return
+        if run.dirty_since is None:
+            run.dirty_since = asyncio.get_running_loop().time()
+        self._dirty[run.message_id] = run
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._tick())
+
+    async def _tick(self) -> None:
+        # Exits once nothing is dirty; the next mark_dirty restarts it.
+        while self._dirty:
+            await asyncio.sleep(PARTIAL_FLUSH_SECONDS)
+            await self.flush()
+
+    async def flush_run(self, run: GenerationRun) -> None:
+        """Forced flush of `run` (and, in the same batch, everyone else)."""
+        self.mark_dirty(run)
+        await self.flush()
+
+    async def forget(self, run: GenerationRun) -> None:
+        """Drop a finished run; returns once no batch still writes its segments."""
+        async with self._lock:
+            if run.message_id is not None:
+                self._dirty.pop(run.message_id, None)
+
+    async def flush(self) -> None:
+        async with self._lock:
+            batch = list(self._dirty.values())
+            self._dirty.clear()
+            if not batch:
                 return
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            oldest = min(run.dirty_since or started for run in batch)
+            pending = [(run, run.pending_segments()) for run in batch]
+            try:
+                async with get_session_manager().async_session_maker() as session:
+                    for run, segments in pending:
+                        await self._append(session, run, segments)
+                    await session.commit()
+                flushed = pending
+            except Exception:
+                Logger.exception("Batched partial flush failed; retrying per run")
+                self._stats.failures += 1
+                flushed = []
+                for run, segments in pending:
+                    try:
+                        async with get_session_manager().async_session_maker() as session:
+                            await self._append(session, run, segments)
+                            await session.commit()
+                        flushed.append((run, segments))
+                    except Exception:
+                        # Marks stay put: the next tick retries the same delta,
+                        # and the finalizer writes the full text regardless.
+                        Logger.exception(
+                            "Partial flush failed thread=%s run=%s",
+                            run.thread_id,
+                            run.journal_id,
+                        )
+                        self._stats.failures += 1
+                        self._dirty.setdefault(run.message_id, run)  # type: ignore[index]
+            for run, segments in flushed:
+                self._advance(run, segments)
+            finished = loop.time()
+            self._record(
+                len(batch),
+                sum(len(s) for _, s in flushed),
+                finished - started,
+                finished - oldest,
+            )
+
+    @staticmethod
+    async def _append(
+        session: AsyncSession, run: GenerationRun, segments: list[tuple[str, str]]
+    ) -> None:
+        if segments:
+            await append_message_segments(session, run.message_id, run.segment_seq, segments)
+
+    def _advance(self, run: GenerationRun, segments: list[tuple[str, str]]) -> None:
+        run.segment_seq += len(segments)
+        for kind, text in segments:
+            if kind == "thinking":
+                run.thinking_flushed += len(text)
+            else:
+                run.response_flushed += len(text)
+        # Text generated while the batch was in flight is still unflushed.
+        if run.pending_segments():
+            run.dirty_since = asyncio.get_running_loop().time()
+            self._dirty.setdefault(run.message_id, run)  # type: ignore[index]
+        else:
+            run.dirty_since = None
+
+    def _record(self, runs: int, segments: int, latency: float, lag: float) -> None:
+        FLUSH_SECONDS.observe(latency)
+        FLUSH_BATCH_RUNS.observe(runs)
+        FLUSH_BATCH_SEGMENTS.observe(segments)
+        FLUSH_LAG_SECONDS.observe(lag)
+        stats = self._stats
+        stats.batches += 1
+        stats.segments += segments
+        stats.last_batch_runs = runs
+        stats.max_batch_runs = max(stats.max_batch_runs, runs)
+        stats.last_latency = latency
+        stats.max_latency = max(stats.max_latency, latency)
+        stats.last_lag = lag
+        stats.max_lag = max(stats.max_lag, lag)
+        Logger.debug(
+            "Partial flush: %d run(s), %d segment(s) in %.3fs (lag %.3fs)",
+            runs,
+            segments,
+            latency,
+            lag,
+        )
+
+    def stats(self) -> dict[str, float]:
+        return {**asdict(self._stats), "dirty_runs": len(self._dirty)}
+
+    async def aclose(self) -> None:
+        """Flush what is left and stop the tick (app shutdown)."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.flush()
+
+
+FLUSH_SECONDS = metrics.histogram(
+    "clyre_partial_flush_seconds", "Batched partial-content journal transaction time"
+)
+FLUSH_BATCH_RUNS = metrics.histogram(
+    "clyre_partial_flush_batch_runs",
+    "Generation runs written per batched partial flush",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+FLUSH_BATCH_SEGMENTS = metrics.histogram(
+    "clyre_partial_flush_batch_segments",
+    "Message segments written per batched partial flush",
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128),
+)
+FLUSH_LAG_SECONDS = metrics.histogram(
+    "clyre_partial_flush_lag_seconds",
+    "Write-behind lag: time from the oldest unflushed delta of a batch to its commit",
+    buckets=metrics.SLOW_LATENCY_BUCKETS,
+)
+
+_flusher: PartialFlusher | None = None
+
+
+def get_partial_flusher() -> PartialFlusher:
+    global _flusher
+    if _flusher is None:
+        _flusher = PartialFlusher()
+    return _flusher
+
+
+async def close_partial_flusher() -> None:
+    if _flusher is not None:
+        await _flusher.aclose()
 
 
 _runs: dict[str, GenerationRun] = {}
 _eviction_timers: dict[str, asyncio.TimerHandle] = {}
+# Finished runs still in their grace period, least recently used first.
+_finished: OrderedDict[str, None] = OrderedDict()
+_memory_evictions = 0
+# Cross-process link (services/broker.BrokerLink) told when a run stops
+# generating and when it leaves the registry; None for a single worker.
+_link = None
+
+
+def set_registry_link(link) -> None:
+    global _link
+    _link = link
 
 
 def register_run(run: GenerationRun) -> None:
     _runs[run.thread_id] = run
+    _finished.pop(run.thread_id, None)
     # A finished run arms a delayed eviction for its thread; a new run on the
     # same thread must cancel it, or the stale timer would evict the live run.
     pending = _eviction_timers.pop(run.thread_id, None)
@@ -140,11 +692,16 @@ def register_run(run: GenerationRun) -> None:
 
 
 def get_run(thread_id: str) -> GenerationRun | None:
+    if thread_id in _finished:
+        _finished.move_to_end(thread_id)
     return _runs.get(thread_id)
 
 
 def remove_run(thread_id: str) -> None:
     _runs.pop(thread_id, None)
+    _finished.pop(thread_id, None)
+    if _link is not None:
+        _link.released(thread_id)
 
 
 def active_run_thread_ids() -> set[str]:
@@ -164,3 +721,62 @@ def schedule_eviction(run: GenerationRun) -> None:
     _eviction_timers[run.thread_id] = loop.call_later(
         EVENTS_GRACE_SECONDS, _evict_run, run.thread_id
     )
+    _finished[run.thread_id] = None
+    _finished.move_to_end(run.thread_id)
+    if _link is not None:
+        _link.finished(run.thread_id)
+    _enforce_memory_cap()
+
+
+def registry_bytes() -> int:
+    return sum(run.events_nbytes for run in _runs.values())
+
+
+def _enforce_memory_cap() -> None:
+    """Evict finished runs, least recently used first, until under the cap.
+
+    Running generations are never evicted: their log is the only copy of
+    events a reconnecting client has not seen yet.
+    """
+    global _memory_evictions
+    held = registry_bytes()
+    while held > EVENTS_MEMORY_CAP_BYTES and _finished:
+        thread_id = next(iter(_finished))
+        run = _runs.get(thread_id)
+        held -= run.events_nbytes if run is not None else 0
+        timer = _eviction_timers.get(thread_id)
+        if timer is not None:
+            timer.cancel()
+        _evict_run(thread_id)
+        _memory_evictions += 1
+        Logger.info("Evicted finished run thread=%s (event log over memory cap)", thread_id)
+
+
+def _run_counts() -> dict[tuple[str, ...], float]:
+    stats = registry_stats()
+    return {("running",): stats["running"], ("finished",): stats["finished"]}
+
+
+metrics.gauge(
+    "clyre_generation_runs",
+    "Generations in the registry (finished ones await eviction)",
+    ("state",),
+    callback=_run_counts,
+)
+metrics.gauge(
+    "clyre_generation_event_log_bytes",
+    "Event-log bytes held for reconnecting clients",
+    callback=registry_bytes,
+)
+
+
+def registry_stats() -> dict[str, int]:
+    running = sum(1 for run in _runs.values() if not run.done)
+    return {
+        "runs": len(_runs),
+        "running": running,
+        "finished": len(_runs) - running,
+        "bytes": registry_bytes(),
+        "cap_bytes": EVENTS_MEMORY_CAP_BYTES,
+        "memory_evictions": _memory_evictions,
+    }
@@ -19,6 +19,10 @@ from utils import env
 
 TokenCounter = Callable[[list[str]], Awaitable[list[int]]]
 
+# Chunks tokenized per token_counter call: each call is one admission on the
+# tier, so interactive requests get in between groups. Patchable in tests.
+TOKENIZE_GROUP_SIZE = 32
+
 
 class Embedder(Protocol):
     async def embed(self, texts: list[str]) -> list[list[float]]: ...
@@ -98,7 +102,10 @@ async def ingest_file(
             raise ValueError(
                 f"embedding service returned {len(embeddings)} vectors for {len(chunks)} chunks"
             )
-        token_counts = await token_counter([chunk.text for chunk in chunks])
+        token_counts: list[int] = []
+        for start in range(0, len(chunks), TOKENIZE_GROUP_SIZE):
+            group = chunks[start : start + TOKENIZE_GROUP_SIZE]
+            token_counts += await token_counter([chunk.text for chunk in group])
         if len(token_counts) != len(chunks):
             raise ValueError(
                 f"tokenizer returned {len(token_counts)} counts for {len(chunks)} chunks"
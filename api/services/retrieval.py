@@ -14,9 +14,14 @@ from pipelines.embed import EmbeddingPipeline, get_embedding_pipeline
 from pipelines.fs import FileStore, get_file_store
 from schemas.file import ChunkResult, ChunkText, FileMeta
 from services.embedding_space import validate_for_read
+from utils import metrics
 
 DEFAULT_TOP_K = 5
 
+SEARCH_SECONDS = metrics.histogram(
+    "clyre_vector_search_seconds", "Nearest-neighbour chunk search in the vector store"
+)
+
 
 class ProjectIndexNotReady(RuntimeError):
     pass
@@ -49,7 +54,8 @@ async def search_project(
         raise ProjectIndexNotReady("one or more project indexes are not ready")
     await validate_for_read(session)
     embedding = await embedder.embed_one(query)
-    return await repository.search_similar_chunks(session, embedding, k, scopes)
+    with SEARCH_SECONDS.time():
+        return await repository.search_similar_chunks(session, embedding, k, scopes)
 
 
 async def project_scopes(
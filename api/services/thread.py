@@ -1,4 +1,5 @@
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 
 from crud import (
     get_all_user_threads,
@@ -6,7 +7,9 @@ from crud import (
     get_thread_by_id,
     get_user_by_id,
 )
+from crud.message import get_segment_texts
 from crud.thread import delete_thread
+from services.broker import stop_remote
 from services.generation import active_run_thread_ids, get_run
 
 
@@ -15,6 +18,22 @@ def _mark_generating(threads, active: set[str]) -> None:
         thread.is_generating = thread.id in active
 
 
+async def _overlay_partial_segments(session: AsyncSession, messages) -> None:
+    # An in-flight answer lives in the segment journal until its run
+    # finalizes; show it to resuming readers without touching the row.
+    texts = await get_segment_texts(
+        session, [message.id for message in messages if message.role == "assistant"]
+    )
+    for message in messages:
+        if message.id in texts:
+            content, thinking = texts[message.id]
+            set_committed_value(message, "inline_value", (message.inline_value or "") + content)
+            if thinking:
+                set_committed_value(
+                    message, "thinking_value", (message.thinking_value or "") + thinking
+                )
+
+
 class ThreadService:
     @staticmethod
     async def all_thread_meta(session: AsyncSession, user_id: str):
@@ -51,6 +70,8 @@ class ThreadService:
             await get_running_run_thread_ids(session, user.id)
         )
         _mark_generating([thread], active)
+        if thread.is_generating:
+            await _overlay_partial_segments(session, thread.messages)
 
         return thread
 
@@ -71,6 +92,8 @@ class ThreadService:
         run = get_run(thread_id)
         if run is not None and not run.done:
             run.request_stop()
+        else:
+            await stop_remote(thread_id)
 
         await delete_thread(session, thread)
 
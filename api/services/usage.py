@@ -0,0 +1,87 @@
+import datetime
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from crud import get_generation_usage, get_user_privilege_level
+from crud.generation import UsageBucket
+from utils import timing
+
+DEFAULT_WINDOW = datetime.timedelta(days=7)
+# Role privilege level needed to read other users' usage. Patchable in tests.
+USAGE_ADMIN_PRIVILEGE_LEVEL = 100
+
+
+def _rate(amount: int | None, milliseconds: float | None) -> float | None:
+    if not amount or not milliseconds:
+        return None
+    return amount / milliseconds * 1000
+
+
+def _period(value: datetime.datetime | str) -> datetime.datetime:
+    # SQLite hands the bucket back as text, PostgreSQL as a timestamp.
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    return timing.ensure_utc(value).astimezone(datetime.UTC)
+
+
+class UsageService:
+    @staticmethod
+    async def report(
+        session: AsyncSession,
+        caller_id: str,
+        since: datetime.datetime | None = None,
+        until: datetime.datetime | None = None,
+        bucket: UsageBucket = "day",
+        user_id: str | None = None,
+        model: str | None = None,
+        all_users: bool = False,
+    ) -> dict:
+        """Tokens, throughput and prompt-cache hit rate per bucket, user and model.
+
+        Throughput is token-weighted (total tokens over total server time), so
+        long answers count for what they cost rather than one vote per run.
+
+        The report covers the caller's own runs. Another user's runs, or every
+        user's (`all_users`), need a role of at least USAGE_ADMIN_PRIVILEGE_LEVEL;
+        otherwise PermissionError is raised.
+        """
+        until = timing.ensure_utc(until or timing.get_utc_now()).astimezone(datetime.UTC)
+        since = timing.ensure_utc(since or until - DEFAULT_WINDOW).astimezone(datetime.UTC)
+        if since >= until:
+            raise ValueError("since must be before until")
+        if all_users and user_id is not None:
+            raise ValueError("user_id and all_users are mutually exclusive")
+
+        if all_users or (user_id is not None and user_id != caller_id):
+            level = await get_user_privilege_level(session, caller_id)
+            if level < USAGE_ADMIN_PRIVILEGE_LEVEL:
+                raise PermissionError("Not allowed to read other users' usage")
+        elif user_id is None:
+            user_id = caller_id
+
+        rows = await get_generation_usage(session, since, until, bucket, user_id, model)
+        buckets = []
+        for row in rows:
+            cached = row.cached_tokens or 0
+            prefill = row.prefill_tokens or 0
+            buckets.append(
+                {
+                    "period": _period(row.period),
+                    "user_id": row.user_id,
+                    "model": row.model,
+                    "runs": row.runs,
+                    "prompt_tokens": row.prompt_tokens or 0,
+                    "completion_tokens": row.completion_tokens or 0,
+                    "cached_tokens": cached,
+                    "cache_hit_rate": cached / (cached + prefill) if cached + prefill else None,
+                    "decode_tokens_per_second": _rate(row.completion_tokens, row.predicted_ms),
+                    "prefill_tokens_per_second": _rate(row.prefill_tokens, row.prompt_ms),
+                    "avg_ttft_ms": row.avg_ttft_ms,
+                    "max_ttft_ms": row.max_ttft_ms,
+                    "avg_duration_ms": row.avg_duration_ms,
+                }
+            )
+        return {"since": since, "until": until, "bucket": bucket, "buckets": buckets}
+
+
+__all__ = ["UsageService"]
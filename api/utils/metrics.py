@@ -0,0 +1,286 @@
+import asyncio
+import math
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterator, Mapping
+from contextlib import contextmanager
+
+# In-process metrics in the Prometheus text exposition format. Recording is a
+# few attribute updates (histograms add one bisect over a short tuple), so it
+# stays on in production. Everything runs on the event loop thread; values
+# are per worker process.
+
+LabelValues = tuple[str, ...]
+GaugeCallback = Callable[[], float | Mapping[LabelValues, float]]
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        # Bucket i counts le=bounds[i]; the extra last slot is +Inf.
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class _Family:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: dict[LabelValues, object] = {}
+
+    def _new_child(self) -> object:
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _lines(self) -> Iterator[str]:
+        for values, child in self._children.items():
+            yield f"{self.name}{_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {_escape(self.documentation)}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self._lines()
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterValue:
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Family):
+    """Set directly, or computed at scrape time by `callback`.
+
+    A callback returns the value (unlabelled gauges) or a mapping of label
+    values to values; it costs nothing between scrapes.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        callback: GaugeCallback | None = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._callback = callback
+
+    def _new_child(self) -> _GaugeValue:
+        return _GaugeValue()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def _lines(self) -> Iterator[str]:
+        if self._callback is None:
+            yield from super()._lines()
+            return
+        result = self._callback()
+        samples = result.items() if isinstance(result, Mapping) else [((), result)]
+        for values, value in samples:
+            yield f"{self.name}{_labels(self.labelnames, values)} {_format_value(value)}"
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _lines(self) -> Iterator[str]:
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                labels = _labels(self.labelnames, values, le)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {child.count}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._families: dict[str, _Family] = {}
+
+    def register(self, family: _Family) -> _Family:
+        if family.name in self._families:
+            raise ValueError(f"metric {family.name} is already registered")
+        self._families[family.name] = family
+        return family
+
+    def render(self) -> str:
+        lines = [line for family in self._families.values() for line in family.render()]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))  # type: ignore[return-value]
+
+
+def gauge(
+    name: str,
+    documentation: str,
+    labelnames: tuple[str, ...] = (),
+    callback: GaugeCallback | None = None,
+) -> Gauge:
+    return REGISTRY.register(  # type: ignore[return-value]
+        Gauge(name, documentation, labelnames, callback)
+    )
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: tuple[str, ...] = (),
+    buckets: tuple[float, ...] = LATENCY_BUCKETS,
+) -> Histogram:
+    return REGISTRY.register(  # type: ignore[return-value]
+        Histogram(name, documentation, labelnames, buckets)
+    )
+
+
+# How often the loop lag monitor wakes up. Patchable in tests.
+LOOP_LAG_INTERVAL_SECONDS = 0.25
+
+LOOP_LAG_SECONDS = histogram(
+    "clyre_event_loop_lag_seconds",
+    "How late the event loop ran a timer: time other callbacks held the loop",
+)
+
+_loop_lag_task: asyncio.Task | None = None
+
+
+async def _watch_loop_lag() -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        interval = LOOP_LAG_INTERVAL_SECONDS
+        started = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG_SECONDS.observe(max(loop.time() - started - interval, 0.0))
+
+
+async def start_loop_lag_monitor() -> None:
+    """Sample event loop lag into LOOP_LAG_SECONDS until stopped (app startup)."""
+    global _loop_lag_task
+    if _loop_lag_task is None or _loop_lag_task.done():
+        _loop_lag_task = asyncio.create_task(_watch_loop_lag())
+
+
+async def stop_loop_lag_monitor() -> None:
+    global _loop_lag_task
+    if _loop_lag_task is not None:
+        _loop_lag_task.cancel()
+        await asyncio.gather(_loop_lag_task, return_exceptions=True)
+        _loop_lag_task = None
+
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "LATENCY_BUCKETS",
+    "LOOP_LAG_SECONDS",
+    "REGISTRY",
+    "Registry",
+    "SLOW_LATENCY_BUCKETS",
+    "counter",
+    "gauge",
+    "histogram",
+    "start_loop_lag_monitor",
+    "stop_loop_lag_monitor",
+]
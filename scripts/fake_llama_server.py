@@ -0,0 +1,537 @@
+"""OpenAI-compatible stand-in for llama-server, for tests and load runs without a GPU.
+
+    python -m scripts.fake_llama_server --port 6760 --slots 4 --tokens-per-second 40
+
+Serves /v1/chat/completions (streaming and not), /v1/embeddings, /tokenize,
+/props, /slots and /health in llama-server's wire format, including `usage`,
+`timings` and `reasoning_content`. Behaviour follows the real server where the
+API depends on it:
+
+- Requests share `slots` parallel slots; the rest wait. A request pinned with
+  `id_slot` waits for that slot.
+- Each slot caches its last prompt. Only the tokens past the common prefix
+  are prefilled, at `prefill_tokens_per_second`.
+- Reasoning tokens count against `max_tokens`, like n_predict does.
+- A stream whose client went away stops decoding, but only after
+  `cancel_seconds`: llama-server notices a closed connection between batches.
+- Tokens are words and punctuation, so counts are predictable in tests.
+  Embeddings are hashed bags of those tokens: deterministic, and texts that
+  share words land close together.
+
+Faults are drawn from a seeded RNG per request: `error_rate` answers 500,
+`stall_rate` freezes a generation for `stall_seconds`, and `malformed_rate`
+slips an undecodable SSE line in before a chunk.
+
+Unit tests mount `FakeLlamaServer().app` with `httpx.ASGITransport`; note
+that transport buffers a streamed body, so pacing is only observable over a
+real socket.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import math
+import random
+import re
+import time
+import uuid
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field, fields
+from typing import Any
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+Logger = logging.getLogger(__name__)
+Logger.setLevel(logging.INFO)
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+VOCAB_SIZE = 32000
+# Tokens the chat template adds around every message.
+TEMPLATE_TOKENS_PER_MESSAGE = 4
+# Nonzero coordinates each token contributes to its hashed embedding.
+EMBEDDING_FEATURES_PER_TOKEN = 8
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while seven wizards quietly "
+    "box jolly gnomes near the old river bank"
+).split()
+MALFORMED_LINE = 'data: {"choices": [{"delta": {"content": '
+
+
+@dataclass
+class FakeLlamaConfig:
+    """Knobs of the fake server; every field is also a CLI flag.
+
+    A rate of 0 means no delay.
+    """
+
+    model: str = "fake-llama"
+    n_ctx: int = 8192
+    slots: int = 4
+    # Fixed time before the first token, on top of the prefill itself.
+    prefill_seconds: float = 0.0
+    prefill_tokens_per_second: float = 2000.0
+    tokens_per_second: float = 30.0
+    # Answer length when the request sets no max_tokens.
+    completion_tokens: int = 64
+    # reasoning_content tokens before the answer when thinking is enabled.
+    reasoning_tokens: int = 0
+    # Thinking state when the request leaves chat_template_kwargs out
+    # (Qwen3 templates think by default).
+    thinking_by_default: bool = False
+    embedding_dim: int = 1024
+    # /health answers 503 "Loading model" for this long after start.
+    loading_seconds: float = 0.0
+    error_rate: float = 0.0
+    stall_rate: float = 0.0
+    stall_seconds: float = 30.0
+    malformed_rate: float = 0.0
+    # How long a slot stays busy after its streaming client disconnected.
+    cancel_seconds: float = 0.0
+    seed: int = 0
+
+
+@dataclass
+class _Slot:
+    id: int
+    busy: bool = False
+    cached: list[int] = field(default_factory=list)
+
+
+@dataclass
+class _Plan:
+    """What one completion will produce, and how it went."""
+
+    id: str
+    model: str
+    prompt: list[int]
+    reasoning: int
+    content: int
+    finish: str
+    stall_at: int | None
+    cached: int = 0
+    prefilled: int = 0
+    prompt_ms: float = 0.0
+    predicted: int = 0
+    predicted_ms: float = 0.0
+
+    def usage(self) -> dict[str, int]:
+        return {
+            "prompt_tokens": len(self.prompt),
+            "completion_tokens": self.predicted,
+            "total_tokens": len(self.prompt) + self.predicted,
+        }
+
+    def timings(self) -> dict[str, Any]:
+        return {
+            "cache_n": self.cached,
+            "prompt_n": self.prefilled,
+            "prompt_ms": self.prompt_ms,
+            "prompt_per_second": (
+                self.prefilled / self.prompt_ms * 1000 if self.prompt_ms else 0.0
+            ),
+            "predicted_n": self.predicted,
+            "predicted_ms": self.predicted_ms,
+            "predicted_per_second": (
+                self.predicted / self.predicted_ms * 1000 if self.predicted_ms else 0.0
+            ),
+        }
+
+
+def tokenize(text: str) -> list[int]:
+    """Token ids of `text`: one per word or punctuation mark."""
+    return [
+        int.from_bytes(hashlib.blake2b(piece.encode("utf-8"), digest_size=4).digest(), "big")
+        % VOCAB_SIZE
+        for piece in TOKEN_PATTERN.findall(text)
+    ]
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return ""
+
+
+def prompt_tokens(messages: list[dict[str, Any]]) -> list[int]:
+    """Token ids of a chat prompt, template tokens included."""
+    tokens: list[int] = []
+    for message in messages:
+        tokens.extend(tokenize(str(message.get("role", ""))))
+        tokens.extend(tokenize(_content_text(message.get("content"))))
+        tokens.extend([0] * TEMPLATE_TOKENS_PER_MESSAGE)
+    return tokens
+
+
+def embed_text(text: str, dim: int) -> list[float]:
+    """Unit vector of `text`'s hashed bag of lowercase tokens."""
+    vector = [0.0] * dim
+    for piece in TOKEN_PATTERN.findall(text.lower()):
+        digest = hashlib.blake2b(
+            piece.encode("utf-8"), digest_size=3 * EMBEDDING_FEATURES_PER_TOKEN
+        ).digest()
+        for offset in range(0, len(digest), 3):
+            index = int.from_bytes(digest[offset : offset + 2], "big") % dim
+            vector[index] += 1.0 if digest[offset + 2] & 1 else -1.0
+    norm = math.sqrt(sum(x * x for x in vector))
+    if norm == 0.0:
+        vector[0] = 1.0
+        return vector
+    return [x / norm for x in vector]
+
+
+def _common_prefix(a: list[int], b: list[int]) -> int:
+    count = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        count += 1
+    return count
+
+
+def _error(status: int, message: str, kind: str) -> JSONResponse:
+    return JSONResponse(
+        {"error": {"code": status, "message": message, "type": kind}}, status_code=status
+    )
+
+
+def _sse(payload: dict[str, Any]) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+class FakeLlamaServer:
+    """One fake llama-server process: config, slots and counters.
+
+    `stats` counts requests, injected faults and cancellations, and records
+    when each slot was last released, so tests can assert on what the
+    server saw.
+    """
+
+    def __init__(self, config: FakeLlamaConfig | None = None):
+        self.config = config or FakeLlamaConfig()
+        self.slots = [_Slot(index) for index in range(self.config.slots)]
+        self.stats: dict[str, Any] = {
+            "requests": 0,
+            "completed": 0,
+            "cancelled": 0,
+            "errors": 0,
+            "stalls": 0,
+            "malformed": 0,
+            "max_busy": 0,
+            "released_at": {},
+        }
+        self._rng = random.Random(self.config.seed)
+        self._freed = asyncio.Event()
+        self._started = time.monotonic()
+        self.app = Starlette(
+            routes=[
+                Route("/health", self.health, methods=["GET"]),
+                Route("/props", self.props, methods=["GET"]),
+                Route("/slots", self.slots_view, methods=["GET"]),
+                Route("/tokenize", self.tokenize, methods=["POST"]),
+                Route("/v1/embeddings", self.embeddings, methods=["POST"]),
+                Route("/v1/chat/completions", self.chat_completions, methods=["POST"]),
+            ]
+        )
+
+    # -- slots -------------------------------------------------------------
+
+    def _pick(self, id_slot: int | None, prompt: list[int]) -> _Slot | None:
+        if id_slot is not None and 0 <= id_slot < len(self.slots):
+            slot = self.slots[id_slot]
+            return None if slot.busy else slot
+        free = [slot for slot in self.slots if not slot.busy]
+        if not free:
+            return None
+        # Like llama-server: the idle slot sharing the longest prompt prefix.
+        return max(free, key=lambda slot: _common_prefix(slot.cached, prompt))
+
+    async def _acquire(self, id_slot: int | None, prompt: list[int]) -> _Slot:
+        while True:
+            slot = self._pick(id_slot, prompt)
+            if slot is not None:
+                slot.busy = True
+                busy = sum(1 for s in self.slots if s.busy)
+                self.stats["max_busy"] = max(self.stats["max_busy"], busy)
+                return slot
+            await self._freed.wait()
+
+    def _release(self, slot: _Slot) -> None:
+        slot.busy = False
+        self.stats["released_at"][slot.id] = time.monotonic()
+        # Wake every waiter; each re-checks, and later waiters get a new event.
+        self._freed.set()
+        self._freed = asyncio.Event()
+
+    # -- faults ------------------------------------------------------------
+
+    def _draw(self, rate: float) -> bool:
+        return rate > 0 and self._rng.random() < rate
+
+    def _injected_error(self) -> JSONResponse | None:
+        if not self._draw(self.config.error_rate):
+            return None
+        self.stats["errors"] += 1
+        return _error(500, "fake-llama: injected failure", "server_error")
+
+    # -- timing ------------------------------------------------------------
+
+    def _prefill_delay(self, tokens: int) -> float:
+        rate = self.config.prefill_tokens_per_second
+        return self.config.prefill_seconds + (tokens / rate if rate > 0 else 0.0)
+
+    # -- endpoints ---------------------------------------------------------
+
+    async def health(self, request: Request) -> Response:
+        if time.monotonic() - self._started < self.config.loading_seconds:
+            return _error(503, "Loading model", "unavailable_error")
+        return JSONResponse({"status": "ok"})
+
+    async def props(self, request: Request) -> Response:
+        return JSONResponse(
+            {
+                "total_slots": len(self.slots),
+                "model_path": self.config.model,
+                "default_generation_settings": {"n_ctx": self.config.n_ctx},
+            }
+        )
+
+    async def slots_view(self, request: Request) -> Response:
+        return JSONResponse(
+            [
+                {"id": slot.id, "n_ctx": self.config.n_ctx, "is_processing": slot.busy}
+                for slot in self.slots
+            ]
+        )
+
+    async def tokenize(self, request: Request) -> Response:
+        body = await request.json()
+        return JSONResponse({"tokens": tokenize(str(body.get("content", "")))})
+
+    async def embeddings(self, request: Request) -> Response:
+        self.stats["requests"] += 1
+        body = await request.json()
+        inputs = body.get("input", body.get("content", ""))
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        failure = self._injected_error()
+        if failure is not None:
+            return failure
+        counts = [len(tokenize(text)) for text in texts]
+        slot = await self._acquire(None, [])
+        try:
+            await asyncio.sleep(self._prefill_delay(sum(counts)))
+        finally:
+            self._release(slot)
+        self.stats["completed"] += 1
+        return JSONResponse(
+            {
+                "object": "list",
+                "model": body.get("model", self.config.model),
+                "data": [
+                    {
+                        "object": "embedding",
+                        "index": index,
+                        "embedding": embed_text(text, self.config.embedding_dim),
+                    }
+                    for index, text in enumerate(texts)
+                ],
+                "usage": {"prompt_tokens": sum(counts), "total_tokens": sum(counts)},
+            }
+        )
+
+    async def chat_completions(self, request: Request) -> Response:
+        self.stats["requests"] += 1
+        body = await request.json()
+        failure = self._injected_error()
+        if failure is not None:
+            return failure
+        prompt = prompt_tokens(body.get("messages") or [])
+        if len(prompt) >= self.config.n_ctx:
+            return _error(
+                400,
+                f"the request exceeds the available context size ({len(prompt)} tokens, "
+                f"n_ctx {self.config.n_ctx})",
+                "exceed_context_size_error",
+            )
+        template = body.get("chat_template_kwargs") or {}
+        thinking = bool(template.get("enable_thinking", self.config.thinking_by_default))
+        limit = body.get("max_tokens")
+        budget = self.config.n_ctx - len(prompt)
+        if limit is not None:
+            budget = min(budget, int(limit))
+        wanted = self.config.reasoning_tokens if thinking else 0
+        reasoning = min(wanted, budget)
+        content = min(self.config.completion_tokens, budget - reasoning)
+        finish = (
+            "stop"
+            if reasoning + content == wanted + self.config.completion_tokens
+            else "length"
+        )
+        plan = _Plan(
+            id=f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            model=body.get("model", self.config.model),
+            prompt=prompt,
+            reasoning=reasoning,
+            content=content,
+            finish=finish,
+            stall_at=(
+                self._rng.randrange(reasoning + content + 1)
+                if self._draw(self.config.stall_rate)
+                else None
+            ),
+        )
+        id_slot = body.get("id_slot")
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return StreamingResponse(
+                self._stream(id_slot, plan, include_usage), media_type="text/event-stream"
+            )
+        slot = await self._acquire(id_slot, prompt)
+        try:
+            return JSONResponse(await self._complete(slot, plan))
+        finally:
+            self._release(slot)
+
+    # -- generation --------------------------------------------------------
+
+    async def _generate(self, slot: _Slot, plan: _Plan) -> AsyncIterator[tuple[str, str]]:
+        """Prefill, then yield (kind, text) at the configured rate.
+
+        Leaves the prefill and decode timings on `plan`.
+        """
+        cached = _common_prefix(slot.cached, plan.prompt)
+        plan.cached = cached
+        plan.prefilled = len(plan.prompt) - cached
+        started = time.perf_counter()
+        await asyncio.sleep(self._prefill_delay(plan.prefilled))
+        plan.prompt_ms = (time.perf_counter() - started) * 1000
+        slot.cached = list(plan.prompt)
+
+        interval = 1 / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0
+        decode_started = time.perf_counter()
+        due = decode_started
+        words = itertools.cycle(WORDS)
+        for index in range(plan.reasoning + plan.content):
+            if index == plan.stall_at:
+                self.stats["stalls"] += 1
+                await asyncio.sleep(self.config.stall_seconds)
+                due = time.perf_counter()
+            due += interval
+            await asyncio.sleep(max(due - time.perf_counter(), 0))
+            word = next(words)
+            first = index in (0, plan.reasoning)
+            kind = "reasoning" if index < plan.reasoning else "content"
+            slot.cached.extend(tokenize(word))
+            plan.predicted += 1
+            plan.predicted_ms = (time.perf_counter() - decode_started) * 1000
+            yield kind, word if first else f" {word}"
+        if plan.stall_at == plan.reasoning + plan.content:
+            self.stats["stalls"] += 1
+            await asyncio.sleep(self.config.stall_seconds)
+
+    async def _complete(self, slot: _Slot, plan: _Plan) -> dict[str, Any]:
+        parts: dict[str, list[str]] = {"reasoning": [], "content": []}
+        async for kind, text in self._generate(slot, plan):
+            parts[kind].append(text)
+        message: dict[str, Any] = {"role": "assistant", "content": "".join(parts["content"])}
+        if parts["reasoning"]:
+            message["reasoning_content"] = "".join(parts["reasoning"])
+        self.stats["completed"] += 1
+        return {
+            "id": plan.id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": plan.model,
+            "choices": [{"index": 0, "message": message, "finish_reason": plan.finish}],
+            "usage": plan.usage(),
+            "timings": plan.timings(),
+        }
+
+    async def _stream(self, id_slot: int | None, plan: _Plan, include_usage: bool):
+        def chunk(delta: dict[str, Any], finish: str | None = None) -> dict[str, Any]:
+            return {
+                "id": plan.id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": plan.model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+
+        def maybe_malformed() -> str:
+            if not self._draw(self.config.malformed_rate):
+                return ""
+            self.stats["malformed"] += 1
+            return f"{MALFORMED_LINE}\n\n"
+
+        # Taken inside the body: a generator that never started would never
+        # release it.
+        slot = await self._acquire(id_slot, plan.prompt)
+        release_now = True
+        try:
+            yield _sse(chunk({"role": "assistant", "content": None}))
+            async for kind, text in self._generate(slot, plan):
+                field_name = "reasoning_content" if kind == "reasoning" else "content"
+                yield maybe_malformed() + _sse(chunk({field_name: text}))
+            final = chunk({}, plan.finish)
+            final["timings"] = plan.timings()
+            yield _sse(final)
+            if include_usage:
+                usage = chunk({})
+                usage["choices"] = []
+                usage["usage"] = plan.usage()
+                usage["timings"] = plan.timings()
+                yield _sse(usage)
+            yield "data: [DONE]\n\n"
+            self.stats["completed"] += 1
+        except (asyncio.CancelledError, GeneratorExit):
+            self.stats["cancelled"] += 1
+            if self.config.cancel_seconds > 0:
+                asyncio.get_running_loop().call_later(
+                    self.config.cancel_seconds, self._release, slot
+                )
+                release_now = False
+            raise
+        finally:
+            if release_now:
+                self._release(slot)
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible llama-server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6760)
+    for item in fields(FakeLlamaConfig):
+        flag = "--" + item.name.replace("_", "-")
+        if item.type is bool:
+            parser.add_argument(
+                flag, action=argparse.BooleanOptionalAction, default=item.default
+            )
+        else:
+            parser.add_argument(flag, type=item.type, default=item.default)
+    return parser
+
+
+def main() -> None:
+    import uvicorn
+
+    args = _parser().parse_args()
+    config = FakeLlamaConfig(
+        **{item.name: getattr(args, item.name) for item in fields(FakeLlamaConfig)}
+    )
+    logging.basicConfig(level=logging.INFO)
+    Logger.info("fake llama-server on %s:%d: %s", args.host, args.port, config)
+    uvicorn.run(
+        FakeLlamaServer(config).app, host=args.host, port=args.port, log_level="warning"
+    )
+
+
+if __name__ == "__main__":
+    main()
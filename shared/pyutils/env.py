@@ -20,6 +20,10 @@ class Settings(BaseSettings):
     # Server configuration
     HOST: str = "localhost"
     PORT: int = 6750
+    # Uvicorn worker processes; with more than one, the workers share their
+    # generations through a broker on this Unix socket (default under ./data)
+    API_WORKERS: int = 1
+    GENERATION_BROKER_SOCKET: str | None = None
 
     # Backend configuration
     DB_ENGINE: str = "sqlite"
@@ -41,6 +45,8 @@ class Settings(BaseSettings):
     # served) and the model name/alias to send in requests. When unset, values are
     # resolved from the model catalog (configs/models.yaml) and the local bind
     # addresses below. BIG_* may be left empty -> it falls back to SMALL_*.
+    # Any *_BASE_URL may list several comma-separated replicas of the same model
+    # (e.g. LAN llama-server processes); requests go to the least-loaded one.
     SMALL_BASE_URL: str | None = None  # chat + worker steps
     SMALL_MODEL: str | None = None
     BIG_BASE_URL: str | None = None  # planner + synthesizer (optional)
@@ -56,6 +62,67 @@ class Settings(BaseSettings):
     EMBEDDING_BIND_HOST: str = "localhost"
     EMBEDDING_BIND_PORT: int = 6761
 
+    # Pooled HTTP client held by each inference/embedding pipeline (keep-alive
+    # connections to llama-server; timeouts in seconds)
+    INFERENCE_POOL_MAX_CONNECTIONS: int = 32
+    INFERENCE_POOL_MAX_KEEPALIVE: int = 16
+    INFERENCE_POOL_KEEPALIVE_EXPIRY: float = 30.0
+    INFERENCE_CONNECT_TIMEOUT: float = 10.0
+    INFERENCE_READ_TIMEOUT: float = 60.0
+    # Streaming chat completions are watched per phase instead of by the read
+    # timeout: the first token must arrive within INFERENCE_FIRST_TOKEN_SECONDS
+    # plus one second per INFERENCE_PREFILL_TOKENS_PER_SECOND prompt tokens (0
+    # disables the scaling), then no gap between tokens may exceed
+    # INFERENCE_STALL_SECONDS unless /slots shows the slot still processing
+    INFERENCE_FIRST_TOKEN_SECONDS: float = 60.0
+    INFERENCE_PREFILL_TOKENS_PER_SECOND: float = 50.0
+    INFERENCE_STALL_SECONDS: float = 60.0
+    # Non-streamed completions return only once fully decoded: their expected
+    # duration counts max_tokens at this decode speed on top of the prefill
+    INFERENCE_DECODE_TOKENS_PER_SECOND: float = 5.0
+    # Parallel slots per llama-server, used when /props does not report
+    # total_slots (threads are pinned to slots for prompt-cache reuse)
+    INFERENCE_SLOTS: int = 1
+    # After a stream ends early (stop, error), hold its slot until the server's
+    # /slots shows it idle, waiting at most this long (seconds; 0 disables)
+    INFERENCE_RELEASE_CONFIRM_SECONDS: float = 0.0
+    # Circuit breaker per backend (chat tiers, embeddings): over the last
+    # BREAKER_WINDOW calls, once BREAKER_MIN_CALLS are in and this share failed
+    # (errors, timeouts, or no answer within BREAKER_SLOW_SECONDS) calls fail
+    # fast until /health recovers (0 disables)
+    BREAKER_FAILURE_RATE: float = 0.5
+    BREAKER_WINDOW: int = 20
+    BREAKER_MIN_CALLS: int = 5
+    BREAKER_SLOW_SECONDS: float = 30.0
+    # Chat context budget: the per-slot window when /props does not report
+    # n_ctx, and the part of it kept free for the answer (thinking included)
+    CHAT_CONTEXT_TOKENS: int = 4096
+    CHAT_RESPONSE_RESERVE_TOKENS: int = 1024
+    # Compaction (PLAN 2.4): once a thread's prompt passes this fraction of the
+    # budget, its oldest turns are folded into a rolling summary of about
+    # CHAT_SUMMARY_TOKENS in the background (0 disables)
+    CHAT_COMPACT_AT: float = 0.75
+    CHAT_SUMMARY_TOKENS: int = 512
+    # Generation budget per tier: reasoning tokens before a thinking run is
+    # switched to its answer, and a ceiling on the whole completion on top of
+    # the window left after the prompt (0 disables either)
+    SMALL_REASONING_BUDGET_TOKENS: int = 2048
+    SMALL_MAX_COMPLETION_TOKENS: int = 0
+    BIG_REASONING_BUDGET_TOKENS: int = 4096
+    BIG_MAX_COMPLETION_TOKENS: int = 0
+
+    # Chat stream framing: merge consecutive token deltas into one NDJSON line
+    # per window (0 disables) or once a frame reaches this many characters
+    STREAM_COALESCE_MS: float = 0.0
+    STREAM_COALESCE_CHARS: int = 2048
+    # Single-text embeddings (search queries) requested within this window
+    # share one /v1/embeddings request of up to EMBED_BATCH_SIZE texts (ms;
+    # 0 sends each on its own)
+    EMBED_COALESCE_MS: float = 2.0
+    # Event-log memory (MiB) the generation registry keeps for reconnects;
+    # finished runs beyond it are evicted before their grace period ends
+    GENERATION_EVENTS_CAP_MB: int = 64
+
     # Vector config
     VECTOR_DIM: int = 1024
     DESKTOP_VECTOR_DB_PATH: str = "./data/vectors"
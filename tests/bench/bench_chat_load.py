@@ -0,0 +1,534 @@
+"""Benchmark: concurrent users chatting against the whole app (PLAN 6.2).
+
+Not collected by pytest. Run from the repo root:
+
+    python tests/bench/bench_chat_load.py [--users 20] [--turns 3] [--output bench.json]
+    python tests/bench/bench_chat_load.py --database-url postgresql+asyncpg://u:p@host/db
+
+Starts the fake llama-server (scripts/fake_llama_server.py) and the API as
+subprocesses, migrates a fresh database (a temporary SQLite file unless
+`--database-url` is given; a Postgres database should be empty), registers
+`--users` users (seeded straight into the database when /api/auth/register
+rejects them, e.g. an offline machine failing the e-mail deliverability
+check) and has each hold a `--turns` turn conversation through
+/api/chat/stream. `--stop-fraction` of the turns are stopped mid-answer
+through /api/chat/stop, `--retry-fraction` of the finished ones are
+regenerated through /api/chat/retry, and every turn lists the user's threads.
+
+Client side it measures TTFT (request sent to first token), end-to-end
+latency, tokens per second per stream, stop-to-end latency and per-endpoint
+latency and errors. Server side it scrapes /api/metrics for event loop lag,
+database write latency (lock waits included), lock errors and the time from
+an accepted stop to the released inference slot. With
+`--workers` > 1 the scrape reflects the one worker that answered it.
+
+The report is a JSON file with sorted keys and rounded values, meant to be
+diffed between commits.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHUNK_EVENTS = {"new_chunk", "new_thinking_chunk"}
+PASSWORD = "Bench-pass1"
+STARTUP_SECONDS = 60.0
+PROMPT_WORDS = "please explain how the river flows past the old mill and why".split()
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def _summary(values: list[float]) -> dict[str, float]:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return ordered[min(int(math.ceil(q * len(ordered))) - 1, len(ordered) - 1)]
+
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "p50": pick(0.5),
+        "p90": pick(0.9),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+    }
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.latency: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.ttft: list[float] = []
+        self.e2e: list[float] = []
+        self.tokens_per_second: list[float] = []
+        self.stop_to_end: list[float] = []
+
+    def requests(self) -> dict[str, dict]:
+        names = sorted(set(self.latency) | set(self.errors))
+        return {
+            name: {
+                "errors": self.errors.get(name, 0),
+                "latency_seconds": _summary(self.latency.get(name, [])),
+            }
+            for name in names
+        }
+
+
+async def _timed(recorder: Recorder, name: str, call) -> httpx.Response | None:
+    started = time.perf_counter()
+    try:
+        response = await call()
+    except httpx.HTTPError:
+        recorder.errors[name] += 1
+        return None
+    recorder.latency[name].append(time.perf_counter() - started)
+    if response.status_code >= 400:
+        recorder.errors[name] += 1
+    return response
+
+
+def _email(index: int) -> str:
+    return f"bench{index}@example.com"
+
+
+async def _register(http: httpx.AsyncClient, recorder: Recorder, index: int) -> str | None:
+    response = await _timed(
+        recorder,
+        "register",
+        lambda: http.post(
+            "/api/auth/register",
+            json={
+                "email": _email(index),
+                "name": f"bench_{index}",
+                "password": PASSWORD,
+            },
+        ),
+    )
+    if response is None or response.status_code != 201:
+        return None
+    return response.json()["token"]
+
+
+async def _stream_turn(
+    http: httpx.AsyncClient,
+    recorder: Recorder,
+    name: str,
+    path: str,
+    body: dict,
+    headers: dict,
+    stop_after: int | None,
+) -> str | None:
+    """Drive one streamed generation; returns its thread id."""
+    thread_id = body.get("threadId")
+    started = time.perf_counter()
+    chunk_times: list[float] = []
+    stop_sent: float | None = None
+    stop_task: asyncio.Task | None = None
+    try:
+        async with http.stream("POST", path, json=body, headers=headers) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                recorder.errors[name] += 1
+                return thread_id
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                thread_id = thread_id or event.get("threadId")
+                if event.get("event") not in CHUNK_EVENTS:
+                    continue
+                chunk_times.append(time.perf_counter())
+                if stop_after is not None and len(chunk_times) == stop_after:
+                    stop_sent = time.perf_counter()
+                    stop_task = asyncio.create_task(
+                        _timed(
+                            recorder,
+                            "stop",
+                            lambda: http.post(
+                                "/api/chat/stop", json={"threadId": thread_id}, headers=headers
+                            ),
+                        )
+                    )
+    except httpx.HTTPError:
+        recorder.errors[name] += 1
+        return thread_id
+    ended = time.perf_counter()
+    if stop_task is not None:
+        await stop_task
+    recorder.latency[name].append(ended - started)
+    recorder.e2e.append(ended - started)
+    if chunk_times:
+        recorder.ttft.append(chunk_times[0] - started)
+    if len(chunk_times) > 1 and chunk_times[-1] > chunk_times[0]:
+        recorder.tokens_per_second.append(
+            (len(chunk_times) - 1) / (chunk_times[-1] - chunk_times[0])
+        )
+    if stop_sent is not None:
+        recorder.stop_to_end.append(ended - stop_sent)
+    return thread_id
+
+
+async def _conversation(
+    http: httpx.AsyncClient, recorder: Recorder, token: str, args, rng: random.Random
+) -> None:
+    headers = {"Authorization": f"Bearer {token}"}
+    thread_id: str | None = None
+    for _ in range(args.turns):
+        await asyncio.sleep(rng.uniform(0, 2 * args.think_seconds))
+        words = rng.choices(PROMPT_WORDS, k=args.prompt_words)
+        body = {"message": " ".join(words), "enableThinking": args.reasoning_tokens > 0}
+        if thread_id:
+            body["threadId"] = thread_id
+        stop_after = (
+            rng.randint(1, max(args.completion_tokens // 2, 1))
+            if rng.random() < args.stop_fraction
+            else None
+        )
+        thread_id = await _stream_turn(
+            http, recorder, "stream", "/api/chat/stream", body, headers, stop_after
+        )
+        if thread_id and stop_after is None and rng.random() < args.retry_fraction:
+            await _stream_turn(
+                http,
+                recorder,
+                "retry",
+                "/api/chat/retry",
+                {"threadId": thread_id, "enableThinking": body["enableThinking"]},
+                headers,
+                None,
+            )
+        await _timed(
+            recorder, "list_threads", lambda: http.get("/api/thread/all", headers=headers)
+        )
+
+
+_SAMPLE = re.compile(r"^(?P<name>[a-z_]+)(?:\{(?P<labels>[^}]*)\})? (?P<value>\S+)$")
+
+
+def _parse_metrics(text: str) -> dict[str, list[tuple[dict[str, str], float]]]:
+    samples: dict[str, list[tuple[dict[str, str], float]]] = defaultdict(list)
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if not match:
+            continue
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', match.group("labels") or ""))
+        samples[match.group("name")].append((labels, float(match.group("value"))))
+    return samples
+
+
+def _histogram(samples, name: str, keep=lambda labels: True) -> dict[str, float]:
+    """Merge a histogram's children; percentiles are bucket upper bounds."""
+    buckets: dict[float, float] = defaultdict(float)
+    for labels, value in samples.get(f"{name}_bucket", []):
+        if keep(labels):
+            buckets[float(labels["le"])] += value
+    count = sum(v for labels, v in samples.get(f"{name}_count", []) if keep(labels))
+    total = sum(v for labels, v in samples.get(f"{name}_sum", []) if keep(labels))
+    if not count:
+        return {"count": 0}
+
+    def bound(q: float) -> float:
+        for le in sorted(buckets):
+            if buckets[le] >= q * count:
+                return le
+        return math.inf
+
+    return {
+        "count": int(count),
+        "mean": total / count,
+        "p50_le": bound(0.5),
+        "p99_le": bound(0.99),
+    }
+
+
+def _server_report(text: str) -> dict:
+    samples = _parse_metrics(text)
+    writes = {"insert", "update", "delete"}
+    return {
+        "event_loop_lag_seconds": _histogram(samples, "clyre_event_loop_lag_seconds"),
+        "db_write_seconds": _histogram(
+            samples, "clyre_db_statement_seconds", lambda labels: labels.get("kind") in writes
+        ),
+        "db_select_seconds": _histogram(
+            samples, "clyre_db_statement_seconds", lambda labels: labels.get("kind") == "select"
+        ),
+        "db_lock_errors": int(
+            sum(value for _, value in samples.get("clyre_db_lock_errors_total", []))
+        ),
+        "db_session_seconds": _histogram(samples, "clyre_db_session_seconds"),
+        "ttft_seconds": _histogram(samples, "clyre_generation_ttft_seconds"),
+        "stop_release_seconds": _histogram(samples, "clyre_generation_stop_release_seconds"),
+    }
+
+
+def _rounded(value):
+    if isinstance(value, float):
+        return None if math.isinf(value) else round(value, 6)
+    if isinstance(value, dict):
+        return {key: _rounded(item) for key, item in value.items()}
+    return value
+
+
+async def _wait_ready(url: str, process: subprocess.Popen) -> None:
+    deadline = time.monotonic() + STARTUP_SECONDS
+    async with httpx.AsyncClient() as http:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode}")
+            try:
+                if (await http.get(url, timeout=1.0)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {STARTUP_SECONDS:.0f}s")
+
+
+async def _seed_users(indices: list[int]) -> list[str]:
+    """Create users through the auth service; runs with the API's environment."""
+    sys.path[:0] = [ROOT, os.path.join(ROOT, "api")]
+    import db
+    from services.auth import AuthService
+
+    service = AuthService()
+    tokens = []
+    async with db.get_session_manager().async_session_maker() as session:
+        for index in indices:
+            access, _ = await service.register_locally(
+                session, name=f"bench_{index}", password=PASSWORD, email=_email(index)
+            )
+            tokens.append(access.token)
+        await session.commit()
+    await db.get_session_manager().close()
+    return tokens
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="clyre_bench_")
+    llama_port, api_port = _free_port(), _free_port()
+    llama_url = f"http://127.0.0.1:{llama_port}"
+    api_url = f"http://127.0.0.1:{api_port}"
+    database_url = args.database_url or f"sqlite+aiosqlite:///{workdir}/bench.sqlite3"
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join([ROOT, os.path.join(ROOT, "api")]),
+        "DATABASE_URL": database_url,
+        "DB_ENGINE": "sqlite" if database_url.startswith("sqlite") else "postgres",
+        "SMALL_BASE_URL": llama_url,
+        "SMALL_MODEL": "qwen3-fake",
+        "EMBEDDING_BASE_URL": llama_url,
+        "EMBEDDING_MODEL": "fake-embedding",
+        "VECTOR_DIM": str(args.embedding_dim),
+        "FILES_DIR": os.path.join(workdir, "files"),
+        "HASHING_SECRET": "bench",
+        "ACCESS_TOKEN_SECRET": "bench",
+    }
+    llama_flags = {
+        "slots": args.slots,
+        "tokens-per-second": args.tokens_per_second,
+        "prefill-tokens-per-second": args.prefill_tokens_per_second,
+        "completion-tokens": args.completion_tokens,
+        "reasoning-tokens": args.reasoning_tokens,
+        "embedding-dim": args.embedding_dim,
+    }
+    # Server logs go to the work directory; the console keeps the summary.
+    log = open(os.path.join(workdir, "servers.log"), "w", encoding="utf-8")
+    llama = subprocess.Popen(
+        [sys.executable, "-m", "scripts.fake_llama_server", "--port", str(llama_port)]
+        + [item for flag, value in llama_flags.items() for item in (f"--{flag}", str(value))],
+        cwd=ROOT,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    api = None
+    try:
+        subprocess.run(
+            [sys.executable, "-m", "db_migrations"],
+            cwd=ROOT,
+            env=env,
+            check=True,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        await _wait_ready(f"{llama_url}/health", llama)
+        api = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "app:app",
+                "--port",
+                str(api_port),
+                "--workers",
+                str(args.workers),
+                "--log-level",
+                "warning",
+            ],
+            cwd=os.path.join(ROOT, "api"),
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        await _wait_ready(f"{api_url}/api/metrics", api)
+
+        recorder = Recorder()
+        rng = random.Random(args.seed)
+        limits = httpx.Limits(max_connections=args.users * 3, max_keepalive_connections=None)
+        timeout = httpx.Timeout(args.request_timeout)
+        async with httpx.AsyncClient(base_url=api_url, limits=limits, timeout=timeout) as http:
+            registering = asyncio.Semaphore(8)
+
+            async def register(index: int) -> str | None:
+                async with registering:
+                    return await _register(http, recorder, index)
+
+            tokens = await asyncio.gather(*(register(index) for index in range(args.users)))
+            missing = [index for index, token in enumerate(tokens) if token is None]
+            if missing:
+                print(f"{len(missing)} registrations rejected; seeding them directly")
+                seeded = subprocess.run(
+                    [sys.executable, __file__, "--seed-users", ",".join(map(str, missing))],
+                    cwd=ROOT,
+                    env=env,
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                )
+                by_index = dict(zip(missing, json.loads(seeded.stdout.splitlines()[-1])))
+                tokens = [token or by_index[index] for index, token in enumerate(tokens)]
+            started = time.perf_counter()
+            await asyncio.gather(
+                *(
+                    _conversation(http, recorder, token, args, random.Random(rng.random()))
+                    for token in tokens
+                    if token
+                )
+            )
+            duration = time.perf_counter() - started
+            scrape = await http.get("/api/metrics")
+    finally:
+        for process in (api, llama):
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+        log.close()
+        print(f"server logs: {log.name}")
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    config["database"] = "sqlite" if database_url.startswith("sqlite") else "postgres"
+    config.pop("database_url")
+    return _rounded(
+        {
+            "commit": _commit(),
+            "config": config,
+            "duration_seconds": duration,
+            "client": {
+                "ttft_seconds": _summary(recorder.ttft),
+                "e2e_seconds": _summary(recorder.e2e),
+                "tokens_per_second": _summary(recorder.tokens_per_second),
+                "stop_to_end_seconds": _summary(recorder.stop_to_end),
+                "requests": recorder.requests(),
+            },
+            "server": _server_report(scrape.text),
+        }
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--database-url", default=None, help="default: a temporary SQLite file")
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=2000.0)
+    parser.add_argument("--completion-tokens", type=int, default=48)
+    parser.add_argument("--reasoning-tokens", type=int, default=0)
+    parser.add_argument("--embedding-dim", type=int, default=1024)
+    parser.add_argument("--prompt-words", type=int, default=40)
+    parser.add_argument("--think-seconds", type=float, default=0.5)
+    parser.add_argument("--stop-fraction", type=float, default=0.2)
+    parser.add_argument("--retry-fraction", type=float, default=0.2)
+    parser.add_argument("--request-timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_chat_load.json")
+    parser.add_argument("--seed-users", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.seed_users is not None:
+        indices = [int(index) for index in args.seed_users.split(",")]
+        print(json.dumps(asyncio.run(_seed_users(indices))))
+        return
+
+    report = asyncio.run(run(args))
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2, sort_keys=True)
+        handle.write("\n")
+
+    client, server = report["client"], report["server"]
+    print(f"{args.users} users x {args.turns} turns in {report['duration_seconds']:.1f}s")
+    for label, key in (("TTFT", "ttft_seconds"), ("end to end", "e2e_seconds")):
+        stats = client[key]
+        if stats["count"]:
+            print(
+                f"  {label:<12} p50 {stats['p50'] * 1e3:8.1f} ms  "
+                f"p99 {stats['p99'] * 1e3:8.1f} ms  ({stats['count']})"
+            )
+    if client["tokens_per_second"]["count"]:
+        print(f"  tok/s/stream p50 {client['tokens_per_second']['p50']:8.1f}")
+    for name, item in client["requests"].items():
+        print(
+            f"  {name:<12} {item['latency_seconds'].get('count', 0):5d} req  {item['errors']} err"
+        )
+    lag = server["event_loop_lag_seconds"]
+    if lag["count"]:
+        print(f"  loop lag     mean {lag['mean'] * 1e3:6.2f} ms  p99 <= {lag['p99_le']} s")
+    writes = server["db_write_seconds"]
+    if writes["count"]:
+        print(
+            f"  db writes    mean {writes['mean'] * 1e3:6.2f} ms  p99 <= {writes['p99_le']} s  "
+            f"lock errors {server['db_lock_errors']}"
+        )
+    print(f"report: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Benchmark: concurrent search queries through EmbeddingPipeline.embed_one.
+
+Not collected by pytest. Run from the repo root:
+
+    python tests/bench/bench_embed_coalesce.py [--concurrency 1 4 16 64 256] [--window-ms 2]
+
+Starts the fake llama-server (scripts/fake_llama_server.py) as a subprocess
+with `--slots` parallel slots and a fixed `--request-ms` cost per embeddings
+request on top of its per-token prefill, which stands in for the model's
+per-batch overhead. At each concurrency level that many clients embed
+`--queries` queries each, back to back, once with one request per query
+(EMBED_COALESCE_MS=0) and once with `--window-ms` coalescing. Reports
+throughput, embeddings requests sent and per-query latency.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "api")]
+DIM = 64
+# Settings() needs these at import time; the benchmark never touches them.
+os.environ.setdefault("HASHING_SECRET", "bench")
+os.environ.setdefault("ACCESS_TOKEN_SECRET", "bench")
+os.environ["VECTOR_DIM"] = str(DIM)
+
+from pipelines.embed import EmbeddingPipeline  # noqa: E402
+from utils import env  # noqa: E402
+
+QUERY_WORDS = "how does the river flow past the old mill in spring".split()
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+async def _wait_ready(url: str) -> None:
+    async with httpx.AsyncClient() as client:
+        for _ in range(200):
+            try:
+                if (await client.get(f"{url}/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.05)
+    raise RuntimeError(f"fake llama-server at {url} did not start")
+
+
+async def bench(url: str, concurrency: int, queries: int, window_ms: float) -> dict:
+    env.EMBED_COALESCE_MS = window_ms
+    pipe = EmbeddingPipeline(url, "fake-embedding")
+    await pipe.wait_for_startup()
+    latencies: list[float] = []
+
+    async def client(index: int) -> None:
+        for turn in range(queries):
+            words = QUERY_WORDS[(index + turn) % len(QUERY_WORDS) :] + [str(index), str(turn)]
+            started = time.perf_counter()
+            await pipe.embed_one(" ".join(words))
+            latencies.append(time.perf_counter() - started)
+
+    before = pipe.pool_stats().requests
+    started = time.perf_counter()
+    await asyncio.gather(*(client(index) for index in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    sent = pipe.pool_stats().requests - before
+    await pipe.aclose()
+    latencies.sort()
+    return {
+        "qps": len(latencies) / elapsed,
+        "requests": sent,
+        "texts_per_request": len(latencies) / sent,
+        "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99)],
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64, 256])
+    parser.add_argument("--queries", type=int, default=20, help="queries per client")
+    parser.add_argument("--window-ms", type=float, default=2.0)
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument("--request-ms", type=float, default=5.0)
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=20000.0)
+    args = parser.parse_args()
+
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    flags = {
+        "port": port,
+        "slots": args.slots,
+        "prefill-seconds": args.request_ms / 1000,
+        "prefill-tokens-per-second": args.prefill_tokens_per_second,
+        "embedding-dim": DIM,
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "scripts.fake_llama_server"]
+        + [item for flag, value in flags.items() for item in (f"--{flag}", str(value))],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        await _wait_ready(url)
+        print(
+            f"{args.slots} slots, {args.request_ms:g} ms per request + "
+            f"{args.prefill_tokens_per_second:g} tok/s prefill, {args.queries} queries/client"
+        )
+        for concurrency in args.concurrency:
+            print(f"  {concurrency} concurrent clients")
+            for name, window in (("one request/query", 0.0), ("coalesced", args.window_ms)):
+                result = await bench(url, concurrency, args.queries, window)
+                print(
+                    f"    {name:<18} {result['qps']:8.0f} queries/s  "
+                    f"{result['requests']:6d} requests ({result['texts_per_request']:5.1f} "
+                    f"texts each)  p50 {result['p50'] * 1e3:7.2f} ms  "
+                    f"p99 {result['p99'] * 1e3:7.2f} ms"
+                )
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
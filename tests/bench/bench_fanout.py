@@ -0,0 +1,116 @@
+"""Benchmark: one publisher fanning a generation out to many subscribers.
+
+Not collected by pytest. Run from the repo root:
+
+    python tests/bench/bench_fanout.py [--subscribers 50] [--rate 60] [--burst 3]
+
+A publisher emits `--rate` tokens/s in bursts of `--burst` (upstream SSE
+events tend to arrive several per socket read). Every subscriber hands what
+it receives to a fake transport costing one event-loop hop per write, like a
+Starlette `send`. Compares one write per event (`subscribe`) with one write
+per wakeup (`stream`) on CPU per token, writes per subscriber and delivery
+latency.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "api")]
+# Settings() needs these at import time; the benchmark never touches them.
+os.environ.setdefault("HASHING_SECRET", "bench")
+os.environ.setdefault("ACCESS_TOKEN_SECRET", "bench")
+
+from schemas.chatting import encode_chunk_line  # noqa: E402
+from services.generation import GenerationRun, GenerationStatus  # noqa: E402
+
+
+class Transport:
+    """Counts writes and records when each event's bytes went out."""
+
+    def __init__(self, sent_at: dict[int, float]):
+        self.writes = 0
+        self.events = 0
+        self.latencies: list[float] = []
+        self._sent_at = sent_at
+
+    async def send(self, body: str) -> None:
+        body.encode("utf-8")
+        await asyncio.sleep(0)
+        now = time.perf_counter()
+        self.writes += 1
+        for _ in range(body.count("\n")):
+            self.latencies.append(now - self._sent_at[self.events])
+            self.events += 1
+
+
+async def _per_event(run: GenerationRun, transport: Transport) -> None:
+    async for line in run.subscribe(0):
+        await transport.send(line)
+
+
+async def _batched(run: GenerationRun, transport: Transport) -> None:
+    async for body in run.stream(0):
+        await transport.send(body)
+
+
+async def bench(mode, subscribers: int, tokens: int, rate: float, burst: int) -> dict:
+    run = GenerationRun("bench")
+    sent_at: dict[int, float] = {}
+    transports = [Transport(sent_at) for _ in range(subscribers)]
+    readers = [asyncio.create_task(mode(run, transport)) for transport in transports]
+    await asyncio.sleep(0)
+    interval = burst / rate
+    start = time.process_time()
+    for first in range(0, tokens, burst):
+        for index in range(first, min(first + burst, tokens)):
+            sent_at[index] = time.perf_counter()
+            run.publish_nowait(encode_chunk_line("new_chunk", " tok"))
+        await asyncio.sleep(interval)
+    await run.finish(GenerationStatus.FINISHED)
+    await asyncio.gather(*readers)
+    cpu = time.process_time() - start
+    latencies = sorted(value for t in transports for value in t.latencies)
+    return {
+        "cpu": cpu,
+        "writes": statistics.mean(t.writes for t in transports),
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[int(len(latencies) * 0.99)],
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=60.0, help="tokens per second")
+    parser.add_argument("--burst", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+    tokens = int(args.rate * args.seconds)
+
+    # Baseline for the sleep-driven publisher loop, subtracted from each mode.
+    idle_start = time.process_time()
+    for _ in range(0, tokens, args.burst):
+        await asyncio.sleep(args.burst / args.rate)
+    idle = time.process_time() - idle_start
+
+    print(
+        f"1 publisher, {args.subscribers} subscribers, {args.rate:g} tok/s "
+        f"in bursts of {args.burst}, {tokens} tokens"
+    )
+    for name, mode in (("one write per event", _per_event), ("one write per wakeup", _batched)):
+        result = await bench(mode, args.subscribers, tokens, args.rate, args.burst)
+        per_token = max(result["cpu"] - idle, 0.0) / tokens * 1e6
+        print(
+            f"  {name:<22} {per_token:8.1f} us CPU/token  "
+            f"{result['writes']:7.0f} writes/subscriber  "
+            f"p50 {result['p50'] * 1e3:6.3f} ms  p99 {result['p99'] * 1e3:6.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
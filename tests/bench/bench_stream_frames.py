@@ -0,0 +1,135 @@
+"""Microbenchmark: CPU per generated token on the chat event path.
+
+Not collected by pytest. Run from the repo root:
+
+    python tests/bench/bench_stream_frames.py [--tokens 3000] [--subscribers 2]
+
+Compares the pre-coalescing path (pydantic dump + asyncio.Condition wakeup per
+token) with the precompiled encoder alone and with frame coalescing, each
+driven at a fixed token rate with live subscribers attached.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "api")]
+# Settings() needs these at import time; the benchmark never touches them.
+os.environ.setdefault("HASHING_SECRET", "bench")
+os.environ.setdefault("ACCESS_TOKEN_SECRET", "bench")
+
+from schemas.chatting import StreamingBlock  # noqa: E402
+from services.generation import FrameCoalescer, GenerationRun, GenerationStatus  # noqa: E402
+
+TOKEN = " tok"
+
+
+class LegacyRun:
+    """The event buffer as it was: Condition-guarded list, model dump per line."""
+
+    def __init__(self):
+        self.events: list[str] = []
+        self.done = False
+        self.cond = asyncio.Condition()
+
+    async def publish(self, line: str) -> None:
+        async with self.cond:
+            self.events.append(line)
+            self.cond.notify_all()
+
+    async def finish(self) -> None:
+        async with self.cond:
+            self.done = True
+            self.cond.notify_all()
+
+    async def subscribe(self):
+        index = 0
+        while True:
+            async with self.cond:
+                while index >= len(self.events) and not self.done:
+                    await self.cond.wait()
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.done and index >= len(self.events):
+                return
+
+
+async def _drain(iterator) -> int:
+    count = 0
+    async for _ in iterator:
+        count += 1
+    return count
+
+
+async def bench_legacy(tokens: int, subscribers: int, interval: float) -> tuple[float, int]:
+    run = LegacyRun()
+    readers = [asyncio.create_task(_drain(run.subscribe())) for _ in range(subscribers)]
+    start = time.process_time()
+    for _ in range(tokens):
+        line = StreamingBlock(chunk=TOKEN, event="new_chunk").model_dump_json(by_alias=True)
+        await run.publish(line + "\n")
+        await asyncio.sleep(interval)
+    await run.finish()
+    lines = (await asyncio.gather(*readers))[0]
+    return time.process_time() - start, lines
+
+
+async def bench_frames(
+    tokens: int, subscribers: int, interval: float, window: float
+) -> tuple[float, int]:
+    run = GenerationRun("bench")
+    readers = [asyncio.create_task(_drain(run.subscribe())) for _ in range(subscribers)]
+    frames = FrameCoalescer(run, window)
+    start = time.process_time()
+    for _ in range(tokens):
+        frames.add("new_chunk", TOKEN)
+        await asyncio.sleep(interval)
+    frames.flush()
+    await run.finish(GenerationStatus.FINISHED)
+    lines = (await asyncio.gather(*readers))[0]
+    return time.process_time() - start, lines
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=3000)
+    parser.add_argument("--subscribers", type=int, default=2)
+    parser.add_argument("--interval-ms", type=float, default=1.0)
+    parser.add_argument("--window-ms", type=float, default=25.0)
+    args = parser.parse_args()
+    interval = args.interval_ms / 1000
+
+    # Baseline for the sleep-driven loop itself, subtracted from every mode.
+    idle_start = time.process_time()
+    for _ in range(args.tokens):
+        await asyncio.sleep(interval)
+    idle = time.process_time() - idle_start
+
+    results = [
+        (
+            "legacy (model dump + condition)",
+            await bench_legacy(args.tokens, args.subscribers, interval),
+        ),
+        (
+            "encoder, no coalescing",
+            await bench_frames(args.tokens, args.subscribers, interval, 0),
+        ),
+        (
+            f"encoder + {args.window_ms:g} ms frames",
+            await bench_frames(args.tokens, args.subscribers, interval, args.window_ms / 1000),
+        ),
+    ]
+    print(
+        f"{args.tokens} tokens, {args.subscribers} subscribers, {args.interval_ms:g} ms/token"
+    )
+    for name, (cpu, lines) in results:
+        per_token = max(cpu - idle, 0.0) / args.tokens * 1e6
+        print(f"  {name:<34} {per_token:8.2f} us CPU/token  {lines:6d} lines")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
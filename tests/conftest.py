@@ -62,13 +62,25 @@ def repo():
 async def _clean_generation_registry():
     """The generation registry is module-global; a done (or worse, RUNNING)
     run leaked from a failed test would poison every later test."""
+    import services.chatting as chatting_module
     import services.generation as generation_module
 
     yield
+    for task in chatting_module._compaction_tasks.values():
+        task.cancel()
+    chatting_module._compaction_tasks.clear()
     for handle in generation_module._eviction_timers.values():
         handle.cancel()
     generation_module._eviction_timers.clear()
     generation_module._runs.clear()
+    generation_module._finished.clear()
+    # The flusher's tick task and lock belong to this test's event loop.
+    if generation_module._flusher is not None:
+        try:
+            await generation_module.close_partial_flusher()
+        except Exception:
+            pass
+        generation_module._flusher = None
 
 
 @pytest.fixture
@@ -0,0 +1,159 @@
+import asyncio
+
+import httpx
+import pytest
+
+import pipelines.breaker as breaker_module
+from pipelines.breaker import BackendUnavailable, BreakerState, CircuitBreaker
+from pipelines.embed import EmbeddingPipeline
+from pipelines.inference import LLMPipeline
+from utils import env
+
+
+@pytest.fixture(autouse=True)
+def _fast_breaker(monkeypatch):
+    monkeypatch.setattr(breaker_module, "OPEN_SECONDS", 0.05)
+    monkeypatch.setattr(env, "BREAKER_FAILURE_RATE", 0.5)
+    monkeypatch.setattr(env, "BREAKER_MIN_CALLS", 4)
+    monkeypatch.setattr(env, "BREAKER_SLOW_SECONDS", 30.0)
+
+
+async def _fail(breaker: CircuitBreaker, exc: Exception) -> None:
+    with pytest.raises(type(exc)):
+        async with breaker.call():
+            raise exc
+
+
+async def _succeed(breaker: CircuitBreaker) -> None:
+    async with breaker.call():
+        pass
+
+
+async def test_opens_on_failure_rate_and_fails_fast():
+    probes = 0
+
+    async def probe() -> bool:
+        nonlocal probes
+        probes += 1
+        return False
+
+    breaker = CircuitBreaker("test", probe)
+    await _succeed(breaker)
+    await _succeed(breaker)
+    await _fail(breaker, httpx.ConnectError("refused"))
+    assert breaker.state is BreakerState.CLOSED  # below BREAKER_MIN_CALLS
+    await _fail(breaker, httpx.ReadTimeout("hung"))
+    assert breaker.state is BreakerState.OPEN
+
+    with pytest.raises(BackendUnavailable) as info:
+        async with breaker.call():
+            pytest.fail("an open circuit must not run the call")
+    assert info.value.backend == "test"
+    assert 0 < info.value.retry_after <= 0.05
+    assert breaker.stats()["rejected"] == 1
+    assert probes == 0
+    await breaker.aclose()
+
+
+async def test_request_errors_and_cancellation_do_not_count():
+    breaker = CircuitBreaker("test", lambda: asyncio.sleep(0, True))
+    request = httpx.Request("POST", "http://a")
+    bad_request = httpx.HTTPStatusError(
+        "bad", request=request, response=httpx.Response(400, request=request)
+    )
+    for _ in range(4):
+        await _fail(breaker, bad_request)
+        with pytest.raises(asyncio.CancelledError):
+            async with breaker.call():
+                raise asyncio.CancelledError
+    assert breaker.stats()["calls"] == 0
+    assert breaker.state is BreakerState.CLOSED
+
+
+async def test_slow_responses_count_as_failures(monkeypatch):
+    monkeypatch.setattr(env, "BREAKER_SLOW_SECONDS", 0.01)
+    breaker = CircuitBreaker("test", lambda: asyncio.sleep(0, False))
+    for _ in range(4):
+        async with breaker.call() as call:
+            await asyncio.sleep(0.02)
+            call.responded()
+    assert breaker.state is BreakerState.OPEN
+    await breaker.aclose()
+
+
+async def test_half_open_probe_reopens_with_backoff_then_closes():
+    healthy = asyncio.Event()
+    probed = asyncio.Event()
+
+    async def probe() -> bool:
+        probed.set()
+        return healthy.is_set()
+
+    breaker = CircuitBreaker("test", probe)
+    for _ in range(4):
+        await _fail(breaker, httpx.ConnectError("refused"))
+
+    await asyncio.wait_for(probed.wait(), 1)
+    await asyncio.sleep(0)
+    assert breaker.state is BreakerState.OPEN
+    assert breaker.stats()["retry_after"] > 0.05  # doubled after the failed probe
+
+    healthy.set()
+    for _ in range(50):
+        if breaker.state is BreakerState.CLOSED:
+            break
+        await asyncio.sleep(0.01)
+    assert breaker.state is BreakerState.CLOSED
+    assert breaker.stats()["calls"] == 0
+    assert breaker.stats()["opened"] == 1
+    await _succeed(breaker)
+    await breaker.aclose()
+
+
+async def test_disabled_breaker_never_opens(monkeypatch):
+    monkeypatch.setattr(env, "BREAKER_FAILURE_RATE", 0.0)
+    breaker = CircuitBreaker("test", lambda: asyncio.sleep(0, True))
+    for _ in range(8):
+        await _fail(breaker, httpx.ConnectError("refused"))
+    assert breaker.state is BreakerState.CLOSED
+
+
+async def test_embedding_pipeline_fails_fast_while_open():
+    requests: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path)
+        return httpx.Response(503)
+
+    pipe = EmbeddingPipeline("http://e1", "m", transport=httpx.MockTransport(handler))
+    for _ in range(4):
+        with pytest.raises(httpx.HTTPStatusError):
+            await pipe.embed(["a"])
+    assert pipe.breaker_stats()["state"] == "open"
+
+    sent = len(requests)
+    with pytest.raises(BackendUnavailable):
+        await pipe.embed(["a"])
+    assert len(requests) == sent  # rejected without a request
+    await pipe.aclose()
+
+
+async def test_slow_sync_completions_do_not_open_the_breaker(monkeypatch):
+    monkeypatch.setattr(env, "BREAKER_SLOW_SECONDS", 0.01)
+    monkeypatch.setattr(env, "INFERENCE_DECODE_TOKENS_PER_SECOND", 1000.0)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path != "/v1/chat/completions":
+            return httpx.Response(404)
+        await asyncio.sleep(0.03)  # past BREAKER_SLOW_SECONDS, within the decode allowance
+        body = {"id": "x", "choices": [], "usage": {}, "timings": {}}
+        return httpx.Response(200, json=body)
+
+    pipe = LLMPipeline("http://llama", "m", httpx.MockTransport(handler))
+    history = [{"role": "user", "content": "Summarize"}]
+    for _ in range(4):
+        await pipe.chat_completion_sync(history, max_tokens=512, prompt_tokens=100)
+        await pipe.chat_completion_sync(history)  # uncapped: latency never counts
+    assert pipe.breaker_stats()["state"] == "closed"
+    assert pipe.breaker_stats()["failure_rate"] == 0.0
+    await pipe.aclose()
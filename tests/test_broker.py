@@ -0,0 +1,127 @@
+"""Cross-process generation registry: two links in one process stand in for
+two API workers, each with its own run table."""
+
+import asyncio
+import os
+import tempfile
+
+import pytest_asyncio
+
+import services.broker as broker_module
+from services.broker import BrokerLink
+from services.generation import GenerationRun, GenerationStatus
+
+
+async def _settle():
+    # Fire-and-forget notices travel on their own connection.
+    await asyncio.sleep(0.05)
+
+
+@pytest_asyncio.fixture
+async def workers(monkeypatch):
+    monkeypatch.setattr(broker_module, "BROKER_RETRY_SECONDS", 0.02)
+    monkeypatch.setattr(broker_module, "BROKER_TIMEOUT_SECONDS", 2.0)
+    path = os.path.join(tempfile.mkdtemp(), "broker.sock")
+    links = []
+
+    async def spawn():
+        runs: dict[str, GenerationRun] = {}
+        link = BrokerLink(path, lookup=runs.get)
+        await link.start()
+        links.append(link)
+        return link, runs
+
+    yield spawn
+    for link in links:
+        await link.aclose()
+
+
+async def _idle():
+    await asyncio.sleep(3600)
+
+
+async def test_claims_are_exclusive_until_the_owner_finishes(workers):
+    a, _ = await workers()
+    b, _ = await workers()
+    assert a.hosting and not b.hosting
+
+    assert await a.claim("t1")
+    assert not await b.claim("t1")
+    assert await a.claim("t1")  # the owner may start again
+
+    a.finished("t1")
+    await _settle()
+    assert await b.claim("t1")
+    assert a.active_threads() == {"t1"}
+
+
+async def test_remote_attach_mirrors_events_and_routes_stop(workers):
+    a, runs_a = await workers()
+    b, _ = await workers()
+    run = GenerationRun("t1")
+    run.attach_task(asyncio.create_task(_idle()))
+    runs_a["t1"] = run
+    assert await a.claim("t1")
+    for n in range(3):
+        run.publish_nowait(f"{n}\n")
+
+    assert await b.attach("missing") is None
+    mirror = await b.attach("t1")
+    assert mirror is not None and await b.attach("t1") is mirror
+    followed = asyncio.create_task(_collect(mirror.subscribe(1)))
+    run.publish_nowait("3\n")
+
+    assert await b.stop("t1")
+    await asyncio.gather(run._task, return_exceptions=True)
+    assert run._task.cancelled()
+    run.publish_nowait("4\n")
+    await run.finish(GenerationStatus.STOPPED)
+
+    assert await asyncio.wait_for(followed, 2) == ["1\n", "2\n", "3\n", "4\n"]
+    assert mirror.status is GenerationStatus.STOPPED
+    assert not await b.stop("t1")  # nothing generating any more
+
+
+async def _collect(iterator):
+    return [line async for line in iterator]
+
+
+async def test_surviving_worker_takes_over_and_reclaims(workers):
+    a, _ = await workers()
+    b, runs_b = await workers()
+    run = GenerationRun("t1")
+    runs_b["t1"] = run
+    assert await b.claim("t1")
+
+    await a.aclose()
+    for _ in range(100):
+        if b.hosting and b._connected.is_set():
+            break
+        await asyncio.sleep(0.02)
+    assert b.hosting
+
+    c, _ = await workers()
+    await _settle()
+    assert not await c.claim("t1")
+    run.publish_nowait("0\n")
+    mirror = await c.attach("t1")
+    assert mirror is not None
+    await run.finish(GenerationStatus.FINISHED)
+    assert await asyncio.wait_for(_collect(mirror.subscribe(0)), 2) == ["0\n"]
+
+
+async def test_dead_owner_interrupts_remote_subscribers(workers):
+    a, _ = await workers()
+    b, runs_b = await workers()
+    run = GenerationRun("t1")
+    runs_b["t1"] = run
+    assert await b.claim("t1")
+    run.publish_nowait("0\n")
+
+    mirror = await a.attach("t1")
+    followed = asyncio.create_task(_collect(mirror.subscribe(0)))
+    await b.aclose()
+
+    assert await asyncio.wait_for(followed, 2) == ["0\n"]
+    assert mirror.status is GenerationStatus.INTERRUPTED
+    assert await a.claim("t1")
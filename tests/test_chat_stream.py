@@ -7,6 +7,8 @@ decoupled-generation registry: offset replay, disconnect tolerance, eviction.
 """
 
 import asyncio
+import datetime
+import hashlib
 import json
 import uuid
 
@@ -17,8 +19,20 @@ from sqlalchemy import select
 
 import db
 import services.chatting as chatting_module
+import services.generation as generation_module
 from app import app
-from models import Base, GenerationRunRow, Message, Thread, User
+from models import (
+    Base,
+    GenerationRunRow,
+    Message,
+    MessageSegment,
+    Role,
+    RoleHasUser,
+    Thread,
+    User,
+)
+from pipelines.breaker import BackendUnavailable
+from pipelines.inference import CompletionUsage, StreamStalled
 from schemas.general import TokenPayload
 from services.generation import (
     GenerationConflict,
@@ -26,13 +40,27 @@ from services.generation import (
     get_run,
     sweep_interrupted_runs,
 )
+from services.thread import ThreadService
 from utils import timing, web
 
 CHUNKS = ["Hello", " world"]
 THINKING_CHUNKS = [("thinking", "chain"), ("thinking", " of"), ("content", "Answer")]
 
 
+FAKE_USAGE = CompletionUsage(
+    prompt_tokens=120,
+    completion_tokens=2,
+    cached_tokens=90,
+    prefill_tokens=30,
+    prompt_ms=15.0,
+    predicted_ms=40.0,
+)
+
+
 class FakePipeline:
+    model_name = "fake-model"
+    context_tokens = 4096
+
     def __init__(self, chunks):
         self._chunks = [
             chunk if isinstance(chunk, tuple) else ("content", chunk) for chunk in chunks
@@ -44,10 +72,15 @@ class FakePipeline:
         self.sync_calls.append(dict(kwargs))
         return {"choices": [{"message": {"content": "Test Thread Title"}}]}
 
+    async def count_tokens_many(self, texts, **kwargs):
+        return [len(text.split()) for text in texts]
+
     async def chat_completion_stream(self, history, **kwargs):
         self.calls.append({"history": list(history), **kwargs})
         for chunk in self._chunks:
             yield chunk
+        if kwargs.get("on_usage"):
+            kwargs["on_usage"](FAKE_USAGE)
 
 
 class ExplodingPipeline(FakePipeline):
@@ -56,6 +89,18 @@ class ExplodingPipeline(FakePipeline):
         yield  # pragma: no cover
 
 
+class UnavailablePipeline(FakePipeline):
+    async def chat_completion_stream(self, history, **kwargs):
+        raise BackendUnavailable("small", 4.0)
+        yield  # pragma: no cover
+
+
+class StalledPipeline(FakePipeline):
+    async def chat_completion_stream(self, history, **kwargs):
+        yield ("content", "Hel")
+        raise StreamStalled("decode", 60.0)
+
+
 class SlowPipeline(FakePipeline):
     async def chat_completion_stream(self, history, **kwargs):
         self.calls.append({"history": list(history), **kwargs})
@@ -68,6 +113,12 @@ def parse_events(text: str) -> list[dict]:
     return [json.loads(line) for line in text.splitlines() if line.strip()]
 
 
+def without_title(events: list[dict]) -> list[dict]:
+    # New threads get their title in the background; where the update event
+    # lands among the chunks depends on scheduling.
+    return [event for event in events if event["event"] != "thread_title_update"]
+
+
 async def fetch_messages(thread_id: str) -> list[Message]:
     maker = db.get_session_manager().async_session_maker
     async with maker() as session:
@@ -134,9 +185,10 @@ async def test_stream_event_order_new_thread(client):
     assert response.status_code == 200
     assert response.headers["content-type"] == "application/x-ndjson"
 
-    events = parse_events(response.text)
+    events = without_title(parse_events(response.text))
     assert [event["event"] for event in events] == [
         "user_message_insert",
+        "context_usage",
         "new_chunk",
         "new_chunk",
         "assistant_message_insert",
@@ -145,8 +197,164 @@ async def test_stream_event_order_new_thread(client):
     thread_id = events[0]["threadId"]
     assert thread_id
     assert [event["chunk"] for event in events if event["event"] == "new_chunk"] == CHUNKS
-    assert events[3]["threadId"] == thread_id
-    assert events[4]["threadId"] is None
+    assert events[1]["promptTokens"] > 0
+    assert events[1]["contextTokens"] == 4096
+    assert events[4]["threadId"] == thread_id
+    assert events[5]["threadId"] is None
+
+
+async def test_coalesced_stream_merges_chunks(client, monkeypatch):
+    http, _ = client
+    monkeypatch.setattr(chatting_module.env, "STREAM_COALESCE_MS", 5000.0)
+    response = await http.post("/api/chat/stream", json={"message": "Hi"})
+
+    events = without_title(parse_events(response.text))
+    assert [event["event"] for event in events] == [
+        "user_message_insert",
+        "context_usage",
+        "new_chunk",
+        "assistant_message_insert",
+        "done",
+    ]
+    assert events[2]["chunk"] == "".join(CHUNKS)
+    messages = await fetch_messages(events[0]["threadId"])
+    assert messages[-1].inline_value == "".join(CHUNKS)
+
+
+async def test_new_thread_title_is_generated_in_background(client):
+    http, fake = client
+    response = await http.post(
+        "/api/chat/stream", json={"message": "Please explain how tides work on Earth"}
+    )
+    events = parse_events(response.text)
+    thread_id = events[0]["threadId"]
+
+    # The title arrives on the run's own stream, before the terminal events.
+    kinds = [event["event"] for event in events]
+    assert kinds.index("thread_title_update") < kinds.index("assistant_message_insert")
+    update = events[kinds.index("thread_title_update")]
+    assert update == {
+        "event": "thread_title_update",
+        "title": "Test Thread Title",
+        "threadId": thread_id,
+    }
+    assert fake.sync_calls[0]["priority"] == chatting_module.Priority.TITLE
+
+    maker = db.get_session_manager().async_session_maker
+    async with maker() as session:
+        assert (await session.get(Thread, thread_id)).title == "Test Thread Title"
+
+
+async def test_title_failure_keeps_provisional_title(client, monkeypatch):
+    http, fake = client
+
+    async def boom(history, **kwargs):
+        raise RuntimeError("title model down")
+
+    monkeypatch.setattr(fake, "chat_completion_sync", boom)
+    response = await http.post(
+        "/api/chat/stream", json={"message": "Please explain how tides work on Earth"}
+    )
+    events = parse_events(response.text)
+    assert "thread_title_update" not in [event["event"] for event in events]
+    assert events[-1]["event"] == "done"
+
+    maker = db.get_session_manager().async_session_maker
+    async with maker() as session:
+        thread = await session.get(Thread, events[0]["threadId"])
+        assert thread.title == "Please explain how tides work on…"
+
+
+async def test_title_skips_thread_deleted_before_it_lands(user_id, tables):
+    service = chatting_module.ChattingService()
+    maker = db.get_session_manager().async_session_maker
+    async with maker() as session:
+        thread = Thread(user_id=user_id, title="Provisional")
+        session.add(thread)
+        await session.commit()
+        thread_id = thread.id
+
+    gate = asyncio.Event()
+
+    async def slow_title(message, user_id=None):
+        await gate.wait()
+        return "Late title"
+
+    service.generate_thread_title = slow_title
+    task = asyncio.create_task(
+        service.update_thread_title(thread_id, user_id, "msg", "Provisional")
+    )
+    async with maker() as session:
+        await session.delete(await session.get(Thread, thread_id))
+        await session.commit()
+    gate.set()
+    assert await task is None
+
+
+async def test_finished_title_waits_for_its_run(user_id, tables):
+    service = chatting_module.ChattingService()
+    maker = db.get_session_manager().async_session_maker
+    async with maker() as session:
+        thread = Thread(user_id=user_id, title="Provisional")
+        session.add(thread)
+        await session.commit()
+        thread_id = thread.id
+
+    async def instant_title(message, user_id=None):
+        return "Fast title"
+
+    service.generate_thread_title = instant_title
+    service._spawn_title_update(thread_id, user_id, "msg", "Provisional")
+    task = chatting_module._title_tasks[thread_id]
+    await task
+    await asyncio.sleep(0)  # let the done callback run
+    # The run launched after this point must still find the finished title.
+    assert chatting_module._title_tasks.pop(thread_id) is task
+
+
+async def test_metrics_endpoint_reports_generation_latencies(client):
+    http, _ = client
+    await http.post("/api/chat/stream", json={"message": "Hi"})
+    # Terminal bookkeeping runs after the last event is published.
+    await asyncio.sleep(0.05)
+
+    response = await http.get("/api/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = dict(
+        line.rsplit(" ", 1) for line in response.text.splitlines() if not line.startswith("#")
+    )
+    assert int(samples["clyre_generation_ttft_seconds_count"]) >= 1
+    assert int(samples["clyre_generation_inter_token_seconds_count"]) >= len(CHUNKS) - 1
+    assert int(samples['clyre_generations_total{status="finished"}']) >= 1
+    assert int(samples["clyre_partial_flush_seconds_count"]) >= 1
+    assert "clyre_generation_event_log_bytes" in samples
+
+
+async def test_queued_generation_reports_position(client, monkeypatch):
+    http, fake = client
+
+    class QueuedPipeline(FakePipeline):
+        async def chat_completion_stream(self, history, **kwargs):
+            await kwargs["on_queued"](2)
+            await kwargs["on_queued"](1)
+            async for chunk in super().chat_completion_stream(history, **kwargs):
+                yield chunk
+
+    queued = QueuedPipeline(CHUNKS)
+    monkeypatch.setattr(chatting_module, "get_inference_pipeline", lambda tier: queued)
+    response = await http.post("/api/chat/stream", json={"message": "Hi"})
+
+    events = parse_events(response.text)
+    assert [event["event"] for event in events][:4] == [
+        "user_message_insert",
+        "context_usage",
+        "queued",
+        "queued",
+    ]
+    assert [event["position"] for event in events[2:4]] == [2, 1]
+    assert events[2]["threadId"] == events[0]["threadId"]
+    assert queued.calls[0]["user_id"]
 
 
 async def test_stream_persists_user_and_assistant_messages(client):
@@ -164,6 +372,149 @@ async def test_stream_persists_user_and_assistant_messages(client):
     assert fake.sync_calls[0]["enable_thinking"] is False
 
 
+async def test_messages_store_token_counts_at_write_and_finalize(client):
+    http, _ = client
+    response = await http.post("/api/chat/stream", json={"message": "Hi there"})
+    thread_id = parse_events(response.text)[0]["threadId"]
+
+    messages = await fetch_messages(thread_id)
+    # FakePipeline counts whitespace-separated words.
+    assert [m.token_count for m in messages] == [2, 2]
+
+
+def _turns(*sizes: int) -> list[Message]:
+    return [
+        Message(
+            role="user" if index % 2 == 0 else "assistant",
+            inline_value=f"turn {index}",
+            order=index,
+            token_count=size,
+        )
+        for index, size in enumerate(sizes)
+    ]
+
+
+def test_build_history_keeps_recent_turns_within_budget(monkeypatch):
+    monkeypatch.setattr(chatting_module, "MESSAGE_OVERHEAD_TOKENS", 0)
+    note = chatting_module.estimate_tokens(chatting_module.OMITTED_TURNS_NOTE)
+    build = chatting_module.ChattingService.build_history
+
+    full = build(_turns(100, 100, 100, 100, 100), budget=None, system_tokens=50)
+    assert (len(full.messages), full.prompt_tokens, full.omitted) == (6, 550, 0)
+
+    # Room for three turns, but the window may not open on an assistant turn.
+    window = build(_turns(100, 100, 100, 100, 100), budget=350 + note, system_tokens=50)
+    assert [m["content"] for m in window.messages[1:]] == ["turn 2", "turn 3", "turn 4"]
+    assert window.omitted == 2
+    assert "2 earlier messages" in window.messages[0]["content"]
+    assert window.prompt_tokens <= 350 + 2 * note
+
+    trimmed = build(_turns(100, 100, 100, 100), budget=300 + note, system_tokens=50)
+    assert [m["content"] for m in trimmed.messages[1:]] == ["turn 2", "turn 3"]
+
+    # The newest turn goes out even when it alone exceeds the budget.
+    alone = build(_turns(100, 5000), budget=1000, system_tokens=50)
+    assert [m["content"] for m in alone.messages[1:]] == ["turn 1"]
+    assert alone.omitted == 1
+
+
+async def test_long_thread_sends_only_what_fits(client, monkeypatch):
+    http, fake = client
+    monkeypatch.setattr(fake, "context_tokens", 200)
+    monkeypatch.setattr(chatting_module.env, "CHAT_RESPONSE_RESERVE_TOKENS", 0)
+    monkeypatch.setattr(chatting_module.env, "CHAT_COMPACT_AT", 0.0)
+    first = await http.post("/api/chat/stream", json={"message": "word " * 150})
+    thread_id = parse_events(first.text)[0]["threadId"]
+
+    second = await http.post(
+        "/api/chat/stream", json={"message": "Again", "threadId": thread_id}
+    )
+    events = parse_events(second.text)
+    usage = next(event for event in events if event["event"] == "context_usage")
+    assert usage["omittedMessages"] == 2
+    assert usage["promptTokens"] <= 200
+    assert [m["content"] for m in fake.calls[1]["history"][1:]] == ["Again"]
+
+
+def test_build_history_replaces_summarized_turns(monkeypatch):
+    monkeypatch.setattr(chatting_module, "MESSAGE_OVERHEAD_TOKENS", 0)
+    summary = chatting_module.RollingSummary("They talked about tides.", through=1, tokens=6)
+    history = chatting_module.ChattingService.build_history(
+        _turns(100, 100, 100), system_tokens=50, summary=summary
+    )
+    assert history.summarized == 2
+    assert [m["content"] for m in history.messages[1:]] == ["turn 2"]
+    assert history.messages[0]["content"].endswith("They talked about tides.")
+    note = chatting_module.estimate_tokens(chatting_module.SUMMARY_NOTE)
+    assert history.prompt_tokens == 50 + 6 + note + 100
+
+
+class SummarizingPipeline(FakePipeline):
+    context_tokens = 1000
+
+    def __init__(self, chunks):
+        super().__init__(chunks)
+        self.summaries = []
+
+    async def chat_completion_sync(self, history, **kwargs):
+        if kwargs.get("priority") != chatting_module.Priority.COMPACTION:
+            return await super().chat_completion_sync(history, **kwargs)
+        self.summaries.append(history[-1]["content"])
+        text = f"Summary {len(self.summaries)}"
+        return {"choices": [{"message": {"content": text}}]}
+
+
+async def test_compaction_folds_overflow_into_a_rolling_summary(client, monkeypatch):
+    http, _ = client
+    fake = SummarizingPipeline(CHUNKS)
+    monkeypatch.setattr(chatting_module, "get_inference_pipeline", lambda tier: fake)
+    monkeypatch.setattr(chatting_module, "MESSAGE_OVERHEAD_TOKENS", 0)
+    monkeypatch.setattr(chatting_module.env, "CHAT_RESPONSE_RESERVE_TOKENS", 0)
+
+    thread_id = None
+    events_per_turn = []
+    for turn in range(1, 7):
+        body = {"message": f"m{turn} " + "w " * 199}
+        if thread_id:
+            body["threadId"] = thread_id
+        response = await http.post("/api/chat/stream", json=body)
+        events = parse_events(response.text)
+        thread_id = events[0]["threadId"]
+        events_per_turn.append(events)
+        await get_run(thread_id)._task
+        compaction = chatting_module._compaction_tasks.get(thread_id)
+        if compaction is not None:
+            await compaction
+
+    # Turn 4 passed 75% of the budget; every later turn stays above it. Each
+    # compaction folds only the exchange that no longer fits the kept half.
+    first, second, third = fake.summaries
+    assert first.startswith("New excerpt:\nUser: m1") and "m2" not in first
+    assert second.startswith("Summary so far:\nSummary 1\n\nNew excerpt:\nUser: m2")
+    assert "m1" not in second and "m3" not in second
+    assert third.startswith("Summary so far:\nSummary 2\n\nNew excerpt:\nUser: m3")
+
+    compacted = [
+        [event for event in events if event["event"] == "context_compacted"]
+        for events in events_per_turn
+    ]
+    assert [len(found) for found in compacted] == [0, 0, 0, 0, 1, 1]
+    assert [found[0]["summarizedMessages"] for found in compacted[4:]] == [2, 4]
+
+    history = fake.calls[4]["history"]
+    assert history[0]["content"].endswith("Summary 1")
+    assert history[1]["content"].startswith("m2")
+
+    maker = db.get_session_manager().async_session_maker
+    async with maker() as session:
+        thread = await session.get(Thread, thread_id)
+        assert (thread.summary, thread.summary_through, thread.summary_tokens) == (
+            "Summary 3",
+            5,
+            2,
+        )
+
+
 async def test_stream_existing_thread_sends_history_and_appends(client):
     http, fake = client
     first = await http.post("/api/chat/stream", json={"message": "Hi"})
@@ -209,17 +560,18 @@ async def test_thinking_stream_events_and_persistence(user_id, monkeypatch, tabl
             )
             assert response.status_code == 200
 
-            events = parse_events(response.text)
+            events = without_title(parse_events(response.text))
             kinds = [event["event"] for event in events]
             assert kinds == [
                 "user_message_insert",
+                "context_usage",
                 "new_thinking_chunk",
                 "new_thinking_chunk",
                 "new_chunk",
                 "assistant_message_insert",
                 "done",
             ]
-            assert [event["chunk"] for event in events[1:4]] == [
+            assert [event["chunk"] for event in events[2:5]] == [
                 "chain",
                 " of",
                 "Answer",
@@ -310,7 +662,8 @@ async def test_replay_from_mid_offset_yields_tail_only(client):
     assert run is not None
     await run.wait_done()
 
-    tail = parse_events("".join([line async for line in run.subscribe(3)]))
+    offset = len(parse_events(response.text)) - 2
+    tail = parse_events("".join([line async for line in run.subscribe(offset)]))
     assert [event["event"] for event in tail] == ["assistant_message_insert", "done"]
 
 
@@ -375,6 +728,78 @@ async def test_journal_row_transitions_to_finished(client, user_id):
     assert row.status == "finished"
     assert row.thread_id == thread_id
     assert row.user_id == user_id
+    assert row.model == "fake-model"
+    assert (row.prompt_tokens, row.completion_tokens) == (120, 2)
+    assert (row.cached_tokens, row.prefill_tokens) == (90, 30)
+    assert (row.prompt_ms, row.predicted_ms) == (15.0, 40.0)
+    assert 0 <= row.ttft_ms <= row.duration_ms
+
+
+async def test_usage_endpoint_aggregates_runs_per_user_and_model(client, user_id):
+    http, _ = client
+    for _ in range(2):
+        response = await http.post("/api/chat/stream", json={"message": "Hi"})
+        await get_run(parse_events(response.text)[0]["threadId"]).wait_done()
+
+    response = await http.get("/api/usage", params={"bucket": "hour"})
+    assert response.status_code == 200
+    [bucket] = response.json()["buckets"]
+    assert bucket["userId"] == user_id
+    assert bucket["model"] == "fake-model"
+    assert bucket["runs"] == 2
+    assert (bucket["promptTokens"], bucket["completionTokens"]) == (240, 4)
+    assert bucket["cacheHitRate"] == 0.75
+    assert bucket["decodeTokensPerSecond"] == 50.0
+    assert bucket["prefillTokensPerSecond"] == 2000.0
+
+    later = timing.offset_datetime(timing.get_utc_now(), datetime.timedelta(hours=1))
+    response = await http.get("/api/usage", params={"since": later.isoformat()})
+    assert response.status_code == 400
+    response = await http.get("/api/usage", params={"model": "other"})
+    assert response.json()["buckets"] == []
+
+
+async def test_usage_endpoint_hides_other_users_runs(client, user_id):
+    http, _ = client
+    async with db.get_session_manager().async_session_maker() as session:
+        other = User()
+        session.add(other)
+        await session.commit()
+        other_id = other.id
+
+    async def _auth_other() -> TokenPayload:
+        return TokenPayload(
+            user_id=other_id, timestamp=timing.get_utc_now().timestamp(), refresh_token_id=None
+        )
+
+    authenticate_first = app.dependency_overrides[web.extract_access_token]
+    app.dependency_overrides[web.extract_access_token] = _auth_other
+    response = await http.post("/api/chat/stream", json={"message": "Hi"})
+    await get_run(parse_events(response.text)[0]["threadId"]).wait_done()
+    app.dependency_overrides[web.extract_access_token] = authenticate_first
+    response = await http.post("/api/chat/stream", json={"message": "Hi"})
+    await get_run(parse_events(response.text)[0]["threadId"]).wait_done()
+
+    response = await http.get("/api/usage", params={"bucket": "hour"})
+    assert [bucket["userId"] for bucket in response.json()["buckets"]] == [user_id]
+    response = await http.get("/api/usage", params={"user_id": other_id})
+    assert response.status_code == 403
+    response = await http.get("/api/usage", params={"all_users": "true"})
+    assert response.status_code == 403
+
+    async with db.get_session_manager().async_session_maker() as session:
+        role = Role(name="admin", privilege_level=100)
+        session.add(role)
+        await session.flush()
+        session.add(RoleHasUser(role_id=role.id, user_id=user_id))
+        await session.commit()
+
+    response = await http.get("/api/usage", params={"user_id": other_id})
+    assert [bucket["userId"] for bucket in response.json()["buckets"]] == [other_id]
+    response = await http.get("/api/usage", params={"all_users": "true"})
+    assert sorted(bucket["userId"] for bucket in response.json()["buckets"]) == sorted(
+        [user_id, other_id]
+    )
 
 
 async def test_failed_generation_marks_journal_and_drops_empty_message(
@@ -411,6 +836,39 @@ async def test_failed_generation_marks_journal_and_drops_empty_message(
         app.dependency_overrides.pop(web.extract_access_token, None)
 
 
+@pytest.mark.parametrize(
+    ("pipeline", "code", "retry_after"),
+    [
+        (UnavailablePipeline, "backend_unavailable", 4.0),
+        (ExplodingPipeline, "generation_failed", None),
+        (StalledPipeline, "generation_failed", None),
+    ],
+)
+async def test_failed_generation_ends_with_an_error_event(
+    client, monkeypatch, pipeline, code, retry_after
+):
+    http, _ = client
+    fake = pipeline(CHUNKS)
+    monkeypatch.setattr(chatting_module, "get_inference_pipeline", lambda tier: fake)
+
+    response = await http.post("/api/chat/stream", json={"message": "Hi"})
+    events = without_title(parse_events(response.text))
+    assert [e["event"] for e in events[-3:]] == [
+        "generation_error",
+        "assistant_message_insert",
+        "done",
+    ]
+    error = events[-3]
+    assert error["code"] == code
+    assert error["retryAfterSeconds"] == retry_after
+    assert error["message"]
+
+    run = get_run(events[0]["threadId"])
+    assert run is not None
+    await run.wait_done()
+    assert (await _fetch_journal_row(run.journal_id)).status == "failed"
+
+
 async def test_sweep_marks_running_rows_interrupted(user_id, tables):
     async with db.get_session_manager().async_session_maker() as session:
         from crud import create_generation_run
@@ -527,7 +985,7 @@ async def test_stop_persists_partial_and_closes_stream(client, user_id, monkeypa
     assert run.status.value == "stopped"
     assert run.response == "Hello"
 
-    tail = parse_events("".join([line async for line in run.subscribe(1)]))
+    tail = parse_events("".join([line async for line in run.subscribe(2)]))
     assert [event["event"] for event in tail] == [
         "new_chunk",
         "assistant_message_insert",
@@ -539,6 +997,68 @@ async def test_stop_persists_partial_and_closes_stream(client, user_id, monkeypa
     assert messages[-1].inline_value == "Hello"
 
 
+async def test_stop_closes_the_upstream_stream_before_the_run_ends(
+    client, user_id, monkeypatch
+):
+    closed_at = []
+
+    class ClosingPipeline(SlowPipeline):
+        async def chat_completion_stream(self, history, **kwargs):
+            try:
+                async for chunk in super().chat_completion_stream(history, **kwargs):
+                    yield chunk
+            finally:
+                closed_at.append(asyncio.get_running_loop().time())
+
+    slow = ClosingPipeline(CHUNKS)
+    monkeypatch.setattr(chatting_module, "get_inference_pipeline", lambda tier: slow)
+    released = chatting_module.STOP_RELEASE_SECONDS.labels()
+    observed = released.count
+
+    thread_id = await _create_thread(user_id)
+    run = await _start_slow_generation(user_id, thread_id)
+    await asyncio.sleep(0.3)
+    assert run.request_stop()
+    await run.wait_done()
+
+    assert run.status.value == "stopped"
+    [closed] = closed_at
+    assert closed - run.stop_requested_at < 0.05
+    assert released.count == observed + 1
+
+
+async def test_stop_during_finalization_still_finishes_the_run(client, user_id, monkeypatch):
+    http, fake = client
+    counting = asyncio.Event()
+    release = asyncio.Event()
+    count_tokens = fake.count_tokens_many
+
+    async def slow_count(texts, **kwargs):
+        if texts == ["".join(CHUNKS)]:
+            counting.set()
+            await release.wait()
+        return await count_tokens(texts, **kwargs)
+
+    monkeypatch.setattr(fake, "count_tokens_many", slow_count)
+    monkeypatch.setattr(chatting_module, "TOKEN_COUNT_TIMEOUT_SECONDS", 30)
+    # The stream only ends once the run finished, so it is read in the background.
+    streaming = asyncio.create_task(http.post("/api/chat/stream", json={"message": "Hi"}))
+    await asyncio.wait_for(counting.wait(), 2)
+    [run] = generation_module._runs.values()
+
+    # The answer is complete; the run is journaling it when the stop lands.
+    assert run.request_stop()
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.wait_for(run.wait_done(), 2)
+    thread_id = parse_events((await streaming).text)[0]["threadId"]
+
+    assert run.status.value == "finished"
+    messages = await fetch_messages(thread_id)
+    assert messages[-1].inline_value == "".join(CHUNKS)
+    assert messages[-1].token_count == 2
+
+
 async def test_stop_without_active_generation_returns_409(client, user_id):
     http, _ = client
     thread_id = await _create_thread(user_id)
@@ -559,6 +1079,7 @@ async def test_retry_replaces_trailing_assistant(client, user_id):
     events = parse_events(retry_response.text)
     assert [event["event"] for event in events] == [
         "user_message_insert",
+        "context_usage",
         "new_chunk",
         "new_chunk",
         "assistant_message_insert",
@@ -766,6 +1287,40 @@ async def test_concurrent_starts_produce_single_winner(user_id, monkeypatch, tab
     assert run.status.value == "finished"
 
 
+async def test_starts_on_different_threads_run_in_parallel(user_id, monkeypatch, tables):
+    """A slow start on one thread must not hold up sends on the others."""
+    delay = 0.5
+    fake = FakePipeline(CHUNKS)
+    monkeypatch.setattr(chatting_module, "get_inference_pipeline", lambda tier: fake)
+    original_save = chatting_module.ChattingService.save_message
+
+    async def _slow_save(self, *args, **kwargs):
+        await asyncio.sleep(delay)
+        return await original_save(self, *args, **kwargs)
+
+    monkeypatch.setattr(chatting_module.ChattingService, "save_message", _slow_save)
+
+    n = 6
+    thread_ids = [await _create_thread(user_id) for _ in range(n)]
+    service = chatting_module.ChattingService()
+
+    async def _send(thread_id):
+        async with db.get_session_manager().async_session_maker() as session:
+            return await service.start_generation(session, thread_id, user_id, "hi")
+
+    started = asyncio.get_running_loop().time()
+    runs = await asyncio.gather(*(_send(thread_id) for thread_id in thread_ids))
+    elapsed = asyncio.get_running_loop().time() - started
+
+    for run in runs:
+        await run.wait_done()
+        assert run.status.value == "finished"
+    # Serialized starts would take n * delay; parallel ones about one delay
+    # plus the (SQLite-serialized) writes.
+    assert elapsed < 3 * delay
+    assert len(chatting_module._thread_start_locks) == 0
+
+
 async def test_delete_thread_stops_active_generation(user_id, monkeypatch, tables):
     """Deleting a generating thread must stop its run — the background task
     otherwise flushes into rows the cascade delete removed."""
@@ -782,3 +1337,240 @@ async def test_delete_thread_stops_active_generation(user_id, monkeypatch, table
 
     await run.wait_done()
     assert run.status.value == "stopped"
+
+
+async def _fetch_segments(message_id: str) -> list[tuple[int, str, str]]:
+    async with db.get_session_manager().async_session_maker() as session:
+        result = await session.execute(
+            select(MessageSegment.seq, MessageSegment.kind, MessageSegment.text)
+            .where(MessageSegment.message_id == message_id)
+            .order_by(MessageSegment.seq)
+        )
+        return [tuple(row) for row in result.all()]
+
+
+async def test_partial_flush_appends_deltas_and_finalize_compacts(user_id, monkeypatch, tables):
+    slow = SlowPipeline([("thinking", "Hmm"), ("content", "Hello"), ("content", " world")])
+    monkeypatch.setattr(chatting_module, "get_inference_pipeline", lambda tier: slow)
+    monkeypatch.setattr(generation_module, "PARTIAL_FLUSH_SECONDS", 0.01)
+    thread_id = await _create_thread(user_id)
+
+    run = await _start_slow_generation(user_id, thread_id)
+    await asyncio.sleep(0.5)
+
+    reserved = (await fetch_messages(thread_id))[-1]
+    assert reserved.inline_value is None  # the row is not rewritten mid-run
+    segments = await _fetch_segments(reserved.id)
+    assert segments == [(0, "thinking", "Hmm"), (1, "content", "Hello")]
+
+    async with db.get_session_manager().async_session_maker() as session:
+        thread = await ThreadService.thread_by_id(session, user_id, thread_id)
+        assert thread.messages[-1].inline_value == "Hello"
+        assert thread.messages[-1].thinking_value == "Hmm"
+
+    await run.wait_done()
+    final = (await fetch_messages(thread_id))[-1]
+    assert (final.inline_value, final.thinking_value) == ("Hello world", "Hmm")
+    assert final.hash == hashlib.sha256(b"Hello world").hexdigest()
+    assert await _fetch_segments(final.id) == []
+
+
+async def test_sweep_reassembles_segments_of_interrupted_run(user_id, tables):
+    from crud import create_generation_run
+    from crud.message import append_message_segments, reserve_assistant_message
+
+    async with db.get_session_manager().async_session_maker() as session:
+        thread = Thread(id=uuid.uuid4().hex, user_id=user_id, title="t")
+        session.add(thread)
+        await session.flush()
+        await create_generation_run(session, thread.id, user_id)
+        reserved = await reserve_assistant_message(
+            session, user_id=user_id, thread_id=thread.id, order=0
+        )
+        await session.flush()
+        await append_message_segments(
+            session,
+            reserved.id,
+            0,
+            [("thinking", "th"), ("content", "Hel"), ("thinking", "ink"), ("content", "lo")],
+        )
+        await session.commit()
+        thread_id, message_id = thread.id, reserved.id
+
+    assert await sweep_interrupted_runs() >= 1
+
+    messages = await fetch_messages(thread_id)
+    assert [(m.role, m.inline_value, m.thinking_value) for m in messages] == [
+        ("assistant", "Hello", "think")
+    ]
+    assert messages[0].hash == hashlib.sha256(b"Hello").hexdigest()
+    assert await _fetch_segments(message_id) == []
+
+
+async def test_concurrent_runs_share_one_flush_transaction(user_id, monkeypatch, tables):
+    slow = SlowPipeline(["a", "b", "c", "d"])
+    monkeypatch.setattr(chatting_module, "get_inference_pipeline", lambda tier: slow)
+    monkeypatch.setattr(generation_module, "PARTIAL_FLUSH_SECONDS", 0.05)
+
+    batches = generation_module.FLUSH_BATCH_RUNS.labels()
+    observed, largest = batches.count, batches.counts[2]  # le=4 bucket
+
+    threads = [await _create_thread(user_id) for _ in range(3)]
+    runs = [await _start_slow_generation(user_id, thread_id) for thread_id in threads]
+    await asyncio.gather(*(run.wait_done() for run in runs))
+
+    stats = generation_module.get_partial_flusher().stats()
+    assert stats["max_batch_runs"] == 3
+    assert batches.count > observed
+    assert batches.counts[2] > largest  # a three-run batch
+    assert generation_module.FLUSH_LAG_SECONDS.labels().count == batches.count
+    assert generation_module.FLUSH_BATCH_SEGMENTS.labels().sum >= stats["segments"]
+    assert stats["batches"] < stats["segments"]
+    assert stats["failures"] == 0
+    assert stats["max_lag"] >= stats["max_latency"] > 0
+    for thread_id in threads:
+        assert (await fetch_messages(thread_id))[-1].inline_value == "abcd"
+
+
+async def test_flush_failure_of_one_run_does_not_block_others(user_id, tables):
+    from crud.message import reserve_assistant_message
+
+    thread_id = await _create_thread(user_id)
+    async with db.get_session_manager().async_session_maker() as session:
+        reserved = await reserve_assistant_message(
+            session, user_id=user_id, thread_id=thread_id, order=0
+        )
+        await session.commit()
+        message_id = reserved.id
+
+    good = GenerationRun(thread_id, message_id=message_id)
+    orphan = GenerationRun("gone", message_id=uuid.uuid4().hex)  # FK violation
+    flusher = generation_module.get_partial_flusher()
+    for run in (good, orphan):
+        run.response.append("partial")
+        flusher.mark_dirty(run)
+    await flusher.flush()
+
+    assert await _fetch_segments(message_id) == [(0, "content", "partial")]
+    assert good.dirty_since is None and good.response_flushed == len("partial")
+    assert orphan.response_flushed == 0
+    assert flusher.stats()["dirty_runs"] == 1
+    await flusher.forget(orphan)
+
+
+class PacedPipeline(FakePipeline):
+    async def chat_completion_stream(self, history, **kwargs):
+        self.calls.append({"history": list(history), **kwargs})
+        for chunk in self._chunks:
+            await asyncio.sleep(0.02)
+            yield chunk
+
+
+@pytest_asyncio.fixture
+async def live_server(user_id, monkeypatch):
+    """The app on a real socket: ASGITransport buffers whole bodies, so only a
+    real connection can disconnect mid-stream (known issue #28)."""
+    import uvicorn
+
+    pipeline = PacedPipeline([f"t{n} " for n in range(15)])
+    monkeypatch.setattr(chatting_module, "get_inference_pipeline", lambda tier: pipeline)
+
+    async def _auth() -> TokenPayload:
+        return TokenPayload(
+            user_id=user_id,
+            timestamp=timing.get_utc_now().timestamp(),
+            refresh_token_id=None,
+        )
+
+    app.dependency_overrides[web.extract_access_token] = _auth
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=0, lifespan="off", log_level="warning")
+    )
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}/api/chat"
+    finally:
+        server.should_exit = True
+        await serving
+        app.dependency_overrides.pop(web.extract_access_token, None)
+
+
+async def _start_and_drop(http: httpx.AsyncClient, thread_id: str, keep: int) -> list[str]:
+    lines = []
+    async with http.stream(
+        "POST", "/stream", json={"message": "Go", "threadId": thread_id}
+    ) as response:
+        assert response.status_code == 200
+        async for line in response.aiter_lines():
+            lines.append(line + "\n")
+            if len(lines) == keep:
+                break
+    return lines
+
+
+async def test_reattach_after_disconnect_under_load(live_server, user_id):
+    threads = [await _create_thread(user_id) for _ in range(6)]
+
+    async def one_client(thread_id: str, keep: int) -> tuple[str, str]:
+        # Separate clients: closing a half-read response drops the socket.
+        async with httpx.AsyncClient(base_url=live_server, timeout=10) as http:
+            head = await _start_and_drop(http, thread_id, keep)
+            assert get_run(thread_id) is not None and not get_run(thread_id).done
+            await asyncio.sleep(0.05)
+            resumed = await http.get(f"/{thread_id}/events", params={"offset": len(head)})
+            assert resumed.status_code == 200
+            return "".join(head) + resumed.text, thread_id
+
+    results = await asyncio.gather(
+        *(one_client(thread_id, keep) for keep, thread_id in enumerate(threads, start=2))
+    )
+
+    for received, thread_id in results:
+        run = get_run(thread_id)
+        assert run.status.value == "finished"
+        assert received == "".join([line async for line in run.subscribe(0)])
+        events = parse_events(received)
+        assert events[-1]["event"] == "done"
+        assert "".join(e["chunk"] for e in events if e["event"] == "new_chunk") == "".join(
+            f"t{n} " for n in range(15)
+        )
+
+
+async def test_sse_resumes_from_last_event_id(live_server, user_id):
+    thread_id = await _create_thread(user_id)
+    async with httpx.AsyncClient(base_url=live_server, timeout=10) as http:
+        head = await _start_and_drop(http, thread_id, 3)
+
+        frames = []
+        async with http.stream(
+            "GET", f"/{thread_id}/events/sse", headers={"Last-Event-ID": "3"}
+        ) as response:
+            assert response.headers["content-type"].startswith("text/event-stream")
+            async for line in response.aiter_lines():
+                if line.startswith("id: "):
+                    frames.append([int(line[4:])])
+                elif line.startswith("data: "):
+                    frames[-1].append(line[6:])
+
+    run = get_run(thread_id)
+    full = [line async for line in run.subscribe(0)]
+    assert [event_id for event_id, _ in frames] == list(range(4, len(full) + 1))
+    assert head + [data + "\n" for _, data in frames] == full
+
+
+async def test_events_endpoint_checks_ownership_and_presence(client, user_id):
+    http, _ = client
+    foreign = await http.get(f"/api/chat/{uuid.uuid4().hex}/events")
+    assert foreign.status_code == 404
+    assert foreign.json()["detail"] == "Thread not found"
+
+    idle_thread = await _create_thread(user_id)
+    idle = await http.get(f"/api/chat/{idle_thread}/events")
+    assert idle.status_code == 404
+    assert idle.json()["detail"] == "No generation for this thread"
+
+    bad = await http.get(f"/api/chat/{idle_thread}/events/sse", headers={"Last-Event-ID": "x"})
+    assert bad.status_code == 400
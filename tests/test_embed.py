@@ -1,9 +1,12 @@
+import asyncio
 import json
 
 import httpx
 import pytest
 
+import pipelines.embed as embed_module
 from pipelines.embed import EmbeddingPipeline, _extract_embeddings, _normalize, _postprocess
+from utils import metrics
 
 DIM = 8
 
@@ -63,3 +66,88 @@ async def test_embed_empty_is_noop():
         "http://x", "m", transport=httpx.MockTransport(lambda r: httpx.Response(200, json={}))
     )
     assert await pipe.embed([]) == []
+
+
+async def test_embed_reuses_pooled_client_across_calls(monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        count = len(json.loads(request.content)["input"])
+        return httpx.Response(
+            200, json={"data": [{"index": i, "embedding": [1.0] * DIM} for i in range(count)]}
+        )
+
+    pipe = EmbeddingPipeline("http://emb", "m", transport=httpx.MockTransport(handler))
+    await pipe.embed(["a"])
+    await pipe.embed_one("b")
+
+    stats = pipe.pool_stats()
+    assert stats.requests == 2
+    assert stats.in_use == 0
+
+    monkeypatch.setattr(embed_module, "_embedding_instance", pipe)
+    exposition = metrics.REGISTRY.render()
+    assert 'clyre_embedding_pool_connections{state="in_use"} 0' in exposition
+    assert 'clyre_embedding_pool_connections{state="idle"}' in exposition
+    await pipe.aclose()
+
+
+def _echo_handler(batches: list[list[str]]):
+    """Answers each text with a vector marking its length, recording batches."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        texts = json.loads(request.content)["input"]
+        batches.append(texts)
+        return httpx.Response(
+            200,
+            json={
+                "data": [
+                    {"index": i, "embedding": [float(j == len(text)) for j in range(DIM)]}
+                    for i, text in enumerate(texts)
+                ]
+            },
+        )
+
+    return handler
+
+
+async def test_concurrent_embed_one_calls_share_one_request():
+    batches: list[list[str]] = []
+    pipe = EmbeddingPipeline(
+        "http://emb", "m", transport=httpx.MockTransport(_echo_handler(batches))
+    )
+
+    out = await asyncio.gather(*(pipe.embed_one("x" * n) for n in range(1, 6)))
+
+    assert batches == [["x", "xx", "xxx", "xxxx", "xxxxx"]]
+    assert [vector.index(1.0) for vector in out] == [1, 2, 3, 4, 5]
+    await pipe.aclose()
+
+
+async def test_full_coalesced_batch_goes_out_without_waiting(monkeypatch):
+    monkeypatch.setattr(embed_module, "EMBED_BATCH_SIZE", 2)
+    monkeypatch.setattr(embed_module.env, "EMBED_COALESCE_MS", 10_000.0)
+    batches: list[list[str]] = []
+    pipe = EmbeddingPipeline(
+        "http://emb", "m", transport=httpx.MockTransport(_echo_handler(batches))
+    )
+
+    out = await asyncio.wait_for(asyncio.gather(pipe.embed_one("a"), pipe.embed_one("bb")), 1)
+
+    assert batches == [["a", "bb"]]
+    assert [vector.index(1.0) for vector in out] == [1, 2]
+    await pipe.aclose()
+
+
+async def test_coalesced_failure_reaches_every_caller_but_not_cancelled_ones():
+    pipe = EmbeddingPipeline(
+        "http://emb", "m", transport=httpx.MockTransport(lambda r: httpx.Response(400))
+    )
+    dropped = asyncio.create_task(pipe.embed_one("dropped"))
+    kept = [asyncio.create_task(pipe.embed_one(text)) for text in ("a", "b")]
+    await asyncio.sleep(0)
+    dropped.cancel()
+
+    results = await asyncio.gather(*kept, return_exceptions=True)
+
+    assert all(isinstance(result, httpx.HTTPStatusError) for result in results)
+    assert dropped.cancelled()
+    await pipe.aclose()
@@ -0,0 +1,514 @@
+"""The fake llama-server (scripts/fake_llama_server.py) driven through the
+real pipelines and, end to end, through the chat API."""
+
+import asyncio
+import contextlib
+import json
+import time
+
+import httpx
+import pytest
+import uvicorn
+from sqlalchemy import select
+
+import db
+import services.chatting as chatting_module
+from app import app
+from models import Base, GenerationRunRow, User
+from pipelines import inference
+from pipelines.embed import EmbeddingPipeline
+from pipelines.inference import GenerationBudget, LLMPipeline, StreamPhases, StreamStalled
+from schemas.general import TokenPayload
+from scripts.fake_llama_server import (
+    FakeLlamaConfig,
+    FakeLlamaServer,
+    embed_text,
+    prompt_tokens,
+)
+from services.generation import get_run
+from utils import timing, web
+
+
+def _server(**overrides) -> FakeLlamaServer:
+    config = {"tokens_per_second": 0, "prefill_tokens_per_second": 0, "completion_tokens": 4}
+    return FakeLlamaServer(FakeLlamaConfig(**{**config, **overrides}))
+
+
+def _llm(server: FakeLlamaServer, model: str = "Qwen3.5-9B") -> LLMPipeline:
+    return LLMPipeline("http://fake", model, httpx.ASGITransport(app=server.app))
+
+
+@contextlib.asynccontextmanager
+async def _serve(server: FakeLlamaServer):
+    """Serve the fake over a real socket: only there does a client closing
+    its stream reach the server."""
+    http_server = uvicorn.Server(
+        uvicorn.Config(
+            server.app, host="127.0.0.1", port=0, log_level="warning", lifespan="off"
+        )
+    )
+    task = asyncio.create_task(http_server.serve())
+    while not http_server.started:
+        await asyncio.sleep(0.01)
+    port = http_server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        http_server.should_exit = True
+        await task
+
+
+async def _cancel_mid_stream(pipeline: LLMPipeline, server: FakeLlamaServer, phase: str):
+    """Start a stream, cancel its consumer in `phase`; returns the cancel time."""
+    first_chunk = asyncio.Event()
+
+    async def consume():
+        async for _ in pipeline.chat_completion_stream([{"role": "user", "content": "Hi"}]):
+            first_chunk.set()
+
+    task = asyncio.create_task(consume())
+    if phase == "decode":
+        await asyncio.wait_for(first_chunk.wait(), 5)
+    else:
+        while not any(slot.busy for slot in server.slots):
+            await asyncio.sleep(0.01)
+    cancelled_at = time.monotonic()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    return cancelled_at
+
+
+async def _collect(pipeline: LLMPipeline, **kwargs):
+    usage = []
+    chunks = [
+        chunk
+        async for chunk in pipeline.chat_completion_stream(
+            [{"role": "user", "content": "Hello there"}], on_usage=usage.append, **kwargs
+        )
+    ]
+    return chunks, usage
+
+
+async def test_stream_emits_reasoning_then_content_and_reports_usage():
+    server = _server(reasoning_tokens=2)
+    pipeline = _llm(server)
+
+    chunks, [usage] = await _collect(pipeline, enable_thinking=True)
+
+    assert chunks == [
+        ("thinking", "the"),
+        ("thinking", " quick"),
+        ("content", "brown"),
+        ("content", " fox"),
+        ("content", " jumps"),
+        ("content", " over"),
+    ]
+    # user + "Hello there" + 4 template tokens.
+    assert usage.prompt_tokens == 7 and usage.completion_tokens == 6
+    assert (usage.cached_tokens, usage.prefill_tokens) == (0, 7)
+
+    # The same prompt again: the slot's cached prefix is reused.
+    _, [again] = await _collect(pipeline, enable_thinking=False)
+    assert (again.cached_tokens, again.prefill_tokens) == (7, 0)
+    assert again.completion_tokens == 4
+    await pipeline.aclose()
+
+
+async def test_sync_completion_counts_reasoning_against_max_tokens():
+    server = _server(reasoning_tokens=3)
+    pipeline = _llm(server)
+
+    response = await pipeline.chat_completion_sync(
+        [{"role": "user", "content": "Hi"}], enable_thinking=True, max_tokens=4
+    )
+
+    [choice] = response["choices"]
+    assert choice["finish_reason"] == "length"
+    assert choice["message"]["reasoning_content"] == "the quick brown"
+    assert choice["message"]["content"] == "fox"
+    assert response["usage"]["completion_tokens"] == 4
+    await pipeline.aclose()
+
+
+async def test_reasoning_budget_switches_the_stream_to_the_answer():
+    server = _server(reasoning_tokens=10)
+    pipeline = _llm(server)
+    exhausted = []
+
+    async def on_budget(kind, limit):
+        exhausted.append((kind, limit))
+
+    chunks, [usage] = await _collect(
+        pipeline,
+        enable_thinking=True,
+        budget=GenerationBudget(max_tokens=20, reasoning_tokens=3),
+        on_budget=on_budget,
+    )
+
+    assert [text for kind, text in chunks if kind == "thinking"] == ["the", " quick", " brown"]
+    # The answer request runs with thinking off behind the closed-off reasoning.
+    assert "".join(text for kind, text in chunks if kind == "content") == (
+        "the quick brown fox"
+    )
+    assert exhausted == [("reasoning", 3)]
+    assert server.stats["requests"] == 2
+    # The three reasoning tokens count as generated, not as prompt.
+    assert usage.completion_tokens == 7
+    answer_prompt = prompt_tokens(
+        [
+            {"role": "user", "content": "Hello there"},
+            {
+                "role": "assistant",
+                "content": inference.REASONING_CUTOFF_PREFILL.format(
+                    reasoning="the quick brown"
+                ),
+            },
+        ]
+    )
+    assert usage.prompt_tokens == len(answer_prompt) - 3
+    await pipeline.aclose()
+
+
+async def test_completion_cap_reports_a_length_budget():
+    server = _server(completion_tokens=6)
+    pipeline = _llm(server)
+    exhausted = []
+
+    async def on_budget(kind, limit):
+        exhausted.append((kind, limit))
+
+    chunks, _ = await _collect(
+        pipeline, budget=GenerationBudget(max_tokens=2), on_budget=on_budget
+    )
+    assert "".join(text for _, text in chunks) == "the quick"
+    assert exhausted == [("length", 2)]
+
+    exhausted.clear()
+    await _collect(pipeline, budget=GenerationBudget(max_tokens=6), on_budget=on_budget)
+    assert exhausted == []
+    await pipeline.aclose()
+
+
+@pytest.mark.parametrize("phase", ["prefill", "decode"])
+async def test_cancelling_a_stream_frees_the_server_slot_promptly(phase):
+    server = _server(
+        slots=1,
+        prefill_seconds=30 if phase == "prefill" else 0,
+        tokens_per_second=50,
+        completion_tokens=10_000,
+    )
+    async with _serve(server) as url:
+        pipeline = LLMPipeline(url, "m")
+        cancelled_at = await _cancel_mid_stream(pipeline, server, phase)
+        while server.stats["cancelled"] == 0 and time.monotonic() - cancelled_at < 2:
+            await asyncio.sleep(0.005)
+        await pipeline.aclose()
+
+    assert server.stats["cancelled"] == 1
+    assert server.stats["released_at"][0] - cancelled_at < 0.5
+    assert pipeline.scheduler_stats()["in_use"] == 0
+
+
+async def test_release_confirmation_holds_the_lease_until_the_slot_is_idle(monkeypatch):
+    monkeypatch.setattr(inference.env, "INFERENCE_RELEASE_CONFIRM_SECONDS", 2.0)
+    server = _server(
+        slots=1, tokens_per_second=50, completion_tokens=10_000, cancel_seconds=0.3
+    )
+    released = inference.SLOT_RELEASE_SECONDS.labels("m")
+    observed = released.count
+    async with _serve(server) as url:
+        pipeline = LLMPipeline(url, "m")
+        cancelled_at = await _cancel_mid_stream(pipeline, server, "decode")
+        # The cancelled consumer returned only once /slots showed the slot idle.
+        assert time.monotonic() - cancelled_at >= 0.3
+        assert not any(slot.busy for slot in server.slots)
+        await pipeline.aclose()
+
+    assert released.count == observed + 1
+    assert pipeline.scheduler_stats()["in_use"] == 0
+
+
+@pytest.fixture
+def tight_watchdog(monkeypatch):
+    monkeypatch.setattr(inference.env, "INFERENCE_FIRST_TOKEN_SECONDS", 0.1)
+    monkeypatch.setattr(inference.env, "INFERENCE_PREFILL_TOKENS_PER_SECOND", 100.0)
+    monkeypatch.setattr(inference.env, "INFERENCE_STALL_SECONDS", 0.1)
+    monkeypatch.setattr(inference, "STALL_EXTENSIONS", 0)
+
+
+async def test_first_token_deadline_scales_with_the_prompt(tight_watchdog):
+    # 30 tokens at 100/s: a 0.3 s prefill, past the 0.1 s base deadline.
+    server = _server(prefill_tokens_per_second=100)
+    history = [{"role": "user", "content": " ".join(["word"] * 24)}]
+    tokens = len(prompt_tokens(history))
+    async with _serve(server) as url:
+        pipeline = LLMPipeline(url, "m")
+        phases = StreamPhases()
+        chunks = [
+            chunk
+            async for chunk in pipeline.chat_completion_stream(
+                history, prompt_tokens=tokens, phases=phases
+            )
+        ]
+        assert len(chunks) == 4
+        assert phases.prefill >= tokens / 100 - 0.05
+        assert phases.aborted is None
+
+        # Without the prompt's size only the base deadline applies.
+        history = [{"role": "user", "content": " ".join(["other"] * 24)}]
+        phases = StreamPhases()
+        with pytest.raises(StreamStalled) as stalled:
+            async for _ in pipeline.chat_completion_stream(history, phases=phases):
+                pass
+        assert stalled.value.phase == phases.aborted == "prefill"
+        await pipeline.aclose()
+
+
+async def test_busy_slot_extends_the_deadline(tight_watchdog, monkeypatch):
+    monkeypatch.setattr(inference, "STALL_EXTENSIONS", 3)
+    server = _server(prefill_seconds=0.25)
+    async with _serve(server) as url:
+        pipeline = LLMPipeline(url, "m")
+        phases = StreamPhases()
+        chunks = [
+            chunk
+            async for chunk in pipeline.chat_completion_stream(
+                [{"role": "user", "content": "Hi"}], phases=phases
+            )
+        ]
+        await pipeline.aclose()
+
+    # /slots showed the slot prefilling, so the 0.1 s deadline moved on.
+    assert len(chunks) == 4
+    assert phases.prefill >= 0.2
+
+
+async def test_decode_stall_aborts_and_closes_the_stream(tight_watchdog, monkeypatch):
+    monkeypatch.setattr(inference.env, "INFERENCE_FIRST_TOKEN_SECONDS", 2.0)
+    # The seeded fault draw freezes the stream after its third token.
+    server = _server(tokens_per_second=100, stall_rate=1.0, stall_seconds=5.0)
+    async with _serve(server) as url:
+        pipeline = LLMPipeline(url, "m")
+        phases = StreamPhases()
+        started = time.monotonic()
+        chunks = []
+        with pytest.raises(StreamStalled) as stalled:
+            async for chunk in pipeline.chat_completion_stream(
+                [{"role": "user", "content": "Hi"}], phases=phases
+            ):
+                chunks.append(chunk)
+        assert time.monotonic() - started < 1
+        while server.stats["cancelled"] == 0 and time.monotonic() - started < 2:
+            await asyncio.sleep(0.005)
+        await pipeline.aclose()
+
+    assert stalled.value.phase == phases.aborted == "decode"
+    assert chunks and phases.decode > 0 and phases.max_stall >= 0.1
+    assert server.stats["cancelled"] == 1
+    assert pipeline.scheduler_stats()["in_use"] == 0
+
+
+async def test_tokenize_and_props_match_the_real_server_shape():
+    server = _server(n_ctx=2048, slots=3)
+    pipeline = _llm(server)
+
+    assert await pipeline.count_tokens_many(["one two, three"]) == [4]
+    await pipeline.wait_for_startup()
+    assert pipeline.context_tokens == 2048
+    assert pipeline.scheduler_stats()["capacity"] == 3
+    await pipeline.aclose()
+
+
+async def test_slots_bound_concurrency():
+    server = _server(slots=2, tokens_per_second=200, completion_tokens=5)
+    payload = {"messages": [{"role": "user", "content": "Hi"}], "stream": True}
+
+    # A plain client: the pipeline's own admission would cap concurrency first.
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=server.app), base_url="http://fake"
+    ) as http:
+        responses = await asyncio.gather(
+            *(http.post("/v1/chat/completions", json=payload) for _ in range(5))
+        )
+
+    assert all(response.text.endswith("data: [DONE]\n\n") for response in responses)
+    assert server.stats["max_busy"] == 2
+    assert server.stats["completed"] == 5
+    assert not any(slot.busy for slot in server.slots)
+
+
+async def test_embeddings_are_deterministic_and_similar_for_shared_words():
+    server = _server(embedding_dim=8)
+    pipeline = EmbeddingPipeline(
+        "http://fake", "m", transport=httpx.ASGITransport(app=server.app)
+    )
+    first = await pipeline.embed(["red apples", "red apples"])
+    assert first[0] == first[1]
+    assert first[0] == pytest.approx(embed_text("red apples", 8))
+    await pipeline.aclose()
+
+    def cosine(a, b):
+        return sum(x * y for x, y in zip(a, b))
+
+    anchor = embed_text("the red apple pie recipe", 256)
+    assert cosine(anchor, embed_text("a red apple pie", 256)) > cosine(
+        anchor, embed_text("quarterly tax filing deadline", 256)
+    )
+
+
+async def test_injected_errors_surface_as_http_errors():
+    server = _server(error_rate=1.0)
+    pipeline = _llm(server)
+
+    with pytest.raises(httpx.HTTPStatusError) as failure:
+        await pipeline.chat_completion_sync([{"role": "user", "content": "Hi"}])
+
+    assert failure.value.response.status_code == 500
+    assert server.stats["errors"] == 1
+    await pipeline.aclose()
+
+
+async def test_malformed_lines_are_skipped_and_stalls_delay_the_stream():
+    server = _server(malformed_rate=1.0, stall_rate=1.0, stall_seconds=0.2)
+    pipeline = _llm(server)
+
+    started = time.perf_counter()
+    chunks, [usage] = await _collect(pipeline)
+
+    assert time.perf_counter() - started >= 0.2
+    assert "".join(text for _, text in chunks) == "the quick brown fox"
+    assert usage.completion_tokens == 4
+    assert server.stats["malformed"] == 4 and server.stats["stalls"] == 1
+    await pipeline.aclose()
+
+
+async def test_health_reports_loading_then_ok():
+    server = _server(loading_seconds=0.2)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=server.app), base_url="http://fake"
+    ) as http:
+        loading = await http.get("/health")
+        await asyncio.sleep(0.25)
+        ready = await http.get("/health")
+
+    assert loading.status_code == 503
+    assert loading.json()["error"]["message"] == "Loading model"
+    assert ready.json() == {"status": "ok"}
+
+
+async def test_chat_api_end_to_end(monkeypatch):
+    engine = db.get_session_manager().async_engine
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with db.get_session_manager().async_session_maker() as session:
+        user = User()
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+
+    server = _server(reasoning_tokens=2)
+    pipeline = _llm(server)
+    monkeypatch.setattr(chatting_module, "get_inference_pipeline", lambda tier: pipeline)
+
+    async def _auth() -> TokenPayload:
+        return TokenPayload(
+            user_id=user_id,
+            timestamp=timing.get_utc_now().timestamp(),
+            refresh_token_id=None,
+        )
+
+    app.dependency_overrides[web.extract_access_token] = _auth
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as http:
+            response = await http.post(
+                "/api/chat/stream", json={"message": "Hello there", "enableThinking": True}
+            )
+        events = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+        thread_id = events[0]["threadId"]
+        await get_run(thread_id)._task
+
+        thinking = [e["chunk"] for e in events if e["event"] == "new_thinking_chunk"]
+        content = [e["chunk"] for e in events if e["event"] == "new_chunk"]
+        assert "".join(thinking) == "the quick"
+        assert "".join(content) == "brown fox jumps over"
+
+        async with db.get_session_manager().async_session_maker() as session:
+            row = (
+                await session.execute(
+                    select(GenerationRunRow).where(GenerationRunRow.thread_id == thread_id)
+                )
+            ).scalar_one()
+        assert row.status == "finished"
+        assert row.completion_tokens == 6 and row.prompt_tokens > 0
+        assert row.budget_exhausted is None
+    finally:
+        app.dependency_overrides.pop(web.extract_access_token, None)
+        await pipeline.aclose()
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+
+
+async def test_chat_api_records_an_exhausted_reasoning_budget(monkeypatch):
+    engine = db.get_session_manager().async_engine
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with db.get_session_manager().async_session_maker() as session:
+        user = User()
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+
+    # Thinks by default, like Qwen3.5 with no thinking flag sent.
+    server = _server(reasoning_tokens=50, thinking_by_default=True)
+    pipeline = _llm(server)
+    monkeypatch.setattr(chatting_module, "get_inference_pipeline", lambda tier: pipeline)
+    monkeypatch.setattr(inference.env, "SMALL_REASONING_BUDGET_TOKENS", 2)
+
+    async def _auth() -> TokenPayload:
+        return TokenPayload(
+            user_id=user_id,
+            timestamp=timing.get_utc_now().timestamp(),
+            refresh_token_id=None,
+        )
+
+    app.dependency_overrides[web.extract_access_token] = _auth
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as http:
+            response = await http.post("/api/chat/stream", json={"message": "Write a story"})
+        events = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+        thread_id = events[0]["threadId"]
+        await get_run(thread_id)._task
+
+        names = [e["event"] for e in events]
+        budget = events[names.index("budget_exhausted")]
+        assert budget == {
+            "event": "budget_exhausted",
+            "kind": "reasoning",
+            "limitTokens": 2,
+            "threadId": thread_id,
+        }
+        # Every reasoning chunk precedes the event, every answer chunk follows it.
+        assert "new_thinking_chunk" not in names[names.index("budget_exhausted") :]
+        assert "new_chunk" not in names[: names.index("budget_exhausted")]
+        content = [e["chunk"] for e in events if e["event"] == "new_chunk"]
+        assert "".join(content) == "the quick brown fox"
+
+        async with db.get_session_manager().async_session_maker() as session:
+            row = (
+                await session.execute(
+                    select(GenerationRunRow).where(GenerationRunRow.thread_id == thread_id)
+                )
+            ).scalar_one()
+        assert row.status == "finished"
+        assert row.budget_exhausted == "reasoning"
+        assert row.completion_tokens == 6
+    finally:
+        app.dependency_overrides.pop(web.extract_access_token, None)
+        await pipeline.aclose()
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
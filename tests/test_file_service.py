@@ -1,13 +1,20 @@
+import asyncio
 from dataclasses import dataclass, field
+from types import SimpleNamespace
 
 import pytest
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
 
+import services.file as file_module
+import services.ingestion as ingestion_module
 from models import FileHasProject, FileHasThread, Project, Thread, User
+from pipelines.breaker import BackendUnavailable
 from services.file import (
     delete_user_file,
     get_files,
     get_user_file,
+    index_file_in_background,
     link_file_with_project,
     link_file_with_thread,
     unlink_file_with_project,
@@ -170,3 +177,49 @@ async def test_unlink_project_purges_vectors(session, repo):
     assert await repo.search_similar_chunks(session, [1.0] + [0.0] * 7, 5, [project.id]) == []
     assert file_metadata.project_id is None
     assert file_metadata.index_status == "not_indexed"
+
+
+async def test_open_embedding_circuit_defers_indexing(engine, monkeypatch):
+    maker = async_sessionmaker(engine, expire_on_commit=False)
+    monkeypatch.setattr(
+        file_module, "get_session_manager", lambda: SimpleNamespace(async_session_maker=maker)
+    )
+    monkeypatch.setattr(file_module, "INDEX_RETRY_SECONDS", 0.01)
+    monkeypatch.setattr(file_module, "INDEX_RETRY_ATTEMPTS", 2)
+    attempts = []
+
+    async def index(session, file_metadata, project_id):
+        attempts.append(file_metadata.index_status)
+        raise BackendUnavailable("embedding", 0.0)
+
+    monkeypatch.setattr(ingestion_module, "index_file_for_project", index)
+    async with maker() as session:
+        user = await _user(session)
+        project = Project(user_id=user.id, title="Project")
+        session.add(project)
+        await session.flush()
+        file_metadata = await upload_file(
+            session,
+            user_id=user.id,
+            name="later.txt",
+            content_type="text/plain",
+            data=b"index me later",
+            file_store=MemoryFileStore(),
+        )
+        await link_file_with_project(
+            session, user_id=user.id, file_id=file_metadata.id, project_id=project.id
+        )
+        await session.commit()
+
+    await index_file_in_background(user.id, file_metadata.id, project.id)
+    async with maker() as session:
+        deferred = await get_user_file(session, user.id, file_metadata.id)
+        assert deferred.index_status == "deferred"
+        assert "embedding backend is unavailable" in deferred.index_error
+
+    # The retry runs on its own and, out of attempts, gives up as before.
+    await asyncio.wait_for(file_module._index_retries[file_metadata.id], 1)
+    assert attempts == ["pending", "deferred"]
+    async with maker() as session:
+        failed = await get_user_file(session, user.id, file_metadata.id)
+        assert failed.index_status == "failed"
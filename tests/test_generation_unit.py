@@ -1,16 +1,22 @@
 """Unit tests for the decoupled-generation registry (no HTTP, no DB)."""
 
 import asyncio
+import hashlib
 import json
 
 import pytest
 
 import services.generation as generation_module
+from schemas.chatting import StreamingBlock, encode_chunk_line
 from services.generation import (
+    EventLog,
+    FrameCoalescer,
     GenerationRun,
     GenerationStatus,
+    TextBuffer,
     get_run,
     register_run,
+    registry_stats,
     remove_run,
     schedule_eviction,
 )
@@ -130,3 +136,198 @@ async def test_register_run_cancels_pending_eviction(monkeypatch):
     schedule_eviction(second)
     await asyncio.sleep(generation_module.EVENTS_GRACE_SECONDS + 0.1)
     assert get_run("t7") is None
+
+
+@pytest.mark.parametrize(
+    "chunk", ["Hello", 'q"uo\\te', "ünï 漢字 🎉", "\n\t\x00\x1f\u2028", ""]
+)
+@pytest.mark.parametrize("event", ["new_chunk", "new_thinking_chunk"])
+def test_chunk_encoder_matches_model_serialization(event, chunk):
+    expected = StreamingBlock(chunk=chunk, event=event).model_dump_json(by_alias=True) + "\n"
+    assert encode_chunk_line(event, chunk) == expected
+
+
+async def test_coalescer_merges_deltas_within_window():
+    run = GenerationRun("t8")
+    frames = FrameCoalescer(run, window=0.02)
+    for text in ("a", "b", "c"):
+        frames.add("new_chunk", text)
+    assert list(run._events) == []
+
+    await asyncio.sleep(0.05)
+    assert list(run._events) == [encode_chunk_line("new_chunk", "abc")]
+
+
+async def test_coalescer_splits_on_kind_change_and_size():
+    run = GenerationRun("t9")
+    frames = FrameCoalescer(run, window=60, max_chars=4)
+    frames.add("new_thinking_chunk", "th")
+    frames.add("new_chunk", "ab")
+    frames.add("new_chunk", "cd")
+    frames.add("new_chunk", "e")
+    frames.flush()
+    frames.flush()
+    assert list(run._events) == [
+        encode_chunk_line("new_thinking_chunk", "th"),
+        encode_chunk_line("new_chunk", "abcd"),
+        encode_chunk_line("new_chunk", "e"),
+    ]
+
+
+async def test_coalesced_frames_replay_exactly():
+    run = GenerationRun("t10")
+    live = asyncio.create_task(_collect(run.subscribe(0)))
+    frames = FrameCoalescer(run, window=0.01)
+    for n in range(20):
+        frames.add("new_chunk", str(n))
+        if n % 5 == 4:
+            await asyncio.sleep(0.02)
+    frames.flush()
+    await run.finish(GenerationStatus.FINISHED)
+
+    received = await live
+    assert "".join(received) == "".join([line async for line in run.subscribe(0)])
+    tail = [line async for line in run.subscribe(2)]
+    assert tail == received[2:]
+    text = "".join(json.loads(line)["chunk"] for line in received)
+    assert text == "".join(str(n) for n in range(20))
+
+
+async def test_coalescer_without_window_publishes_every_delta():
+    run = GenerationRun("t11")
+    frames = FrameCoalescer(run, window=0)
+    frames.add("new_chunk", "a")
+    frames.add("new_chunk", "b")
+    assert len(run._events) == 2
+
+
+def test_event_log_straddles_blocks_and_seals(monkeypatch):
+    monkeypatch.setattr(generation_module, "EVENT_BLOCK_BYTES", 16)
+    log = EventLog()
+    lines = [encode_chunk_line("new_chunk", text) for text in ("a", "ünï 漢字 🎉", "b" * 40)]
+    for line in lines:
+        log.append(line)
+    assert len(log) == 3 and list(log) == lines
+    assert log.nbytes == 16 * len(log._blocks) + 3 * 8
+
+    log.seal()
+    assert [log[index] for index in (2, 0, 1)] == [lines[2], lines[0], lines[1]]
+    assert log.nbytes == sum(len(line.encode()) for line in lines) + 3 * 8
+    with pytest.raises(RuntimeError):
+        log.append(lines[0])
+
+
+async def test_late_subscriber_replays_sealed_log_from_any_offset():
+    run = GenerationRun("t12")
+    for n in range(5):
+        await run.publish(_line(n))
+    await run.finish(GenerationStatus.FINISHED)
+    run.publish_nowait(_line(99))  # dropped: the log is terminal
+
+    for offset in range(6):
+        assert [line async for line in run.subscribe(offset)] == [
+            _line(n) for n in range(offset, 5)
+        ]
+
+
+async def test_memory_cap_evicts_least_recently_used_finished_runs(monkeypatch):
+    monkeypatch.setattr(generation_module, "EVENT_BLOCK_BYTES", 64)
+    runs = {}
+    for thread_id in ("old", "used", "live", "new"):
+        run = GenerationRun(thread_id)
+        for n in range(10):
+            await run.publish(_line(n))
+        register_run(run)
+        runs[thread_id] = run
+    size = runs["old"].events_nbytes
+    monkeypatch.setattr(generation_module, "EVENTS_MEMORY_CAP_BYTES", 10**9)
+    for thread_id in ("old", "used"):
+        await runs[thread_id].finish(GenerationStatus.FINISHED)
+        schedule_eviction(runs[thread_id])
+    assert get_run("used") is runs["used"]  # touch: "old" is now least recent
+
+    sealed = runs["old"].events_nbytes
+    assert sealed < size
+    # Room for the running run plus two finished ones: "old" has to go.
+    monkeypatch.setattr(generation_module, "EVENTS_MEMORY_CAP_BYTES", size + 2 * sealed)
+    await runs["new"].finish(GenerationStatus.FINISHED)
+    schedule_eviction(runs["new"])
+
+    assert get_run("old") is None
+    assert get_run("used") is runs["used"] and get_run("new") is runs["new"]
+    assert get_run("live") is runs["live"]
+    stats = registry_stats()
+    assert stats["runs"] == 3 and stats["running"] == 1
+    assert stats["bytes"] == size + 2 * sealed
+    assert stats["memory_evictions"] == 1
+
+    # The running run is never evicted, even when it alone exceeds the cap.
+    monkeypatch.setattr(generation_module, "EVENTS_MEMORY_CAP_BYTES", 1)
+    generation_module._enforce_memory_cap()
+    assert set(generation_module._runs) == {"live"}
+
+
+async def test_subscriber_drains_everything_published_since_its_last_wakeup():
+    run = GenerationRun("t13")
+    batches = asyncio.create_task(_collect(run.subscribe_batches(0)))
+    await asyncio.sleep(0.01)
+    run.publish_many([_line(0), _line(1), _line(2)])
+    await asyncio.sleep(0.01)
+    run.publish_nowait(_line(3))
+    run.publish_nowait(_line(4))
+    await run.finish(GenerationStatus.FINISHED)
+
+    assert await batches == [[_line(0), _line(1), _line(2)], [_line(3), _line(4)]]
+    assert [body async for body in run.stream(1)] == ["".join(_line(n) for n in range(1, 5))]
+
+
+async def test_batches_are_capped_in_bytes(monkeypatch):
+    monkeypatch.setattr(generation_module, "SUBSCRIBE_BATCH_MAX_BYTES", 2 * len(_line(0)))
+    run = GenerationRun("t14")
+    run.publish_many([_line(n) for n in range(5)] + ["x" * 100 + "\n"])
+    await run.finish(GenerationStatus.FINISHED)
+
+    sizes = [len(batch) async for batch in run.subscribe_batches(0)]
+    # The oversized event still goes out, alone.
+    assert sizes == [2, 2, 1, 1]
+
+
+async def test_lagging_subscriber_is_cut_off_without_blocking_the_publisher(monkeypatch):
+    monkeypatch.setattr(generation_module, "SUBSCRIBER_MAX_LAG_BYTES", 5 * len(_line(0)))
+    run = GenerationRun("t15")
+    run.publish_many([_line(n) for n in range(20)])  # backlog before joining is fine
+    slow = run.subscribe_batches(0)
+    assert len(await slow.__anext__()) == 20
+    follower = asyncio.create_task(slow.__anext__())
+    await asyncio.sleep(0.01)
+    run.publish_nowait(_line(20))
+    assert await follower == [_line(20)]
+
+    # The reader stalls while the publisher keeps going.
+    for n in range(21, 40):
+        run.publish_nowait(_line(n))
+    with pytest.raises(StopAsyncIteration):
+        await slow.__anext__()
+    # Unbounded subscribers (the broker feed, replays) are never cut.
+    await run.finish(GenerationStatus.FINISHED)
+    assert len([line async for line in run.subscribe(21)]) == 19
+
+
+def test_text_buffer_tracks_length_join_and_digest():
+    buffer = TextBuffer()
+    assert not buffer and str(buffer) == "" and buffer == ""
+    assert buffer.sha256() == hashlib.sha256(b"").hexdigest()
+
+    pieces = ["Hel", "lo ", "wörld", "", " 🎉"]
+    for piece in pieces:
+        buffer += piece
+    expected = "".join(pieces)
+
+    assert len(buffer) == len(expected)
+    assert str(buffer) == expected and buffer == expected
+    assert str(buffer) is str(buffer)  # cached until the next append
+    assert buffer.sha256() == hashlib.sha256(expected.encode()).hexdigest()
+    # Reading the digest does not consume the running state.
+    buffer.append("!")
+    assert buffer.sha256() == hashlib.sha256((expected + "!").encode()).hexdigest()
+    assert buffer == expected + "!"
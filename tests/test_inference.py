@@ -1,3 +1,4 @@
+import asyncio
 import json
 
 import httpx
@@ -5,6 +6,7 @@ import pytest
 
 from pipelines import inference
 from pipelines.inference import LLMPipeline, Tier, _resolve_chat_tier
+from utils import metrics
 
 
 async def test_count_tokens_many_uses_tokenize_endpoint():
@@ -35,6 +37,32 @@ def _set_tiers(monkeypatch, **kwargs):
         monkeypatch.setattr(inference.env, key, kwargs.get(key), raising=False)
 
 
+def test_generation_budget_bounds_the_completion_by_the_window(monkeypatch):
+    monkeypatch.setattr(inference.env, "SMALL_REASONING_BUDGET_TOKENS", 2048)
+    monkeypatch.setattr(inference.env, "SMALL_MAX_COMPLETION_TOKENS", 0)
+
+    roomy = inference.generation_budget(Tier.SMALL, 1000, 4096)
+    assert roomy.max_tokens == 4096 - 1000 - inference.BUDGET_MARGIN_TOKENS
+    assert roomy.reasoning_tokens == 2048
+
+    # A long prompt: the reasoning cap shrinks so the answer keeps its share.
+    tight = inference.generation_budget(Tier.SMALL, 3500, 4096)
+    assert tight.reasoning_tokens == tight.max_tokens - inference.MIN_ANSWER_TOKENS
+
+    # An overfull prompt still asks for a minimal completion, without reasoning.
+    full = inference.generation_budget(Tier.SMALL, 5000, 4096)
+    assert full.max_tokens == inference.MIN_COMPLETION_TOKENS
+    assert full.reasoning_tokens == 0
+
+
+def test_generation_budget_is_configured_per_tier(monkeypatch):
+    monkeypatch.setattr(inference.env, "BIG_REASONING_BUDGET_TOKENS", 0)
+    monkeypatch.setattr(inference.env, "BIG_MAX_COMPLETION_TOKENS", 512)
+
+    budget = inference.generation_budget(Tier.BIG, 100, 8192)
+    assert budget == inference.GenerationBudget(max_tokens=512, reasoning_tokens=None)
+
+
 def test_resolve_big_falls_back_to_small(monkeypatch):
     _set_tiers(
         monkeypatch,
@@ -120,3 +148,156 @@ def test_build_payload_none_keeps_server_default():
 def test_build_payload_unknown_family_ignores_toggle():
     assert "chat_template_kwargs" not in _payload_for("SomeOther-7B", True)
     assert "chat_template_kwargs" not in _payload_for("SomeOther-7B", False)
+
+
+def _sse(*chunks: dict) -> bytes:
+    lines = [f"data: {json.dumps(chunk)}\n\n" for chunk in chunks]
+    return ("".join(lines) + "data: [DONE]\n\n").encode()
+
+
+async def test_pooled_client_tracks_in_use_and_survives_calls(monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/tokenize":
+            return httpx.Response(200, json={"tokens": [1, 2]})
+        return httpx.Response(
+            200,
+            content=_sse(
+                {"choices": [{"delta": {"content": "a"}}]},
+                {"choices": [{"delta": {"content": "b"}}]},
+            ),
+        )
+
+    pipeline = LLMPipeline("http://llama", "model", httpx.MockTransport(handler))
+    monkeypatch.setitem(inference._instances, Tier.SMALL, pipeline)
+    seen_in_use = []
+    async for _ in pipeline.chat_completion_stream([]):
+        seen_in_use.append(pipeline.pool_stats().in_use)
+        exposition = metrics.REGISTRY.render()
+        assert 'clyre_llm_pool_connections{tier="small",state="in_use"} 1' in exposition
+    assert seen_in_use == [1, 1]
+
+    await pipeline.count_tokens_many(["x", "y", "z"])
+    stats = pipeline.pool_stats()
+    assert stats.in_use == 0
+    assert stats.requests == 4
+
+    await pipeline.aclose()
+    # A closed pipeline reopens transparently; counters are lifetime totals.
+    assert await pipeline.count_tokens_many(["w"]) == [2]
+    assert pipeline.pool_stats().requests == 5
+    await pipeline.aclose()
+
+
+async def test_stream_and_sync_report_usage_and_timings():
+    usage = {"prompt_tokens": 120, "completion_tokens": 2}
+    timings = {"prompt_n": 30, "cache_n": 90, "prompt_ms": 15.0, "predicted_ms": 40.0}
+    payloads = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        payloads.append(payload)
+        if not payload["stream"]:
+            return httpx.Response(
+                200,
+                json={"id": "x", "choices": [], "usage": usage, "timings": timings},
+            )
+        body = _sse(
+            {"choices": [{"delta": {"content": "hi"}}]},
+            {"id": "x", "choices": [], "usage": usage, "timings": timings},
+        )
+        return httpx.Response(200, content=body)
+
+    pipeline = LLMPipeline("http://llama", "model", httpx.MockTransport(handler))
+    reported = []
+    history = [{"role": "user", "content": "hello"}]
+    async for _ in pipeline.chat_completion_stream(history, on_usage=reported.append):
+        pass
+    await pipeline.chat_completion_sync(history, on_usage=reported.append)
+
+    assert payloads[0]["stream_options"] == {"include_usage": True}
+    expected = inference.CompletionUsage(
+        prompt_tokens=120,
+        completion_tokens=2,
+        cached_tokens=90,
+        prefill_tokens=30,
+        prompt_ms=15.0,
+        predicted_ms=40.0,
+    )
+    assert reported == [expected, expected]
+    await pipeline.aclose()
+
+
+async def test_count_tokens_many_caches_counts_per_text():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        content = json.loads(request.content)["content"]
+        requests.append(content)
+        return httpx.Response(200, json={"tokens": content.split()})
+
+    pipeline = LLMPipeline("http://llama", "model", httpx.MockTransport(handler))
+
+    assert await pipeline.count_tokens_many(["a b", "c"]) == [2, 1]
+    assert await pipeline.count_tokens_many(["c", "d e f"], admission=False) == [1, 3]
+    assert requests == ["a b", "c", "d e f"]
+
+
+async def test_count_tokens_many_admits_a_batch_once_with_bounded_fan_out(monkeypatch):
+    monkeypatch.setattr(inference, "TOKENIZE_CONCURRENCY", 3)
+    in_flight = peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        content = json.loads(request.content)["content"]
+        return httpx.Response(200, json={"tokens": content.split()})
+
+    pipeline = LLMPipeline("http://llama", "model", httpx.MockTransport(handler))
+    texts = [f"text {index}" + " w" * (index % 7) for index in range(200)]
+
+    assert await pipeline.count_tokens_many(texts) == [index % 7 + 2 for index in range(200)]
+    assert pipeline.scheduler_stats()["admitted"] == 1
+    assert peak == 3
+    await pipeline.aclose()
+
+
+async def test_context_tokens_come_from_props(monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/props":
+            return httpx.Response(
+                200, json={"total_slots": 2, "default_generation_settings": {"n_ctx": 8192}}
+            )
+        return httpx.Response(200, json={"status": "ok"})
+
+    monkeypatch.setattr(inference.env, "CHAT_CONTEXT_TOKENS", 4096)
+    pipeline = LLMPipeline("http://llama", "model", httpx.MockTransport(handler))
+    assert pipeline.context_tokens == 4096
+    await pipeline.wait_for_startup()
+    assert pipeline.context_tokens == 8192
+    await pipeline.aclose()
+
+
+async def test_sync_completion_timeout_scales_with_prompt_and_max_tokens(monkeypatch):
+    monkeypatch.setattr(inference.env, "INFERENCE_FIRST_TOKEN_SECONDS", 60.0)
+    monkeypatch.setattr(inference.env, "INFERENCE_PREFILL_TOKENS_PER_SECOND", 50.0)
+    monkeypatch.setattr(inference.env, "INFERENCE_DECODE_TOKENS_PER_SECOND", 5.0)
+    read_timeouts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path != "/v1/chat/completions":
+            return httpx.Response(404)
+        read_timeouts.append(request.extensions["timeout"]["read"])
+        return httpx.Response(200, json={"id": "x", "choices": [], "usage": {}, "timings": {}})
+
+    pipeline = LLMPipeline("http://llama", "model", httpx.MockTransport(handler))
+    history = [{"role": "user", "content": "hello"}]
+    await pipeline.chat_completion_sync(history, max_tokens=512, prompt_tokens=500)
+    await pipeline.chat_completion_sync(history, prompt_tokens=500)
+
+    # First token allowance + 500 / 50 s prefill + 512 / 5 s decode.
+    assert read_timeouts[0] == pytest.approx(60.0 + 10.0 + 102.4)
+    assert read_timeouts[1] == pytest.approx(inference.SYNC_COMPLETION_TIMEOUT + 10.0)
+    await pipeline.aclose()
@@ -81,6 +81,34 @@ async def _counts(texts: list[str]) -> list[int]:
     return [len(text.split()) for text in texts]
 
 
+async def test_ingest_file_tokenizes_chunks_in_bounded_groups(session, repo, monkeypatch):
+    import services.ingestion as ingestion_module
+    from utils import env
+
+    monkeypatch.setattr(env, "CHUNK_SIZE", 10)
+    monkeypatch.setattr(env, "CHUNK_OVERLAP", 0)
+    monkeypatch.setattr(ingestion_module, "TOKENIZE_GROUP_SIZE", 3)
+    file, store = await _file(session, content=" ".join(f"word{i}" for i in range(20)))
+    groups: list[int] = []
+
+    async def counter(texts: list[str]) -> list[int]:
+        groups.append(len(texts))
+        return await _counts(texts)
+
+    rows = await ingest_file(
+        session,
+        file,
+        repository=repo,
+        embedder=FixedEmbedder(8),
+        file_store=store,
+        token_counter=counter,
+    )
+
+    assert max(groups) == 3
+    assert sum(groups) == len(rows)
+    assert [row.token_count for row in rows] == [1] * len(rows)
+
+
 async def test_reingest_replaces_old_vectors(session, repo):
     file, _ = await _file(session, content="old content")
     await ingest_file(
@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import text
+
+import db
+from utils import metrics
+from utils.metrics import Counter, Gauge, Histogram, Registry
+
+
+def _registry(*families):
+    registry = Registry()
+    for family in families:
+        registry.register(family)
+    return registry
+
+
+def test_counter_and_gauge_exposition_with_labels():
+    requests = Counter("requests_total", "Requests seen", ("status",))
+    requests.labels("ok").inc()
+    requests.labels("ok").inc(2)
+    requests.labels('we"ird\n').inc()
+    depth = Gauge("depth", "Queue depth")
+    depth.set(1.5)
+
+    text = _registry(requests, depth).render()
+    assert text.splitlines() == [
+        "# HELP requests_total Requests seen",
+        "# TYPE requests_total counter",
+        'requests_total{status="ok"} 3',
+        'requests_total{status="we\\"ird\\n"} 1',
+        "# HELP depth Queue depth",
+        "# TYPE depth gauge",
+        "depth 1.5",
+    ]
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    latency = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value)
+
+    lines = _registry(latency).render().splitlines()[2:]
+    assert lines == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 3.65",
+        "latency_seconds_count 4",
+    ]
+
+
+def test_callback_gauge_is_computed_at_scrape_time():
+    state = {("small",): 2}
+    queued = Gauge("queue", "Waiting", ("tier",), callback=lambda: state)
+    registry = _registry(queued)
+    assert 'queue{tier="small"} 2' in registry.render()
+    state[("big",)] = 1
+    assert 'queue{tier="big"} 1' in registry.render()
+
+
+def test_label_arity_and_duplicate_names_are_rejected():
+    requests = Counter("requests_total", "Requests", ("status",))
+    with pytest.raises(ValueError):
+        requests.inc()
+    with pytest.raises(ValueError):
+        _registry(requests, Counter("requests_total", "Again"))
+
+
+def _count(histogram, *labels):
+    child = histogram._children.get(labels)
+    return child.count if child is not None else 0
+
+
+async def test_loop_lag_monitor_sees_a_blocked_loop(monkeypatch):
+    monkeypatch.setattr(metrics, "LOOP_LAG_INTERVAL_SECONDS", 0.01)
+    before = _count(metrics.LOOP_LAG_SECONDS)
+    await metrics.start_loop_lag_monitor()
+    try:
+        await asyncio.sleep(0.005)
+        time.sleep(0.06)  # hold the loop past the monitor's timer
+        await asyncio.sleep(0.03)
+    finally:
+        await metrics.stop_loop_lag_monitor()
+
+    child = metrics.LOOP_LAG_SECONDS.labels()
+    assert child.count > before
+    # The blocked sample landed above the 50 ms bucket.
+    assert sum(child.counts[metrics.LOOP_LAG_SECONDS.buckets.index(0.05) + 1 :]) >= 1
+
+
+async def test_statement_timing_by_kind(engine):
+    db.register_statement_timing(engine)
+    selects = _count(db.STATEMENT_SECONDS, "select")
+    inserts = _count(db.STATEMENT_SECONDS, "insert")
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE timing_probe (id INTEGER)"))
+        await conn.execute(text("INSERT INTO timing_probe VALUES (1)"))
+        await conn.execute(text("SELECT id FROM timing_probe"))
+
+    assert _count(db.STATEMENT_SECONDS, "select") == selects + 1
+    assert _count(db.STATEMENT_SECONDS, "insert") == inserts + 1
@@ -14,6 +14,7 @@ _EXPECTED_TABLES = {
     "generation_run",
     "local_connection",
     "message",
+    "message_segment",
     "project",
     "role",
     "role_has_user",
@@ -0,0 +1,146 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import pipelines.embed as embed_module
+import pipelines.replicas as replicas_module
+from pipelines import inference
+from pipelines.embed import EmbeddingPipeline
+from pipelines.inference import LLMPipeline, Tier
+from pipelines.replicas import ReplicaPool, split_urls
+from utils import metrics
+
+DIM = 8
+
+
+async def _always(url: str) -> bool:
+    return True
+
+
+def test_split_urls_accepts_single_and_comma_lists():
+    assert split_urls("http://a/") == ["http://a"]
+    assert split_urls("http://a, http://b/,") == ["http://a", "http://b"]
+    with pytest.raises(ValueError):
+        split_urls(" , ")
+
+
+async def test_lease_routes_to_least_outstanding_replica():
+    pool = ReplicaPool(["http://a", "http://b", "http://c"], _always)
+    async with pool.lease() as first:
+        async with pool.lease() as second:
+            async with pool.lease() as third:
+                assert len({first.url, second.url, third.url}) == 3
+                async with pool.lease() as fourth:
+                    assert fourth.in_flight == 2
+    assert [replica.in_flight for replica in pool.replicas] == [0, 0, 0]
+
+
+async def test_failure_ejects_and_probe_readmits(monkeypatch):
+    monkeypatch.setattr(replicas_module, "PROBE_INTERVAL", 0.01)
+    recovered = asyncio.Event()
+
+    async def probe(url: str) -> bool:
+        return recovered.is_set()
+
+    pool = ReplicaPool(["http://a", "http://b"], probe)
+    with pytest.raises(httpx.ConnectError):
+        async with pool.lease(prefer=lambda replica: replica.url == "http://a"):
+            raise httpx.ConnectError("refused")
+
+    a, b = pool.replicas
+    assert not a.healthy
+    assert [(await _pick(pool)).url for _ in range(4)] == ["http://b"] * 4
+
+    recovered.set()
+    await asyncio.sleep(0.1)
+    assert a.healthy
+    assert {(await _pick(pool)).url for _ in range(4)} == {"http://a", "http://b"}
+    await pool.aclose()
+
+
+async def _pick(pool: ReplicaPool):
+    async with pool.lease() as replica:
+        return replica
+
+
+async def test_client_errors_do_not_eject():
+    pool = ReplicaPool(["http://a"], _always)
+    request = httpx.Request("POST", "http://a")
+    with pytest.raises(httpx.HTTPStatusError):
+        async with pool.lease():
+            raise httpx.HTTPStatusError(
+                "bad", request=request, response=httpx.Response(400, request=request)
+            )
+    assert pool.replicas[0].healthy
+
+
+async def test_all_ejected_still_hands_out_a_replica():
+    pool = ReplicaPool(["http://a"], _always)
+    pool.eject(pool.replicas[0], reason="test")
+    assert (await _pick(pool)).url == "http://a"
+    await pool.aclose()
+
+
+async def test_llm_pipeline_skips_unready_replica_at_startup(monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "down":
+            return httpx.Response(503)
+        if request.url.path == "/tokenize":
+            return httpx.Response(200, json={"tokens": [1]})
+        return httpx.Response(200, json={"status": "ok"})
+
+    pipeline = LLMPipeline("http://up,http://down", "model", httpx.MockTransport(handler))
+    await pipeline.wait_for_startup()
+
+    health = {row["url"]: row["healthy"] for row in pipeline.replica_stats()}
+    assert health == {"http://up": True, "http://down": False}
+    assert await pipeline.count_tokens_many(["a", "b", "c"]) == [1, 1, 1]
+    assert {row["url"]: row["requests"] for row in pipeline.replica_stats()} == {
+        "http://up": 3,
+        "http://down": 0,
+    }
+
+    monkeypatch.setitem(inference._instances, Tier.SMALL, pipeline)
+    exposition = metrics.REGISTRY.render()
+    assert 'clyre_llm_replica_ejected{tier="small",replica="http://down"} 1' in exposition
+    assert 'clyre_llm_replica_ejected{tier="small",replica="http://up"} 0' in exposition
+    assert 'clyre_llm_replica_in_flight{tier="small",replica="http://up"} 0' in exposition
+    await pipeline.aclose()
+
+
+async def test_embedding_batches_fan_out_across_replicas(monkeypatch):
+    monkeypatch.setattr(embed_module, "EMBED_BATCH_SIZE", 2)
+    hosts = []
+    gate = asyncio.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        hosts.append(request.url.host)
+        await gate.wait()  # keep requests overlapping
+        texts = json.loads(request.content)["input"]
+        return httpx.Response(
+            200,
+            json={
+                "data": [
+                    {"index": i, "embedding": [float(j == len(text)) for j in range(DIM)]}
+                    for i, text in enumerate(texts)
+                ]
+            },
+        )
+
+    pipe = EmbeddingPipeline("http://e1,http://e2", "m", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(embed_module, "_embedding_instance", pipe)
+    embedding = asyncio.create_task(pipe.embed(["a", "bb", "ccc", "dddd"]))
+    while len(hosts) < 2:
+        await asyncio.sleep(0.001)
+    exposition = metrics.REGISTRY.render()
+    assert 'clyre_embedding_replica_in_flight{replica="http://e1"} 1' in exposition
+    assert 'clyre_embedding_replica_ejected{replica="http://e2"} 0' in exposition
+    gate.set()
+    out = await asyncio.wait_for(embedding, 1)
+
+    assert sorted(hosts) == ["e1", "e2"]
+    # Order is preserved across batches even though they ran concurrently.
+    assert [vector.index(1.0) for vector in out] == [1, 2, 3, 4]
+    await pipe.aclose()
@@ -0,0 +1,153 @@
+import asyncio
+import time
+
+import pytest
+
+from pipelines.scheduler import AdmissionScheduler, Priority
+
+
+async def _hold(scheduler, order, name, priority, user_id, release, on_queued=None):
+    async with scheduler.admit(priority, user_id, on_queued):
+        order.append(name)
+        await release.wait()
+
+
+async def test_capacity_bounds_concurrency():
+    scheduler = AdmissionScheduler(2)
+    order, release = [], asyncio.Event()
+    tasks = [
+        asyncio.create_task(_hold(scheduler, order, i, Priority.INTERACTIVE, "u", release))
+        for i in range(5)
+    ]
+    await asyncio.sleep(0)
+    assert order == [0, 1]
+    assert scheduler.stats()["queued"] == 3
+    release.set()
+    await asyncio.gather(*tasks)
+    assert order == [0, 1, 2, 3, 4]
+    assert scheduler.stats() == {"capacity": 2, "in_use": 0, "queued": 0, "admitted": 5}
+
+
+async def test_priority_classes_jump_the_queue():
+    scheduler = AdmissionScheduler(1)
+    order, release = [], asyncio.Event()
+    blocker = asyncio.create_task(
+        _hold(scheduler, order, "blocker", Priority.INTERACTIVE, "u", release)
+    )
+    await asyncio.sleep(0)
+    tasks = [
+        asyncio.create_task(_hold(scheduler, order, name, priority, "u", release))
+        for name, priority in (
+            ("ingest", Priority.INGESTION),
+            ("title", Priority.TITLE),
+            ("chat", Priority.INTERACTIVE),
+        )
+    ]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(blocker, *tasks)
+    assert order == ["blocker", "chat", "title", "ingest"]
+
+
+async def test_users_share_capacity_fairly():
+    scheduler = AdmissionScheduler(2)
+    order = []
+    gates = {name: asyncio.Event() for name in ("a1", "a2", "a3", "a4", "b1")}
+    tasks = [
+        asyncio.create_task(
+            _hold(scheduler, order, name, Priority.INTERACTIVE, name[0], gates[name])
+        )
+        for name in ("a1", "a2", "a3", "a4", "b1")
+    ]
+    await asyncio.sleep(0)
+    assert order == ["a1", "a2"]
+    gates["a1"].set()
+    await asyncio.sleep(0.01)
+    # User "b" holds nothing while "a" still runs one request: b goes next
+    # even though a3 and a4 arrived earlier.
+    assert order == ["a1", "a2", "b1"]
+    for gate in gates.values():
+        gate.set()
+    await asyncio.gather(*tasks)
+
+
+async def test_queued_callback_reports_moving_position():
+    scheduler = AdmissionScheduler(1)
+    order, gates = [], [asyncio.Event() for _ in range(3)]
+    positions = []
+
+    async def on_queued(position: int) -> None:
+        positions.append(position)
+
+    tasks = [
+        asyncio.create_task(_hold(scheduler, order, 0, Priority.INTERACTIVE, "u", gates[0])),
+        asyncio.create_task(_hold(scheduler, order, 1, Priority.INTERACTIVE, "u", gates[1])),
+    ]
+    await asyncio.sleep(0)
+    tasks.append(
+        asyncio.create_task(
+            _hold(scheduler, order, 2, Priority.INTERACTIVE, "u", gates[2], on_queued)
+        )
+    )
+    await asyncio.sleep(0)
+    assert positions == [2]
+    gates[0].set()
+    await asyncio.sleep(0.01)
+    assert positions == [2, 1]
+    for gate in gates:
+        gate.set()
+    await asyncio.gather(*tasks)
+    assert positions == [2, 1]
+
+
+async def test_cancelled_waiter_leaves_the_queue():
+    scheduler = AdmissionScheduler(1)
+    order, release = [], asyncio.Event()
+    holder = asyncio.create_task(_hold(scheduler, order, 0, Priority.INTERACTIVE, "u", release))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(_hold(scheduler, order, 1, Priority.INTERACTIVE, "u", release))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert scheduler.stats()["queued"] == 0
+    release.set()
+    await holder
+    assert scheduler.stats()["in_use"] == 0
+
+
+async def test_thousands_of_waiters_are_admitted_quickly():
+    scheduler = AdmissionScheduler(4)
+    order, release = [], asyncio.Event()
+    waiters = 4000
+
+    async def ingest(index: int) -> None:
+        async with scheduler.admit(Priority.INGESTION, f"u{index % 3}"):
+            order.append(index)
+            await release.wait()
+
+    positions = []
+
+    async def on_queued(position: int) -> None:
+        positions.append(position)
+
+    tasks = [asyncio.create_task(ingest(index)) for index in range(waiters)]
+    await asyncio.sleep(0)
+    chat = asyncio.create_task(
+        _hold(scheduler, [], "chat", Priority.INTERACTIVE, "c", asyncio.Event(), on_queued)
+    )
+    await asyncio.sleep(0)
+    assert scheduler.stats()["queued"] == waiters - 4 + 1
+    assert positions == [1]  # the chat jumps every ingestion waiter
+
+    started = time.perf_counter()
+    release.set()
+    await asyncio.gather(*tasks)
+    assert time.perf_counter() - started < 2.0
+    assert len(order) == waiters
+    for user in range(3):
+        mine = [index for index in order if index % 3 == user]
+        assert mine == sorted(mine)  # each user's requests keep their arrival order
+    chat.cancel()
+    await asyncio.gather(chat, return_exceptions=True)
+    assert scheduler.stats()["queued"] == 0
@@ -0,0 +1,95 @@
+import json
+
+import httpx
+
+from pipelines import inference
+from pipelines.inference import LLMPipeline, Tier
+from pipelines.slots import PromptCacheStats, SlotAffinity
+from utils import metrics
+
+
+def test_thread_keeps_its_slot_across_turns():
+    table = SlotAffinity(2)
+    a = table.acquire("thread-a")
+    table.release(a)
+    b = table.acquire("thread-b")
+    table.release(b)
+    assert a != b
+    assert table.acquire("thread-a") == a
+
+
+def test_busy_slot_falls_back_to_a_free_one():
+    table = SlotAffinity(2)
+    first = table.acquire("thread-a")
+    second = table.acquire("thread-a")
+    assert second is not None and second != first
+    assert table.acquire("thread-b") is None
+
+
+def test_least_recently_served_thread_is_evicted():
+    table = SlotAffinity(2)
+    for key in ("a", "b", "a", "c"):
+        table.release(table.acquire(key))
+    assert table.holds("a") and table.holds("c")
+    assert not table.holds("b")
+    assert (table.hits, table.misses, table.evictions) == (1, 3, 1)
+
+
+def test_keyless_requests_prefer_unowned_slots():
+    table = SlotAffinity(2)
+    table.release(table.acquire("a"))
+    slot = table.acquire(None)
+    table.release(slot)
+    assert table.holds("a")
+    assert table.acquire("a") != slot
+
+
+def test_prompt_cache_hit_ratio():
+    stats = PromptCacheStats()
+    stats.record({"prompt_n": 100, "cache_n": 0})
+    stats.record({"prompt_n": 20, "cache_n": 80})
+    stats.record(None)
+    assert stats.requests == 2
+    assert stats.hit_ratio == 80 / 200
+
+
+async def test_stream_pins_thread_to_slot_and_records_cache_hits(monkeypatch):
+    payloads = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/health":
+            return httpx.Response(200, json={"status": "ok"})
+        if request.url.path == "/props":
+            return httpx.Response(200, json={"total_slots": 4})
+        payload = json.loads(request.content)
+        payloads.append(payload)
+        cached = 0 if len(payloads) == 1 else 90
+        body = (
+            'data: {"choices":[{"delta":{"content":"hi"}}]}\n\n'
+            f'data: {{"choices":[],"usage":{{}},"timings":'
+            f'{{"prompt_n":{100 - cached},"cache_n":{cached}}}}}\n\n'
+            "data: [DONE]\n\n"
+        )
+        return httpx.Response(200, content=body.encode())
+
+    pipeline = LLMPipeline("http://llm", "model", httpx.MockTransport(handler))
+    await pipeline.wait_for_startup()
+    history = [{"role": "user", "content": "hello"}]
+    for key in ("thread-a", "thread-b", "thread-a"):
+        async for _ in pipeline.chat_completion_stream(history, affinity_key=key):
+            pass
+
+    assert all(payload["cache_prompt"] for payload in payloads)
+    slots = [payload["id_slot"] for payload in payloads]
+    assert slots[0] == slots[2] != slots[1]
+    stats = pipeline.prompt_cache_stats()
+    assert stats["requests"] == 3
+    assert stats["cached_tokens"] == 180
+    assert (stats["affinity_hits"], stats["affinity_misses"]) == (1, 2)
+
+    monkeypatch.setitem(inference._instances, Tier.SMALL, pipeline)
+    exposition = metrics.REGISTRY.render()
+    assert 'clyre_llm_prompt_cache_hit_ratio{tier="small"} 0.6' in exposition
+    assert 'clyre_llm_slot_affinity_total{tier="small",outcome="hits"} 1' in exposition
+    assert 'clyre_llm_slot_affinity_total{tier="small",outcome="misses"} 2' in exposition
+    await pipeline.aclose()
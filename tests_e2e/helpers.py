@@ -8,6 +8,8 @@ from typing import Any
 import httpx
 
 CHUNK_EVENTS = ("new_chunk", "new_thinking_chunk")
+# Carry their own fields rather than a chunk; they may appear between chunks.
+METADATA_EVENTS = ("queued", "context_usage", "budget_exhausted", "thread_title_update")
 
 
 def parse_line(line: str) -> dict[str, Any]:
@@ -63,6 +65,8 @@ def assert_stream_contract(events: list[dict[str, Any]]) -> str:
     assert last_pair[1] == {"chunk": None, "event": "done", "threadId": None}
 
     for event in events[1:-2]:
+        if event["event"] in METADATA_EVENTS:
+            continue
         assert event["event"] in CHUNK_EVENTS
         assert isinstance(event["chunk"], str)
         assert event["threadId"] is None
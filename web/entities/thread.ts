@@ -1,6 +1,10 @@
 export type MessageRole = 'user' | 'assistant' | 'thinking' | 'system'
 
-export type StreamingEvents = 'user_message_insert' | 'new_thinking_chunk' | 'new_chunk' | 'assistant_message_insert' | 'done' // | 'error'
+export type StreamingEvents = 'user_message_insert' | 'new_thinking_chunk' | 'new_chunk' | 'assistant_message_insert' | 'queued' | 'context_usage' | 'context_compacted' | 'budget_exhausted' | 'generation_error' | 'thread_title_update' | 'done' // | 'error'
+
+export type GenerationBudgetKind = 'reasoning' | 'length'
+
+export type GenerationErrorCode = 'backend_unavailable' | 'generation_failed'
 
 export interface ThreadMetadata {
   id: string
@@ -24,6 +28,28 @@ export interface ThreadStreamingPayload {
   chunk: string | null
   event: StreamingEvents
   threadId: string | null
+  // Only on 'queued': 1-based place in the tier's admission queue.
+  position?: number
+  // Only on 'thread_title_update': the generated title replacing the provisional one.
+  title?: string
+  // Only on 'context_usage': prompt size against the model's context window, and
+  // how many of the oldest messages were left out to fit.
+  promptTokens?: number
+  contextTokens?: number
+  omittedMessages?: number
+  // Only on 'context_compacted': how many of the oldest messages the model now sees
+  // as a summary, and the summary's size.
+  summarizedMessages?: number
+  summaryTokens?: number
+  // Only on 'budget_exhausted': 'reasoning' when thinking hit its cap and the model
+  // was switched to answering, 'length' when the answer was cut off; the cap in tokens.
+  kind?: GenerationBudgetKind
+  limitTokens?: number
+  // Only on 'generation_error': why no (complete) answer came, a user-facing message
+  // and, for 'backend_unavailable', when the model server is probed again.
+  code?: GenerationErrorCode
+  message?: string
+  retryAfterSeconds?: number | null
 }
 
 // PLAN-NOTE(fe-chat-cache): reserved for the upcoming chat-history caching layer.
@@ -67,6 +67,24 @@ export const threadRepo = {
     }
   },
 
+  // Re-attach to a thread's running generation from an event offset; never
+  // starts a new one (GET /chat/{id}/events).
+  openEventsStream (threadId: string, offset: number): ChatStreamConnection {
+    const controller = new AbortController()
+    const authStore = useAuthStore()
+    const url = `${import.meta.env.VITE_API_URL ?? '/api'}/chat/${threadId}/events?offset=${offset}`
+
+    const response = fetch(url, {
+      headers: { Authorization: `Bearer ${authStore.accessToken ?? ''}` },
+      signal: controller.signal,
+    })
+
+    return {
+      response,
+      abort: () => controller.abort(),
+    }
+  },
+
   async stopGeneration (threadId: string) {
     return await apiClient.post<{ result: 'stopping' }>('/chat/stop', { threadId })
   },
@@ -10,6 +10,7 @@
 // The orphaned `ThreadHistoryCache` interface in entities is part of this plan —
 // do not delete it while the plan is open.
 import type {
+  GenerationBudgetKind,
   ThreadHistory,
   ThreadMessage,
   ThreadMetadata,
@@ -25,6 +26,8 @@ import { logger } from '@/utils/logger.ts'
 import { readNDJSONStream } from '@/utils/stream.ts'
 
 const GENERATION_POLL_INTERVAL_MS = 1000
+// Re-attach attempts after the chat stream connection drops mid-generation.
+const STREAM_RESUME_ATTEMPTS = 3
 
 export const useThreadStore = defineStore('thread', () => {
   const threadsMeta = ref<ThreadMetadata[]>([])
@@ -34,6 +37,16 @@ export const useThreadStore = defineStore('thread', () => {
   // currentThread duplicate/roll back visible text), and the stop button
   // must target this id — not whatever thread is currently displayed.
   const activeStreamThreadId = ref<string | null>(null)
+  // Admission-queue position of the active stream while the backend holds
+  // it back for capacity; null once generation actually starts.
+  const queuePosition = ref<number | null>(null)
+  // Oldest messages of the current thread the model now sees only as a
+  // summary; set when a stream reports a fresh compaction.
+  const compactedMessages = ref<number | null>(null)
+  // Token budget the current thread's latest generation ran out of, if any.
+  const budgetExhausted = ref<GenerationBudgetKind | null>(null)
+  // User-facing reason the current thread's latest generation failed, if any.
+  const generationError = ref<string | null>(null)
 
   let streamAbort: (() => void) | null = null
   let pollTimer: ReturnType<typeof setInterval> | null = null
@@ -129,6 +142,9 @@ export const useThreadStore = defineStore('thread', () => {
 
   const clearCurrent = () => {
     currentThread.value = newThread()
+    compactedMessages.value = null
+    budgetExhausted.value = null
+    generationError.value = null
   }
 
   const deleteCurrentThread = async () => {
@@ -177,6 +193,9 @@ export const useThreadStore = defineStore('thread', () => {
       return
     }
     isGenerating.value = true
+    compactedMessages.value = null
+    budgetExhausted.value = null
+    generationError.value = null
 
     const requestThreadId = currentThread.value.id || null
     activeStreamThreadId.value = requestThreadId
@@ -205,6 +224,40 @@ export const useThreadStore = defineStore('thread', () => {
 
     const isActiveStream = () => !streamThreadId || currentThread.value.id === streamThreadId
 
+    // The run lives on the server independently of this connection: when the
+    // socket drops (or the server cuts off a lagging reader), re-attach at the
+    // number of events already consumed.
+    async function * followRun (body: ReadableStream<Uint8Array>): AsyncGenerator<ThreadStreamingPayload> {
+      let attempts = 0
+      let terminal = false
+      while (true) {
+        try {
+          for await (const payload of readNDJSONStream<ThreadStreamingPayload>(body)) {
+            terminal = payload.event === 'done'
+            yield payload
+          }
+          if (terminal) {
+            return
+          }
+          throw new Error('Chat stream ended before the generation finished')
+        } catch (error) {
+          const aborted = error instanceof DOMException && error.name === 'AbortError'
+          if (aborted || !streamThreadId || attempts >= STREAM_RESUME_ATTEMPTS) {
+            throw error
+          }
+          attempts += 1
+          logger.warn('stream_resuming', { threadId: streamThreadId, offset: consumedEvents, attempt: attempts })
+          const resumed = threadRepo.openEventsStream(streamThreadId, consumedEvents)
+          streamAbort = resumed.abort
+          const response = await resumed.response
+          if (!response.ok || !response.body) {
+            throw error
+          }
+          body = response.body
+        }
+      }
+    }
+
     try {
       const response = await connection.response
       if (!response.ok || !response.body) {
@@ -212,7 +265,7 @@ export const useThreadStore = defineStore('thread', () => {
         throw new Error(`Chat stream request failed with status ${response.status}`)
       }
 
-      for await (const payload of readNDJSONStream<ThreadStreamingPayload>(response.body)) {
+      for await (const payload of followRun(response.body)) {
         consumedEvents += 1
 
         if (payload.threadId && streamThreadId && payload.threadId !== streamThreadId) {
@@ -232,7 +285,70 @@ export const useThreadStore = defineStore('thread', () => {
             break
           }
 
+          case 'queued': {
+            queuePosition.value = payload.position ?? null
+            logger.info('stream_queued', { threadId: streamThreadId, position: payload.position })
+            break
+          }
+
+          case 'context_usage': {
+            logger.info('stream_context_usage', {
+              threadId: streamThreadId,
+              promptTokens: payload.promptTokens,
+              contextTokens: payload.contextTokens,
+              omittedMessages: payload.omittedMessages,
+            })
+            break
+          }
+
+          case 'context_compacted': {
+            if (currentThread.value.id === streamThreadId) {
+              compactedMessages.value = payload.summarizedMessages ?? null
+            }
+            logger.info('stream_context_compacted', {
+              threadId: streamThreadId,
+              summarizedMessages: payload.summarizedMessages,
+              summaryTokens: payload.summaryTokens,
+            })
+            break
+          }
+
+          case 'budget_exhausted': {
+            if (currentThread.value.id === streamThreadId) {
+              budgetExhausted.value = payload.kind ?? null
+            }
+            logger.warn('stream_budget_exhausted', {
+              threadId: streamThreadId,
+              kind: payload.kind,
+              limitTokens: payload.limitTokens,
+            })
+            break
+          }
+
+          case 'generation_error': {
+            if (currentThread.value.id === streamThreadId) {
+              generationError.value = payload.message ?? null
+            }
+            logger.error('stream_generation_error', {
+              threadId: streamThreadId,
+              code: payload.code,
+              retryAfterSeconds: payload.retryAfterSeconds,
+            })
+            break
+          }
+
+          case 'thread_title_update': {
+            const title = payload.title
+            if (title && streamThreadId) {
+              const meta = threadsMeta.value.find(thread => thread.id === streamThreadId)
+              if (meta) meta.title = title
+              if (currentThread.value.id === streamThreadId) currentThread.value.title = title
+            }
+            break
+          }
+
           case 'new_thinking_chunk': {
+            queuePosition.value = null
             if (firstTokenAt === null) {
               firstTokenAt = performance.now()
               logger.info('first_thinking_chunk', { threadId: streamThreadId, ms: Math.round(firstTokenAt - startedAt) })
@@ -245,6 +361,7 @@ export const useThreadStore = defineStore('thread', () => {
           }
 
           case 'new_chunk': {
+            queuePosition.value = null
             if (firstTokenAt === null) {
               firstTokenAt = performance.now()
               logger.info('first_content_chunk', { threadId: streamThreadId, ms: Math.round(firstTokenAt - startedAt) })
@@ -299,6 +416,7 @@ export const useThreadStore = defineStore('thread', () => {
     } finally {
       streamAbort = null
       activeStreamThreadId.value = null
+      queuePosition.value = null
       isGenerating.value = false
     }
   }
@@ -330,6 +448,10 @@ export const useThreadStore = defineStore('thread', () => {
     threadsMeta,
     isGenerating,
     activeStreamThreadId,
+    queuePosition,
+    compactedMessages,
+    budgetExhausted,
+    generationError,
     getThreadsMeta,
     clearThreadsMeta,
     currentThread,